@@ -1,5 +1,6 @@
 import argparse
 import asyncio
+import contextlib
 import datetime
 import logging
 import os
@@ -9,12 +10,28 @@ import time
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
-from bot.background_tasks import execute_jobs, handling_difference_update_chanel, send_message, update_bot_name
+from bot.background_tasks import (
+    execute_jobs,
+    handling_difference_update_chanel,
+    persist_seen_usernames,
+    refresh_seen_usernames,
+    register_push_ingestion,
+    run_channel_backfill,
+    run_send_scheduler,
+    update_bot_name,
+)
 from bot.db.base import create_db_session_pool
 from bot.db.func import RedisStorage
 from bot.db.models import Bot as UserBot
 from bot.scheduler import Scheduler
 from bot.settings import se
+from bot.utils.channel_state import channel_states
+from bot.utils.memory_session import CheckpointedMemorySession
+from bot.utils.retry_counter import remove_legacy_counters
+from bot.utils.seen_filter import seen_usernames
+from bot.utils.send_prefetch import send_prefetcher
+from bot.utils.send_queue import send_queue
+from bot.utils.user_writer import user_writer
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.ext.asyncio.session import AsyncSession
@@ -102,7 +119,9 @@ async def set_tasks(
     sessionmaker: async_sessionmaker[AsyncSession],
     storage: RedisStorage,
 ):
-    scheduler.every(1).seconds.do(
+    # В push-режиме опрос разницы нужен только для восстановления пропусков
+    poll_interval = se.worker.gap_recovery_interval if se.worker.push_ingestion else 1
+    scheduler.every(poll_interval).seconds.do(
         handling_difference_update_chanel,
         client,
         sessionmaker,
@@ -114,18 +133,24 @@ async def set_tasks(
         sessionmaker,
         storage,
     )
-    scheduler.every(1).seconds.do(
-        send_message,
+    scheduler.every(3).hours.do(
+        update_bot_name,
         client,
         sessionmaker,
         storage,
     )
-    scheduler.every(3).hours.do(
-        update_bot_name,
-        client,
+    scheduler.every(se.worker.seen_filter_refresh_interval).seconds.do(
+        refresh_seen_usernames,
         sessionmaker,
+    )
+    scheduler.every(10).minutes.do(
+        persist_seen_usernames,
         storage,
     )
+    if isinstance(client.session, CheckpointedMemorySession):
+        scheduler.every(se.worker.session_checkpoint_interval).seconds.do(
+            client.session.checkpoint_async,
+        )
 
 
 async def cache_bot_identity(
@@ -166,7 +191,12 @@ async def cache_bot_identity(
 async def init_telethon_client() -> TelegramClient | None:
     """Инициализация Telegram клиента"""
     try:
-        client = TelegramClient(bot_path_session, bot_api_id, bot_api_hash)
+        # FloodWait обрабатывает rpc-губернатор: Telethon не должен молча спать внутри запроса
+        session: str | CheckpointedMemorySession = bot_path_session
+        if se.worker.session_in_memory:
+            # Сессия живёт в памяти и сохраняется в файл по расписанию и при отключении
+            session = CheckpointedMemorySession(bot_path_session)
+        client = TelegramClient(session, bot_api_id, bot_api_hash, flood_sleep_threshold=0)
         await client.connect()
         if not await client.is_user_authorized():
             logger.info("Сессия не авторизована")
@@ -204,16 +234,37 @@ async def main() -> None:
         exit()
 
     storage = RedisStorage(redis=redis, client_hash=bot_api_hash)
+    try:
+        await remove_legacy_counters(storage)
+    except Exception as e:
+        logger.warning(f"Не удалось удалить счётчики попыток старого формата: {e}")
 
     bot_id = await cache_bot_identity(sessionmaker, storage, path_session=bot_path_session)
     if bot_id is None:
         logger.error("Останавливаем бота: нет привязки аккаунта к сессии")
         return
 
+    # Прогреваем фильтр уже известных usernames до запуска задач
+    try:
+        async with sessionmaker() as session:
+            await seen_usernames.warm(session, storage)
+    except Exception as e:
+        logger.exception(f"Не удалось прогреть фильтр usernames, работаем без него: {e}")
+
+    user_writer.start(sessionmaker, bot_id)
+    send_queue.start(sessionmaker, bot_id)
+    send_prefetcher.start(client, sessionmaker, storage)
+
     # Обновляем имя аккаунта сразу при старте, если оно пустое или изменилось.
     await update_bot_name(client, sessionmaker, storage)
 
     await set_tasks(client, sessionmaker, storage)
+    if se.worker.push_ingestion:
+        await register_push_ingestion(client, sessionmaker, storage)
+    # Отправка живёт отдельной задачей: она спит до точного момента следующей отправки
+    send_task = asyncio.create_task(run_send_scheduler(client, sessionmaker, storage))
+    # Восстановление пропусков истории тоже вне планировщика: его паузы не должны держать опрос
+    backfill_task = asyncio.create_task(run_channel_backfill(client, sessionmaker, storage))
 
     # Запуск планировщика и клиента
     try:
@@ -226,6 +277,15 @@ async def main() -> None:
     except Exception as e:
         logger.exception(f"Ошибка при запуске Клиента: {e}")
     finally:
+        for task in (send_task, backfill_task):
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        await send_prefetcher.close()
+        await send_queue.close()
+        await user_writer.close()
+        await persist_seen_usernames(storage)
+        await channel_states.flush(storage)
         await client.disconnect()  # pyright: ignore
         logger.info("Клиент отключен")
 
@@ -1,25 +1,43 @@
 import asyncio
 import contextlib
 import logging
-import math
-import random
-from typing import Any, Final, cast
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Any, Final, Literal, cast
 
 import msgpack  # type: ignore
 from bot.db.func import RedisStorage
 from bot.db.models import Bot as UserBot
-from bot.db.models import Job, JobName, UserAnalyzed, UserManager
+from bot.db.models import Job, JobName, UserAnalyzed
+from bot.settings import se
 from bot.utils.func import Function as fn  # noqa: N813
-from bot.utils.func import Status
-from sqlalchemy import select
+from bot.utils.func import ChannelDifferenceResult, Status
+from bot.utils.channel_state import ChannelState, channel_states
+from bot.utils.manager_config import ManagerConfig
+from bot.utils.poll_schedule import channel_polls
+from bot.utils.rpc_governor import rpc
+from bot.utils.seen_filter import seen_usernames
+from bot.utils.send_limiter import SendQuota, send_limiter
+from bot.utils.send_prefetch import send_prefetcher
+from bot.utils.send_queue import SendRecipient, send_queue
+from bot.utils.send_schedule import SendPacer
+from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
-from telethon import TelegramClient  # type: ignore
+from telethon import TelegramClient, events  # type: ignore
+from telethon.tl.types import PeerChannel
+from telethon.utils import get_peer_id
 
 logger = logging.getLogger(__name__)
-SECONDS_PER_MINUTE: Final[int] = 60
-SEND_MESSAGE_JOB_INTERVAL_SECONDS: Final[int] = 1  # должен совпадать с расписанием в set_tasks
-SEND_MESSAGE_COUNTER_KEY: Final[str] = "send_message:per_minute"
+OUTCOME_FLUSH_MIN_DELAY: Final[float] = 1.0  # пауза до следующей отправки, на которой успеваем записать результаты
+OUTCOME_FLUSH_MAX_ROWS: Final[int] = 50
+MIN_LIMIT_RETRY_SECONDS: Final[float] = 0.05
+BACKFILL_IDLE_SECONDS: Final[float] = 60.0
 SessionFactory = async_sessionmaker[AsyncSession]
+SendOutcome = Literal["sent", "failed", "drop"]
+MAX_PAGE_INGEST_FAILURES: Final[int] = 3
+_monitored_chat_ids: set[int] = set()
+# (канал, "pts" | "backfill") → (позиция страницы, сколько раз подряд её не удалось обработать)
+_page_failures: dict[tuple[int, str], tuple[tuple[str, Any], int]] = {}
 
 
 async def update_bot_name(
@@ -34,7 +52,7 @@ async def update_bot_name(
     if bot_id is None:
         return
 
-    me = await client.get_me()
+    me = await rpc.call("other", client.get_me)
     if not me:
         logger.warning("get_me вернул None — пропускаем обновление имени")
         return
@@ -60,66 +78,255 @@ async def update_bot_name(
         logger.info("Обновили имя аккаунта id=%s на '%s'", bot_id, new_name)
 
 
-async def send_message(
+async def persist_seen_usernames(storage: RedisStorage) -> None:
+    """Сохраняет снимок фильтра usernames, чтобы рестарт не сканировал всю таблицу."""
+    try:
+        await seen_usernames.persist(storage)
+    except Exception as exc:  # pragma: no cover - телеметрия/сеть
+        logger.warning("Не удалось сохранить снимок фильтра usernames: %s", exc)
+
+
+async def refresh_seen_usernames(sessionmaker: SessionFactory) -> None:
+    """Подтягивает в фильтр usernames, записанные другими аккаунтами."""
+    if not seen_usernames.ready:
+        return
+    try:
+        async with sessionmaker() as session:
+            loaded = await seen_usernames.refresh(session)
+    except Exception as exc:
+        logger.warning("Не удалось обновить фильтр usernames: %s", exc)
+        return
+    if loaded:
+        logger.debug("Фильтр usernames обновлён: +%s строк", loaded)
+
+
+@dataclass
+class SendOutcomes:
+    """Результаты отправок, ещё не записанные в базу."""
+
+    sent: list[SendRecipient] = field(default_factory=list)
+    dropped: list[SendRecipient] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.sent) + len(self.dropped)
+
+
+async def run_send_scheduler(
     client: Any,
     sessionmaker: SessionFactory,
     redis_storage: RedisStorage,
 ) -> None:
-    """Отправка сообщения очередному пользователю с соблюдением лимита."""
+    """
+    Долгоживущая задача отправки: спит ровно до следующего момента из SendPacer
+    вместо ежесекундного тика.
+
+    Результаты копятся и пишутся пачкой, как только до следующей отправки
+    остаётся заметная пауза: на высоких скоростях запросов к базе меньше, чем отправок.
+    """
+    pacer = SendPacer(se.worker.send_jitter)
+    outcomes = SendOutcomes()
+    try:
+        while True:
+            try:
+                delay = await _send_next(client, sessionmaker, redis_storage, pacer, outcomes)
+            except Exception as e:
+                logger.exception(f"Ошибка в планировщике отправки: {e}")
+                delay = se.worker.send_idle_interval
+            if delay is None or delay >= OUTCOME_FLUSH_MIN_DELAY or len(outcomes) >= OUTCOME_FLUSH_MAX_ROWS:
+                await _flush_send_outcomes(sessionmaker, redis_storage, outcomes)
+            if delay is None:
+                await send_queue.wait_ready(se.worker.send_idle_interval)
+            elif delay > 0:
+                await asyncio.sleep(delay)
+    finally:
+        await _flush_send_outcomes(sessionmaker, redis_storage, outcomes)
+
+
+async def _send_next(
+    client: Any,
+    sessionmaker: SessionFactory,
+    redis_storage: RedisStorage,
+    pacer: SendPacer,
+    outcomes: SendOutcomes,
+) -> float | None:
+    """Одна отправка по расписанию. Возвращает паузу до следующей попытки; None — очередь пуста."""
     async with sessionmaker() as session:
-        users_per_minute = int(await fn.get_users_per_minute(session, redis_storage, cashed=True) or 1)
-        if users_per_minute <= 0:
-            logger.warning("Некорректный лимит отправки сообщений: %s", users_per_minute)
-            users_per_minute = 1
-
-        sent_count, ttl_seconds = await _get_send_counter_state(redis_storage)
-        remaining_quota = users_per_minute - sent_count
-        if remaining_quota <= 0:
-            logger.debug("Лимит отправки сообщений за минуту исчерпан (ttl=%s)", ttl_seconds)
-            return
+        config = await fn.get_manager_config(session, redis_storage)
+        if config is None:
+            return se.worker.send_idle_interval
+        is_work = await fn.is_work(redis_storage, session)
+
+    if not is_work:
+        logger.info("Отправка сообщения остановлена")
+        return se.worker.send_idle_interval
+    bot_id = await _get_bot_id(redis_storage)
+    if bot_id is None:
+        return se.worker.send_idle_interval
+    if config.is_antiflood_mode:
+        logger.debug("Antiflood mode включен, отправка сообщений пропущена")
+        return se.worker.send_idle_interval
+
+    users_per_minute = config.users_per_minute
+    if users_per_minute <= 0:
+        logger.warning("Некорректный лимит отправки сообщений: %s", users_per_minute)
+        users_per_minute = 1
+
+    if (delay := pacer.delay(users_per_minute)) > 0:
+        return delay
+    if not len(send_queue):
+        logger.debug("Нет пользователей в очереди на отправку")
+        return None
 
-        batch_size = _calculate_batch_size(remaining_quota, ttl_seconds)
-        if not await fn.is_work(redis_storage, session):
-            logger.info("Отправка сообщения остановлена")
-            return
-        bot_id = await _get_bot_id(redis_storage)
-        if bot_id is None:
-            return
-        user_manager = await _get_user_manager(session, redis_storage)
-        if not user_manager:
-            return
-        if user_manager.is_antiflood_mode:
-            logger.debug("Antiflood mode включен, отправка сообщений пропущена")
-            return
-        users = await fn.get_closer_data_users(session, bot_id, limit=batch_size)
-        if not users:
-            logger.debug("Нет пользователей в очереди на отправку")
-            return
+    # Лимит в Redis общий для всех процессов аккаунта, расписание его не заменяет
+    reservation = await _acquire_send_slot(redis_storage, users_per_minute)
+    if reservation is None:
+        return se.worker.send_idle_interval
+    if not reservation.allowed:
+        logger.debug(
+            "Лимит отправки сообщений за минуту исчерпан (освободится через %.1f с)", reservation.reset_seconds
+        )
+        return max(reservation.reset_seconds, MIN_LIMIT_RETRY_SECONDS)
 
-        sent_any = False
-        for idx, user in enumerate(users):
-            if not await _acquire_send_slot(redis_storage, users_per_minute):
-                logger.debug("Достигнут лимит отправки сообщений за минуту")
-                break
-            ans = await fn.take_message_answer(redis_storage, session)
-            sent_ok = await _send_message(
+    users = send_queue.take(1)
+    if not users:
+        await _release_send_slot(redis_storage, reservation, users_per_minute)
+        return None
+    user = users[0]
+    outcome: SendOutcome | None = None
+    try:
+        if await send_queue.is_pending(user):
+            outcome = await _send_message(
                 client,
                 user,
-                ans,
+                config.random_answer(),
                 sessionmaker,
                 bot_id,
-                session,
                 redis_storage,
             )
-            if not sent_ok:
-                await _release_send_slot(redis_storage)
+    except BaseException:
+        # Результат неизвестен: слот возвращаем, а получателя снимаем с учёта —
+        # строка осталась в базе с sended=0, и очередь дочитает её снова
+        await _release_send_slot(redis_storage, reservation, users_per_minute)
+        send_queue.done(user)
+        raise
+    if outcome is None:
+        logger.info("Получатель %s удалён или снят с отправки, пока ждал в очереди — пропускаем", user.id)
+        await _release_send_slot(redis_storage, reservation, users_per_minute)
+        send_queue.done(user)
+        return 0.0
+    if outcome == "sent":
+        outcomes.sent.append(user)
+    else:
+        await _release_send_slot(redis_storage, reservation, users_per_minute)
+        if outcome == "drop":
+            outcomes.dropped.append(user)
+        else:
+            # Неудачные остались в базе с sended=0 — очередь дочитает их снова
+            send_queue.done(user)
+    # Шаг сетки занимает и неудачная попытка, иначе при паузе RPC очередь пролистывалась бы вхолостую
+    return pacer.record(users_per_minute)
+
+
+async def _flush_send_outcomes(
+    sessionmaker: SessionFactory,
+    redis_storage: RedisStorage,
+    outcomes: SendOutcomes,
+) -> None:
+    if not outcomes:
+        return
+    sent, dropped = outcomes.sent, outcomes.dropped
+    outcomes.sent, outcomes.dropped = [], []
+    try:
+        await _persist_send_outcomes(
+            sessionmaker,
+            sent_ids=[user.id for user in sent],
+            drop_ids=[user.id for user in dropped],
+        )
+    except BaseException as e:
+        # Получатели остаются «в полёте»: снятые с учёта строки с sended=0 очередь перечитала бы
+        # и отправила им повторно. Запись повторится при следующем сбросе
+        outcomes.sent, outcomes.dropped = sent + outcomes.sent, dropped + outcomes.dropped
+        if not isinstance(e, Exception):
+            raise
+        logger.exception(
+            "Не удалось сохранить результаты отправки (отправлено: %s, к удалению: %s), повторим: %s",
+            [user.id for user in sent],
+            [user.id for user in dropped],
+            e,
+        )
+        return
+    # Снимаем с учёта только после коммита, иначе очередь могла бы перечитать ещё не отмеченные строки
+    send_queue.done(*sent, *dropped)
+    try:
+        await fn.reset_send_attempts(redis_storage, *sent)
+    except Exception as exc:
+        logger.warning("Не удалось сбросить счётчики попыток отправки: %s", exc)
+
+
+async def _persist_send_outcomes(
+    sessionmaker: SessionFactory,
+    *,
+    sent_ids: list[int],
+    drop_ids: list[int],
+) -> None:
+    """Фиксирует результаты пачки двумя запросами: UPDATE ... IN для отправленных и DELETE ... IN."""
+    if not sent_ids and not drop_ids:
+        return
+    async with sessionmaker() as session:
+        if sent_ids:
+            await session.execute(update(UserAnalyzed).where(UserAnalyzed.id.in_(sent_ids)).values(sended=True))
+        if drop_ids:
+            await session.execute(delete(UserAnalyzed).where(UserAnalyzed.id.in_(drop_ids)))
+        await session.commit()
+    if drop_ids:
+        logger.info(f"Удалено {len(drop_ids)} получателей после 3 неудачных попыток: {drop_ids}")
+
+
+async def run_channel_backfill(
+    client: TelegramClient,
+    sessionmaker: SessionFactory,
+    redis_storage: RedisStorage,
+) -> None:
+    """
+    Долгоживущая задача восстановления пропусков истории после ChannelDifferenceTooLong.
+
+    Живёт отдельно от планировщика: паузы между страницами истории не задерживают
+    опрос каналов, execute_jobs и остальные периодические задачи.
+    """
+    while True:
+        await channel_states.wait_backfill(BACKFILL_IDLE_SECONDS)
+        states = channel_states.backfilling()
+        if not states:
+            continue
+        async with sessionmaker() as session:
+            if not await fn.is_work(redis_storage, session):
                 continue
-            sent_any = True
-            if idx < len(users) - 1:
-                await _sleep_with_jitter(batch_size)
+        for state in states:
+            try:
+                await _backfill_channel(client, state, sessionmaker, redis_storage)
+            except Exception as e:
+                logger.exception(f"Ошибка восстановления истории канала {state.channel_id}: {e}")
+        # Незавершённые каналы продолжаем на следующем проходе, дав отработать остальным задачам
+        await asyncio.sleep(se.worker.channel_backfill_page_delay)
 
-        if sent_any:
-            await session.commit()
+
+async def _backfill_channel(
+    client: TelegramClient,
+    state: ChannelState,
+    sessionmaker: SessionFactory,
+    redis_storage: RedisStorage,
+) -> None:
+    pages = fn.iter_channel_backfill(client, state, redis_storage)
+    async with contextlib.aclosing(pages):
+        async for page in pages:
+            async with sessionmaker() as session:
+                await _ingest_page(
+                    state,
+                    ("backfill", state.backfill),
+                    page,
+                    session=session,
+                    redis_storage=redis_storage,
+                )
 
 
 async def handling_difference_update_chanel(
@@ -136,46 +343,132 @@ async def handling_difference_update_chanel(
         if bot_id is None:
             logger.info("bot_id нет в redis")
             return
-        channel_ids = map(int, await fn.get_monitoring_chat(session, bot_id))
-        for channel_id in channel_ids:
-            await _process_channel_updates(
+        channel_ids = list(map(int, await fn.get_monitoring_chat(session, bot_id)))
+
+    _refresh_monitored_chat_ids(channel_ids)
+    channel_polls.retain(channel_ids)
+    channel_states.retain(channel_ids)
+
+    # Тихие каналы опрашиваются реже: берём только те, чья очередь подошла
+    due_channel_ids = channel_polls.due(channel_ids)
+    logger.debug("Каналов к опросу: %s из %s", len(due_channel_ids), len(channel_ids))
+
+    # Каналы опрашиваются параллельно, каждый в своей сессии БД
+    semaphore = asyncio.Semaphore(max(1, se.worker.channel_poll_concurrency))
+    await asyncio.gather(
+        *(
+            _poll_channel(
+                semaphore=semaphore,
                 client=client,
                 redis_storage=redis_storage,
                 sessionmaker=sessionmaker,
-                session=session,
                 bot_id=bot_id,
                 channel_id=channel_id,
             )
+            for channel_id in due_channel_ids
+        )
+    )
+
+
+async def register_push_ingestion(
+    client: TelegramClient,
+    sessionmaker: SessionFactory,
+    redis_storage: RedisStorage,
+) -> None:
+    """
+    Подписывает клиента на новые сообщения отслеживаемых каналов.
+
+    Сообщения идут в тот же конвейер, что и при опросе GetChannelDifference;
+    опрос в push-режиме остаётся только для восстановления пропусков.
+    """
+
+    async def on_new_message(event: events.NewMessage.Event) -> None:
+        if event.chat_id not in _monitored_chat_ids or not event.message.message:
+            return
+        try:
+            async with sessionmaker() as session:
+                if not await fn.is_work(redis_storage, session):
+                    return
+                users = await fn.mentioned_usernames(client, event.message, redis_storage)
+                await _ingest_messages([event.message], session=session, redis_storage=redis_storage, users=users)
+        except Exception as e:
+            logger.exception(f"Ошибка при обработке нового сообщения из {event.chat_id}: {e}")
+
+    bot_id = await _get_bot_id(redis_storage)
+    if bot_id is not None:
+        async with sessionmaker() as session:
+            _refresh_monitored_chat_ids(list(map(int, await fn.get_monitoring_chat(session, bot_id))))
+
+    client.add_event_handler(on_new_message, events.NewMessage(incoming=True))
+    logger.info("Включён push-режим получения сообщений из каналов")
+
+
+def _refresh_monitored_chat_ids(channel_ids: list[int]) -> None:
+    """Обновляет набор каналов для push-обработчика (в обоих форматах id: с -100 и без)."""
+    chat_ids: set[int] = set()
+    for channel_id in channel_ids:
+        chat_ids.add(channel_id)
+        if channel_id > 0:
+            chat_ids.add(get_peer_id(PeerChannel(channel_id)))
+    _monitored_chat_ids.clear()
+    _monitored_chat_ids.update(chat_ids)
+
+
+async def _poll_channel(
+    *,
+    semaphore: asyncio.Semaphore,
+    client: TelegramClient,
+    redis_storage: RedisStorage,
+    sessionmaker: SessionFactory,
+    bot_id: int,
+    channel_id: int,
+) -> None:
+    async with semaphore:
+        try:
+            async with sessionmaker() as session:
+                await _process_channel_updates(
+                    client=client,
+                    redis_storage=redis_storage,
+                    sessionmaker=sessionmaker,
+                    session=session,
+                    bot_id=bot_id,
+                    channel_id=channel_id,
+                )
+        except Exception as e:
+            # Ошибка одного канала не должна останавливать опрос остальных
+            channel_polls.record_error(channel_id)
+            logger.exception(f"Ошибка при обработке канала {channel_id}: {e}")
 
 
 async def _send_message(
     client: TelegramClient,
-    user: UserAnalyzed,
+    user: SendRecipient,
     ans: str,
     sessionmaker: SessionFactory,
     bot_id: int,
-    session: AsyncSession,
     redis_storage: RedisStorage,
-) -> bool:
+) -> SendOutcome:
     r = await fn.send_message_random(
         client,
         user,
         ans,
-        session=session,
+        session=None,
         redis_storage=redis_storage,
+        entity=await send_prefetcher.pop(user),
     )
     if isinstance(r, Status):
+        if r.data.get("attempts_exhausted"):
+            return "drop"
         await fn.handle_status(
             sessionmaker=sessionmaker,
             status=r,
             bot_id=int(bot_id),
         )
-        return False
+        return "failed"
     if r:
         logger.info(f"Сообщение было отправлено успешно {user.username}")
-        user.sended = True
-        return True
-    return False
+        return "sent"
+    return "failed"
 
 
 async def execute_jobs(
@@ -198,77 +491,23 @@ async def execute_jobs(
             )
         )
         for job in jobs:
-            await _process_job(job, client, session)
+            await _process_job(job, client, session, redis_storage)
         await session.commit()
 
 
-async def _get_send_counter_state(redis_storage: RedisStorage) -> tuple[int, int]:
-    """Возвращает текущее значение счётчика и TTL окна в секундах."""
-    redis_key = redis_storage.build_key(SEND_MESSAGE_COUNTER_KEY)
-    try:
-        pipe = redis_storage._redis.pipeline()  # type: ignore[attr-defined]
-        pipe.get(redis_key)
-        pipe.ttl(redis_key)
-        count_raw, ttl = await pipe.execute()
-    except Exception as exc:  # pragma: no cover - телеметрия/сеть
-        logger.warning("Не удалось получить состояние счётчика отправки: %s", exc)
-        return 0, SECONDS_PER_MINUTE
-
-    try:
-        count = int(count_raw) if count_raw is not None else 0
-    except (TypeError, ValueError):
-        count = 0
-
-    ttl_seconds = ttl if isinstance(ttl, int) and ttl > 0 else SECONDS_PER_MINUTE
-    return count, ttl_seconds
-
-
-def _calculate_batch_size(remaining_quota: int, ttl_seconds: int) -> int:
-    """Равномерно распределяет отправки на оставшееся окно."""
-    cycles_left = max(1, math.ceil(ttl_seconds / SEND_MESSAGE_JOB_INTERVAL_SECONDS))
-    return max(1, min(remaining_quota, math.ceil(remaining_quota / cycles_left)))
-
-
-async def _acquire_send_slot(redis_storage: RedisStorage, users_per_minute: int) -> bool:
-    """Резервирует слот на отправку сообщения в текущем минутном окне."""
-    redis_key = redis_storage.build_key(SEND_MESSAGE_COUNTER_KEY)
+async def _acquire_send_slot(redis_storage: RedisStorage, users_per_minute: int) -> SendQuota | None:
+    """Резервирует слот на отправку сообщения в скользящем минутном окне; None — Redis недоступен."""
     try:
-        new_value = await redis_storage._redis.incr(redis_key)  # type: ignore[attr-defined]
+        return await send_limiter.reserve(redis_storage, users_per_minute)
     except Exception as exc:  # pragma: no cover - телеметрия/сеть
-        logger.warning("Не удалось увеличить счётчик отправки сообщений: %s", exc)
-        return False
-
-    if new_value == 1:
-        await redis_storage._redis.expire(redis_key, SECONDS_PER_MINUTE)  # type: ignore[attr-defined]
-    else:
-        ttl = await redis_storage._redis.ttl(redis_key)  # type: ignore[attr-defined]
-        if ttl in (-1, -2):
-            await redis_storage._redis.expire(redis_key, SECONDS_PER_MINUTE)  # type: ignore[attr-defined]
-
-    if new_value > users_per_minute:
-        await redis_storage._redis.decr(redis_key)  # type: ignore[attr-defined]
-        return False
-    return True
+        logger.warning("Не удалось зарезервировать слот отправки сообщений: %s", exc)
+        return None
 
 
-async def _release_send_slot(redis_storage: RedisStorage) -> None:
+async def _release_send_slot(redis_storage: RedisStorage, reservation: SendQuota, users_per_minute: int) -> None:
     """Возвращает слот при неуспешной отправке."""
-    redis_key = redis_storage.build_key(SEND_MESSAGE_COUNTER_KEY)
     with contextlib.suppress(Exception):  # pragma: no cover - телеметрия/сеть
-        current_raw = await redis_storage._redis.get(redis_key)  # type: ignore[attr-defined]
-        current_value = int(current_raw) if current_raw else 0
-        if current_value > 0:
-            await redis_storage._redis.decr(redis_key)  # type: ignore[attr-defined]
-
-
-async def _sleep_with_jitter(batch_size: int) -> None:
-    """Небольшой джиттер между отправками, чтобы не слать всё в одну секунду."""
-    if batch_size <= 1:
-        return
-    max_sleep = min(1.0, SEND_MESSAGE_JOB_INTERVAL_SECONDS / max(batch_size, 1))
-    delay = random.uniform(0, max_sleep)
-    if delay > 0:
-        await asyncio.sleep(delay)
+        await send_limiter.release(redis_storage, reservation, users_per_minute)
 
 
 async def _process_channel_updates(
@@ -280,72 +519,153 @@ async def _process_channel_updates(
     bot_id: int,
     channel_id: int,
 ) -> None:
-    channel_entity = await fn.safe_get_entity(
+    # Сущность канала разрешаем только при первом опросе или после ошибки
+    state = channel_states.get(channel_id)
+    if state is None:
+        channel_entity = await fn.safe_get_entity(
+            client,
+            channel_id,
+            redis_storage=redis_storage,
+            session=session,
+            target="monitoring_chat",
+        )
+        if isinstance(channel_entity, Status):
+            channel_polls.record_error(channel_id)
+            await fn.handle_status(sessionmaker, channel_entity, bot_id, channel_id)
+            return
+
+        if not hasattr(channel_entity, "broadcast"):
+            return
+        state = channel_states.put(channel_id, channel_entity)
+
+    # Страницы разницы обрабатываются по мере получения, не дожидаясь всей выборки
+    got_messages, server_timeout = False, None
+    pages = fn.iter_difference_update_channel(
         client,
-        channel_id,
-        redis_storage=redis_storage,
-        session=session,
-        target="monitoring_chat",
+        state,
+        redis_storage,
+        max_pages=se.worker.channel_difference_max_pages,
     )
-    if isinstance(channel_entity, Status):
-        await fn.handle_status(sessionmaker, channel_entity, bot_id, channel_id)
+    async with contextlib.aclosing(pages):
+        async for page in pages:
+            server_timeout = page.timeout
+            if not page.messages:
+                continue
+            got_messages = True
+            await _ingest_page(state, ("pts", state.pts), page, session=session, redis_storage=redis_storage)
+
+    channel_polls.record(channel_id, got_messages=got_messages, server_timeout=server_timeout)
+
+
+async def _ingest_page(
+    state: ChannelState,
+    position: tuple[str, Any],
+    page: ChannelDifferenceResult,
+    *,
+    session: AsyncSession,
+    redis_storage: RedisStorage,
+) -> None:
+    """
+    Обрабатывает страницу канала. Пока страница не обработана, PTS (или прогресс восстановления)
+    не сдвигается и она приходит снова; после MAX_PAGE_INGEST_FAILURES неудач подряд на одной
+    позиции страница пропускается, иначе канал застрял бы на ней навсегда.
+    """
+    key = (state.channel_id, position[0])
+    try:
+        await _ingest_messages(page.messages, session=session, redis_storage=redis_storage, users=page.users)
+    except Exception as e:
+        failed_position, failures = _page_failures.get(key, (None, 0))
+        failures = failures + 1 if failed_position == position else 1
+        if failures < MAX_PAGE_INGEST_FAILURES:
+            _page_failures[key] = (position, failures)
+            raise
+        _page_failures.pop(key, None)
+        logger.exception(
+            f"Канал {state.channel_id}: страница на позиции {position} не обработана "
+            f"после {failures} попыток и пропущена ({len(page.messages)} сообщений): {e}"
+        )
         return
+    _page_failures.pop(key, None)
 
-    if not hasattr(channel_entity, "broadcast"):
+
+async def _ingest_messages(
+    updates: list[Any],
+    *,
+    session: AsyncSession,
+    redis_storage: RedisStorage,
+    users: Mapping[int, str] | None = None,
+) -> None:
+    """Общий конвейер для опроса и push-режима: упоминания → дедупликация → фильтр → запись."""
+    candidates = await _collect_candidates(updates, users)
+    if not candidates:
         return
 
-    updates = await fn.get_difference_update_channel(client, channel_id, redis_storage)
-    if not updates:
+    config = await fn.get_manager_config(session, redis_storage)
+    if config is None:
         return
 
-    triggers = await fn.get_keywords(session, redis_storage, cashed=True)
-    excludes = await fn.get_ignored_words(session, redis_storage, cashed=True)
-    banned_usernames = set(await fn.get_banned_usernames(session, redis_storage))
+    # Одним запросом узнаём, кто из упомянутых уже есть в базе
+    existing = await fn.get_existing_usernames({username for _, username in candidates}, session)
+    new_candidates: list[tuple[Any, str]] = []
+    for update, username in candidates:
+        if username.lower() in existing:
+            continue
+        existing.add(username.lower())
+        new_candidates.append((update, username))
+    if not new_candidates:
+        return
 
-    for update in updates:
+    decisions = await fn.is_acceptable_messages(
+        [update.message for update, _ in new_candidates],
+        config.keywords,
+        config.ignored_words,
+        matcher=config.matcher,
+        fuzzy_matcher=config.fuzzy_matcher,
+    )
+    for (update, username), decision in zip(new_candidates, decisions, strict=True):
         await _process_update(
             update=update,
+            username=username,
+            decision=decision,
             session=session,
             redis_storage=redis_storage,
-            triggers=triggers,
-            excludes=excludes,
-            banned_usernames=banned_usernames,
+            config=config,
         )
 
 
+async def _collect_candidates(updates: list[Any], users: Mapping[int, str] | None = None) -> list[tuple[Any, str]]:
+    """Достаёт из пачки сообщений пары (сообщение, @username) для дальнейшей проверки."""
+    candidates: list[tuple[Any, str]] = []
+    for update in updates:
+        if not getattr(update, "message", None):
+            continue
+        for mention in await fn.extract_mentions(update, users):
+            if mention.lower().endswith("bot"):
+                continue
+            candidates.append((update, f"@{mention}"))
+    return candidates
+
+
 async def _process_update(
     *,
     update: Any,
+    username: str,
+    decision: tuple[bool, list[str], list[str]],
     session: AsyncSession,
     redis_storage: RedisStorage,
-    triggers: set[str],
-    excludes: set[str],
-    banned_usernames: set[str],
+    config: ManagerConfig,
 ) -> None:
-    msg_text = update.message
-    if not msg_text:
-        return
-
-    is_acceptable, ignores, triggers_found = await fn.is_acceptable_message(msg_text, triggers, excludes)
-    mention = await fn.parse_mention(update.message)
-
-    if not mention or mention.endswith("bot"):
-        return
-
-    username = f"@{mention}"
+    is_acceptable, ignores, triggers_found = decision
 
     banned_username = None
-    if username in banned_usernames:
+    if username in config.banned_usernames:
         banned_username = username
 
-    if await fn.user_exist(username, session):
-        return
-
     data_for_decision = _build_decision_data(
         is_acceptable=is_acceptable,
         ignores=ignores,
         triggers=triggers_found,
-        mention=mention,
+        mention=username[1:],
         banned_username=banned_username,
     )
 
@@ -382,6 +702,7 @@ async def _process_job(
     job: Job,
     client: TelegramClient,
     session: AsyncSession,
+    redis_storage: RedisStorage,
 ) -> None:
     match job.task:
         case JobName.get_folders.value:
@@ -390,10 +711,10 @@ async def _process_job(
         case JobName.processed_users.value:
             task_metadata = job.task_metadata or b""
             task_data = msgpack.unpackb(task_metadata) if task_metadata else {}
-            result = await fn.get_processed_users(client, task_data)
+            result = await fn.get_processed_users(client, task_data, redis_storage)
             job.answer = cast(int, msgpack.packb(result))
         case JobName.get_chat_title.value:
-            await fn.update_chat_title(client, session, job.bot_id)
+            await fn.update_chat_title(client, session, job.bot_id, redis_storage)
             await session.delete(job)
         case JobName.get_me_name.value:
             await fn.update_me_name(client, session, job.bot_id)
@@ -410,18 +731,3 @@ async def _get_bot_id(storage: RedisStorage) -> int | None:
     except (TypeError, ValueError):
         logger.warning("Не удалось определить bot_id (raw=%s)", bot_id_raw)
         return None
-
-
-async def _get_user_manager(session: AsyncSession, redis_storage: RedisStorage) -> UserManager | None:
-    user_manager_id = await redis_storage.get("user_manager_id")
-    try:
-        user_manager_id_int = int(user_manager_id)
-    except (TypeError, ValueError):
-        logger.warning("Некорректный user_manager_id в Redis: %s", user_manager_id)
-        return None
-
-    user_manager = await session.scalar(select(UserManager).where(UserManager.id == user_manager_id_int))
-    if not user_manager:
-        logger.info("User manager id=%s не найден в базе данных", user_manager_id_int)
-        return None
-    return user_manager
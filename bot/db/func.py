@@ -2,6 +2,7 @@ from typing import Any
 
 import msgspec
 from redis.asyncio import Redis
+from redis.commands.core import AsyncScript
 
 
 class RedisStorage:
@@ -14,6 +15,11 @@ class RedisStorage:
     def build_key(self, key: str) -> str:
         return f"wb_userbot:{self._client_hash}:{key}"
 
+    @staticmethod
+    def build_shared_key(key: str) -> str:
+        """Ключ, общий для всех аккаунтов (без привязки к client_hash)."""
+        return f"wb_userbot:shared:{key}"
+
     async def get(self, key: Any) -> Any | None:
         """
         Извлекает данные из Redis и десериализует их с использованием msgspec.
@@ -26,6 +32,27 @@ class RedisStorage:
         data = await self._redis.get(self.build_key(key))
         return self.decoder.decode(data) if data else None
 
+    async def get_shared(self, key: Any) -> Any | None:
+        """Как get, но читает из общего для всех аккаунтов пространства ключей."""
+        if not self._redis:
+            return None
+        data = await self._redis.get(self.build_shared_key(key))
+        return self.decoder.decode(data) if data else None
+
+    async def set_shared(self, key: Any, value: Any, **kwargs) -> None:
+        """Как set, но пишет в общее для всех аккаунтов пространство ключей."""
+        await self._redis.set(self.build_shared_key(key), self.encoder.encode(value), **kwargs)
+
+    async def get_shared_raw(self, key: Any) -> bytes | None:
+        """Читает сырые байты из общего пространства ключей (без msgspec)."""
+        if not self._redis:
+            return None
+        return await self._redis.get(self.build_shared_key(key))
+
+    async def set_shared_raw(self, key: Any, value: bytes, **kwargs) -> None:
+        """Сохраняет сырые байты в общее пространство ключей (без msgspec)."""
+        await self._redis.set(self.build_shared_key(key), value, **kwargs)
+
     async def set(self, key: Any, value: Any, **kwargs) -> None:
         """
         Сохраняет данные в Redis с использованием msgspec для сериализации.
@@ -43,5 +70,26 @@ class RedisStorage:
             options.setdefault("ex", ttl)
         await self.set(key, value, **options)
 
+    def register_script(self, script: str) -> AsyncScript:
+        """Регистрирует Lua-скрипт (EVALSHA с автоматическим EVAL при NOSCRIPT)."""
+        return self._redis.register_script(script)
+
     async def delete(self, *keys: Any) -> None:
         await self._redis.delete(*map(self.build_key, keys))
+
+    async def unlink_matching(self, pattern: str, batch_size: int = 500) -> int:
+        """
+        Удаляет ключи аккаунта по glob-шаблону: SCAN и UNLINK пачками, без блокирующего KEYS.
+
+        :return: Число удалённых ключей.
+        """
+        removed = 0
+        batch: list[Any] = []
+        async for key in self._redis.scan_iter(match=self.build_key(pattern), count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                removed += await self._redis.unlink(*batch)
+                batch.clear()
+        if batch:
+            removed += await self._redis.unlink(*batch)
+        return removed
@@ -23,11 +23,66 @@ class DBSettings:
         self.password = os.environ.get(f"{_env_prefix}PASSWORD", "password")
 
 
+class RpcLimitSettings:
+    def __init__(self, _env_prefix: str, rate: float, burst: int) -> None:
+        self.rate = float(os.environ.get(f"{_env_prefix}RATE", rate))
+        self.burst = int(os.environ.get(f"{_env_prefix}BURST", burst))
+
+
+class WorkerSettings:
+    def __init__(self) -> None:
+        self.manager_config_max_age = int(os.environ.get("MANAGER_CONFIG_MAX_AGE", 60))
+        self.push_ingestion = os.environ.get("PUSH_INGESTION", "0") in ("1", "true", "True")
+        self.gap_recovery_interval = int(os.environ.get("GAP_RECOVERY_INTERVAL", 60))
+        self.channel_poll_min_interval = float(os.environ.get("CHANNEL_POLL_MIN_INTERVAL", 1))
+        self.channel_poll_max_interval = float(os.environ.get("CHANNEL_POLL_MAX_INTERVAL", 60))
+        self.channel_poll_backoff = float(os.environ.get("CHANNEL_POLL_BACKOFF", 2))
+        self.channel_difference_max_pages = int(os.environ.get("CHANNEL_DIFFERENCE_MAX_PAGES", 10))
+        self.channel_backfill_pages_per_poll = int(os.environ.get("CHANNEL_BACKFILL_PAGES_PER_POLL", 5))
+        self.channel_backfill_page_delay = float(os.environ.get("CHANNEL_BACKFILL_PAGE_DELAY", 1))
+        self.channel_poll_concurrency = int(os.environ.get("CHANNEL_POLL_CONCURRENCY", 10))
+        self.fuzzy_matching = os.environ.get("FUZZY_MATCHING", "0") in ("1", "true", "True")
+        self.fuzzy_score_cutoff = float(os.environ.get("FUZZY_SCORE_CUTOFF", 85))
+        self.fuzzy_min_keyword_length = int(os.environ.get("FUZZY_MIN_KEYWORD_LENGTH", 5))
+        self.entity_cache_ttl = int(os.environ.get("ENTITY_CACHE_TTL", 24 * 60 * 60))
+        self.entity_missing_ttl = int(os.environ.get("ENTITY_MISSING_TTL", 60 * 60))
+        self.entity_cache_memory_size = int(os.environ.get("ENTITY_CACHE_MEMORY_SIZE", 10_000))
+        self.dialogs_refresh_min_interval = float(os.environ.get("DIALOGS_REFRESH_MIN_INTERVAL", 30))
+        self.seen_filter_capacity = int(os.environ.get("SEEN_FILTER_CAPACITY", 2_000_000))
+        self.seen_filter_error_rate = float(os.environ.get("SEEN_FILTER_ERROR_RATE", 0.01))
+        self.seen_filter_refresh_interval = float(os.environ.get("SEEN_FILTER_REFRESH_INTERVAL", 5))
+        # Сколько секунд строка может коммититься после выдачи ей id (параллельные вставки аккаунтов)
+        self.seen_filter_commit_lag = float(os.environ.get("SEEN_FILTER_COMMIT_LAG", 60))
+        self.user_writer_max_rows = int(os.environ.get("USER_WRITER_MAX_ROWS", 100))
+        self.user_writer_max_delay_ms = int(os.environ.get("USER_WRITER_MAX_DELAY_MS", 500))
+        self.seen_filter_persist = os.environ.get("SEEN_FILTER_PERSIST", "1") not in ("0", "false", "False")
+        self.send_queue_window = int(os.environ.get("SEND_QUEUE_WINDOW", 50))
+        self.send_queue_low_water = int(os.environ.get("SEND_QUEUE_LOW_WATER", 10))
+        self.send_queue_idle_refresh = float(os.environ.get("SEND_QUEUE_IDLE_REFRESH", 30))
+        self.send_prefetch_ahead = int(os.environ.get("SEND_PREFETCH_AHEAD", 10))
+        # Доля шага между отправками, на которую момент отправки может сдвинуться случайно
+        self.send_jitter = float(os.environ.get("SEND_JITTER", 0.3))
+        self.send_idle_interval = float(os.environ.get("SEND_IDLE_INTERVAL", 5))
+        self.session_in_memory = os.environ.get("SESSION_IN_MEMORY", "0") in ("1", "true", "True")
+        self.session_checkpoint_interval = int(os.environ.get("SESSION_CHECKPOINT_INTERVAL", 60))
+        # Запросов в секунду и размер всплеска для каждого семейства RPC
+        self.rpc_limits = {
+            "resolve": RpcLimitSettings("RPC_RESOLVE_", rate=1, burst=5),
+            "history": RpcLimitSettings("RPC_HISTORY_", rate=10, burst=20),
+            "send": RpcLimitSettings("RPC_SEND_", rate=1, burst=3),
+            "forward": RpcLimitSettings("RPC_FORWARD_", rate=1, burst=3),
+            "other": RpcLimitSettings("RPC_OTHER_", rate=2, burst=5),
+        }
+        self.rpc_max_queue_wait = float(os.environ.get("RPC_MAX_QUEUE_WAIT", 30))
+        self.retry_attempts_ttl = int(os.environ.get("RETRY_ATTEMPTS_TTL", 7 * 24 * 60 * 60))
+
+
 class Settings:
     bot_token = os.environ.get("BOT_TOKEN", "")
 
     db: DBSettings = DBSettings()
     redis: RedisSettings = RedisSettings()
+    worker: WorkerSettings = WorkerSettings()
 
     def mysql_dsn(self) -> URL:
         return URL.create(
@@ -0,0 +1,163 @@
+import asyncio
+import contextlib
+import logging
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass
+from typing import Any, Final
+
+from bot.db.func import RedisStorage
+from telethon.tl.types import InputChannel
+
+logger = logging.getLogger(__name__)
+LAST_MESSAGE_KEY_PREFIX: Final[str] = "channel_last_message"
+BACKFILL_KEY_PREFIX: Final[str] = "channel_backfill"
+
+
+@dataclass(frozen=True)
+class BackfillProgress:
+    # Последний id, обработанный до пропуска: история читается до него (не включая)
+    min_id: int
+    # Самый старый уже обработанный id пропуска; 0 — начинать с самого нового сообщения
+    offset_id: int = 0
+
+
+@dataclass
+class ChannelState:
+    channel_id: int
+    input_channel: InputChannel
+    broadcast: bool
+    pts: int | None = None
+    last_message_id: int = 0
+    backfill: BackfillProgress | None = None
+    pts_loaded: bool = False
+
+    @property
+    def access_hash(self) -> int:
+        return self.input_channel.access_hash
+
+
+class ChannelStateRegistry:
+    """
+    Состояние отслеживаемых каналов в памяти: InputChannel с access_hash и текущий PTS.
+
+    Сущность канала разрешается один раз и переразрешается только после ошибки,
+    PTS читается из Redis при первом опросе, а новые значения пишутся обратно
+    в фоне — опрос канала сводится к одному GetChannelDifferenceRequest.
+    Там же хранятся последний обработанный id сообщения и прогресс восстановления
+    пропуска после ChannelDifferenceTooLong.
+    """
+
+    def __init__(self) -> None:
+        self._states: dict[int, ChannelState] = {}
+        # Ключ Redis → значение (None — удалить ключ), пишутся фоновой задачей
+        self._dirty: dict[Any, Any] = {}
+        self._writer: asyncio.Task[None] | None = None
+        # Появился канал с незавершённым восстановлением — будит фоновую задачу восстановления
+        self._backfill_pending = asyncio.Event()
+
+    def get(self, channel_id: int) -> ChannelState | None:
+        return self._states.get(channel_id)
+
+    def put(self, channel_id: int, entity: Any) -> ChannelState:
+        previous = self._states.get(channel_id)
+        state = ChannelState(
+            channel_id=channel_id,
+            input_channel=InputChannel(entity.id, entity.access_hash),
+            broadcast=bool(getattr(entity, "broadcast", False)),
+        )
+        if previous is not None:
+            # Переразрешение сущности не должно сбрасывать уже известный PTS и прогресс
+            state.pts, state.pts_loaded = previous.pts, previous.pts_loaded
+            state.last_message_id, state.backfill = previous.last_message_id, previous.backfill
+        self._states[channel_id] = state
+        return state
+
+    def invalidate(self, channel_id: int) -> None:
+        self._states.pop(channel_id, None)
+
+    def retain(self, channel_ids: Iterable[int]) -> None:
+        """Забывает каналы, которые больше не отслеживаются."""
+        keep = set(channel_ids)
+        for channel_id in list(self._states):
+            if channel_id not in keep:
+                del self._states[channel_id]
+
+    async def load_pts(self, redis_storage: RedisStorage, state: ChannelState) -> int | None:
+        """PTS канала: из памяти, а при первом обращении — из Redis вместе с прогрессом восстановления."""
+        if not state.pts_loaded:
+            channel_id = state.channel_id
+            raw_pts = await redis_storage.get(channel_id)
+            raw_last_id = await redis_storage.get(f"{LAST_MESSAGE_KEY_PREFIX}:{channel_id}")
+            raw_backfill = await redis_storage.get(f"{BACKFILL_KEY_PREFIX}:{channel_id}")
+            state.pts = int(raw_pts) if raw_pts else None
+            state.last_message_id = max(state.last_message_id, int(raw_last_id or 0))
+            if raw_backfill and state.backfill is None:
+                try:
+                    state.backfill = BackfillProgress(**raw_backfill)
+                    self._backfill_pending.set()
+                except TypeError:
+                    logger.warning("Повреждён прогресс восстановления канала %s — пропускаем", channel_id)
+            state.pts_loaded = True
+        return state.pts
+
+    def set_pts(self, redis_storage: RedisStorage, state: ChannelState, pts: int) -> None:
+        """Обновляет PTS в памяти и ставит запись в Redis в фоновую очередь."""
+        state.pts, state.pts_loaded = pts, True
+        self._schedule(redis_storage, state.channel_id, pts)
+
+    def note_messages(self, redis_storage: RedisStorage, state: ChannelState, messages: Iterable[Any]) -> None:
+        """Запоминает самый новый обработанный id — от него считается пропуск при ChannelDifferenceTooLong."""
+        last_id = max((getattr(message, "id", 0) or 0 for message in messages), default=0)
+        if last_id > state.last_message_id:
+            state.last_message_id = last_id
+            self._schedule(redis_storage, f"{LAST_MESSAGE_KEY_PREFIX}:{state.channel_id}", last_id)
+
+    def set_backfill(self, redis_storage: RedisStorage, state: ChannelState, progress: BackfillProgress | None) -> None:
+        state.backfill = progress
+        value = asdict(progress) if progress is not None else None
+        self._schedule(redis_storage, f"{BACKFILL_KEY_PREFIX}:{state.channel_id}", value)
+        if progress is not None:
+            self._backfill_pending.set()
+
+    def backfilling(self) -> list[ChannelState]:
+        """Каналы, у которых пропуск истории ещё не восстановлен."""
+        return [state for state in self._states.values() if state.backfill is not None]
+
+    async def wait_backfill(self, timeout: float) -> None:
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._backfill_pending.wait(), timeout=timeout)
+        self._backfill_pending.clear()
+
+    async def flush(self, redis_storage: RedisStorage) -> None:
+        if self._writer is not None:
+            with contextlib.suppress(Exception):
+                await self._writer
+            self._writer = None
+        await self._write_dirty(redis_storage)
+
+    def _schedule(self, redis_storage: RedisStorage, key: Any, value: Any) -> None:
+        # Ключ переносится в конец: запись идёт в порядке последних изменений,
+        # поэтому прогресс восстановления попадает в Redis раньше нового PTS
+        self._dirty.pop(key, None)
+        self._dirty[key] = value
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_dirty(redis_storage))
+
+    async def _write_dirty(self, redis_storage: RedisStorage) -> None:
+        while self._dirty:
+            key = next(iter(self._dirty))
+            value = self._dirty.pop(key)
+            try:
+                if value is None:
+                    await redis_storage.delete(key)
+                else:
+                    await redis_storage.save(key, value)
+            except Exception as exc:
+                # Возвращаем в начало очереди, если пока шла запись не появилось более свежее значение
+                if key not in self._dirty:
+                    self._dirty = {key: value, **self._dirty}
+                logger.warning("Не удалось сохранить состояние канала %s=%s: %s", key, value, exc)
+                return
+
+
+channel_states = ChannelStateRegistry()
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, replace
+
+from bot.settings import se
+from bot.utils.rpc_governor import rpc
+from telethon import TelegramClient
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DialogsRefreshStats:
+    refreshes: int = 0
+    coalesced: int = 0
+    skipped: int = 0
+    pending_waiters: int = 0
+    last_refresh_seconds: float = 0.0
+    total_refresh_seconds: float = 0.0
+
+
+class DialogsRefresher:
+    """
+    Single-flight обновление кэша диалогов (get_dialogs + catch_up).
+
+    Одновременные промахи кэша ждут одно и то же обновление, а повторное
+    обновление раньше min_interval после предыдущего не запускается.
+    """
+
+    def __init__(self, min_interval: float) -> None:
+        self._min_interval = min_interval
+        self._task: asyncio.Task[None] | None = None
+        self._finished_at: float | None = None
+        self._stats = DialogsRefreshStats()
+
+    @property
+    def stats(self) -> DialogsRefreshStats:
+        return replace(self._stats)
+
+    async def refresh(self, client: TelegramClient) -> bool:
+        """Возвращает True, если вызов дождался обновления (своего или чужого)."""
+        if self._task is None or self._task.done():
+            if self._finished_at is not None and time.monotonic() - self._finished_at < self._min_interval:
+                self._stats.skipped += 1
+                logger.debug("Диалоги обновлялись недавно — пропускаем обновление")
+                return False
+            self._task = asyncio.create_task(self._run(client))
+        else:
+            self._stats.coalesced += 1
+
+        self._stats.pending_waiters += 1
+        try:
+            await asyncio.shield(self._task)
+        finally:
+            self._stats.pending_waiters -= 1
+        return True
+
+    async def _run(self, client: TelegramClient) -> None:
+        started = time.perf_counter()
+        try:
+            await rpc.call("resolve", client.get_dialogs)
+            await rpc.call("other", client.catch_up)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._finished_at = time.monotonic()
+            self._stats.refreshes += 1
+            self._stats.last_refresh_seconds = elapsed
+            self._stats.total_refresh_seconds += elapsed
+            logger.info(
+                "Кэш диалогов обновлён за %.2f с (ожидающих: %s)",
+                elapsed,
+                self._stats.pending_waiters,
+            )
+
+
+dialogs_refresher = DialogsRefresher(min_interval=se.worker.dialogs_refresh_min_interval)
@@ -0,0 +1,213 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Final, Literal
+
+from bot.db.func import RedisStorage
+from bot.settings import se
+from telethon.hints import Entity, EntityLike
+from telethon.tl.types import Channel, ChatPhotoEmpty, User
+from telethon.utils import get_peer_id
+
+logger = logging.getLogger(__name__)
+ENTITY_KEY_PREFIX: Final[str] = "entity"
+MISSING_KEY_PREFIX: Final[str] = "entity_missing"
+TME_PREFIXES: Final[tuple[str, ...]] = ("https://t.me/", "http://t.me/", "t.me/")
+
+
+@dataclass(frozen=True)
+class CachedEntity:
+    id: int
+    access_hash: int
+    type: Literal["user", "channel"]
+    username: str | None = None
+    title: str | None = None
+    first_name: str | None = None
+    last_name: str | None = None
+    phone: str | None = None
+    broadcast: bool = False
+    megagroup: bool = False
+
+    @classmethod
+    def from_entity(cls, entity: Any) -> "CachedEntity | None":
+        access_hash = getattr(entity, "access_hash", None)
+        # min-сущности несут неполный access_hash — такие не кэшируем
+        if access_hash is None or getattr(entity, "min", False):
+            return None
+        if isinstance(entity, User):
+            return cls(
+                id=entity.id,
+                access_hash=access_hash,
+                type="user",
+                username=entity.username,
+                first_name=entity.first_name,
+                last_name=entity.last_name,
+                phone=entity.phone,
+            )
+        if isinstance(entity, Channel):
+            return cls(
+                id=entity.id,
+                access_hash=access_hash,
+                type="channel",
+                username=entity.username,
+                title=entity.title,
+                broadcast=bool(entity.broadcast),
+                megagroup=bool(entity.megagroup),
+            )
+        return None
+
+    def to_entity(self) -> Entity:
+        """Собирает Telethon-сущность, пригодную и для чтения полей, и как peer в запросах."""
+        if self.type == "user":
+            return User(
+                id=self.id,
+                access_hash=self.access_hash,
+                username=self.username,
+                first_name=self.first_name,
+                last_name=self.last_name,
+                phone=self.phone,
+            )
+        return Channel(
+            id=self.id,
+            title=self.title or "",
+            photo=ChatPhotoEmpty(),
+            date=None,
+            broadcast=self.broadcast,
+            megagroup=self.megagroup,
+            access_hash=self.access_hash,
+            username=self.username,
+        )
+
+
+def normalize_peer(peer_id: EntityLike) -> str | None:
+    """Ключ кэша для username/ссылки или числового id; для прочих peer — None."""
+    if isinstance(peer_id, bool):
+        return None
+    if isinstance(peer_id, int):
+        return str(peer_id)
+    if not isinstance(peer_id, str):
+        return None
+    value = peer_id.strip()
+    for prefix in TME_PREFIXES:
+        if value.lower().startswith(prefix):
+            value = value[len(prefix) :]
+            break
+    value = value.lstrip("@").lower()
+    if value.lstrip("-").isdigit():
+        return str(int(value))
+    return value or None
+
+
+def _is_username(key: str) -> bool:
+    return not key.lstrip("-").isdigit()
+
+
+class EntityCache:
+    """
+    Кэш разрешённых сущностей Telegram (id, access_hash, тип, название) в Redis с TTL.
+
+    access_hash в Telegram выдаётся конкретному аккаунту, поэтому положительные записи
+    хранятся в пространстве ключей аккаунта. Общими для всех аккаунтов сделаны
+    отрицательные записи: username, который не разрешился у одного аккаунта,
+    другие не запрашивают до истечения missing_ttl.
+
+    Перед Redis стоит LRU в памяти не больше memory_size ключей: разрешённые за жизнь
+    процесса usernames не копятся в нём бесконечно.
+    """
+
+    def __init__(self, ttl: int, missing_ttl: int, memory_size: int) -> None:
+        self._ttl = ttl
+        self._missing_ttl = missing_ttl
+        self._memory_size = max(1, memory_size)
+        self._memory: OrderedDict[str, tuple[float, CachedEntity]] = OrderedDict()
+
+    async def get(self, redis_storage: RedisStorage | None, peer_id: EntityLike) -> CachedEntity | None:
+        key = normalize_peer(peer_id)
+        if key is None:
+            return None
+
+        now = time.monotonic()
+        if (hit := self._memory.get(key)) is not None:
+            if hit[0] > now:
+                self._memory.move_to_end(key)
+                return hit[1]
+            del self._memory[key]
+
+        if redis_storage is None:
+            return None
+        try:
+            raw = await redis_storage.get(f"{ENTITY_KEY_PREFIX}:{key}")
+        except Exception as exc:  # pragma: no cover - телеметрия/сеть
+            logger.warning("Не удалось прочитать кэш сущности %s: %s", key, exc)
+            return None
+        if not raw:
+            return None
+
+        try:
+            cached = CachedEntity(**raw)
+        except TypeError:
+            return None
+        self._remember(key, now + self._ttl, cached)
+        return cached
+
+    async def put(self, redis_storage: RedisStorage | None, peer_id: EntityLike, entity: Any) -> None:
+        cached = CachedEntity.from_entity(entity)
+        if cached is None:
+            return
+
+        keys = {normalize_peer(peer_id), str(get_peer_id(entity))}
+        if cached.username:
+            keys.add(cached.username.lower())
+        payload = asdict(cached)
+        expires_at = time.monotonic() + self._ttl
+        for key in filter(None, keys):
+            self._remember(key, expires_at, cached)
+            if redis_storage is not None:
+                try:
+                    await redis_storage.save(f"{ENTITY_KEY_PREFIX}:{key}", payload, self._ttl)
+                except Exception as exc:  # pragma: no cover - телеметрия/сеть
+                    logger.warning("Не удалось сохранить кэш сущности %s: %s", key, exc)
+
+    def _remember(self, key: str, expires_at: float, cached: CachedEntity) -> None:
+        self._memory[key] = (expires_at, cached)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_size:
+            self._memory.popitem(last=False)
+
+    async def forget(self, redis_storage: RedisStorage | None, peer_id: EntityLike) -> None:
+        key = normalize_peer(peer_id)
+        if key is None:
+            return
+        self._memory.pop(key, None)
+        if redis_storage is not None:
+            try:
+                await redis_storage.delete(f"{ENTITY_KEY_PREFIX}:{key}")
+            except Exception as exc:  # pragma: no cover - телеметрия/сеть
+                logger.warning("Не удалось удалить кэш сущности %s: %s", key, exc)
+
+    async def is_missing(self, redis_storage: RedisStorage | None, peer_id: EntityLike) -> bool:
+        key = normalize_peer(peer_id)
+        if redis_storage is None or key is None or not _is_username(key):
+            return False
+        try:
+            return bool(await redis_storage.get_shared(f"{MISSING_KEY_PREFIX}:{key}"))
+        except Exception as exc:  # pragma: no cover - телеметрия/сеть
+            logger.warning("Не удалось прочитать отрицательный кэш %s: %s", key, exc)
+            return False
+
+    async def mark_missing(self, redis_storage: RedisStorage | None, peer_id: EntityLike) -> None:
+        key = normalize_peer(peer_id)
+        if redis_storage is None or key is None or not _is_username(key):
+            return
+        try:
+            await redis_storage.set_shared(f"{MISSING_KEY_PREFIX}:{key}", 1, ex=self._missing_ttl)
+        except Exception as exc:  # pragma: no cover - телеметрия/сеть
+            logger.warning("Не удалось сохранить отрицательный кэш %s: %s", key, exc)
+
+
+entity_cache = EntityCache(
+    ttl=se.worker.entity_cache_ttl,
+    missing_ttl=se.worker.entity_missing_ttl,
+    memory_size=se.worker.entity_cache_memory_size,
+)
@@ -1,42 +1,72 @@
+import asyncio
 import contextlib
 import logging
 import random
 import re
+from collections.abc import AsyncIterator, Collection, Iterable, Mapping, Sequence
 from dataclasses import dataclass, field
 from typing import Any, Literal, cast
 
 import msgpack
 from bot.db.func import RedisStorage
 from bot.db.models import (
-    BannedUser,
     Bot,
-    IgnoredWord,
     Job,
-    KeyWord,
-    MessageToAnswer,
     MonitoringChat,
     UserAnalyzed,
-    UserManager,
 )
-from sqlalchemy import and_, select
+from bot.settings import se
+from bot.utils.channel_state import BackfillProgress, ChannelState, channel_states
+from bot.utils.dialogs import dialogs_refresher
+from bot.utils.entity_cache import entity_cache
+from bot.utils.fuzzy import FuzzyKeywordMatcher
+from bot.utils.manager_config import ManagerConfig, manager_configs
+from bot.utils.matcher import KeywordMatcher, get_keyword_matcher
+from bot.utils.retry_counter import entity_attempts, send_attempts
+from bot.utils.rpc_governor import rpc
+from bot.utils.seen_filter import seen_usernames
+from bot.utils.send_queue import SendRecipient, send_queue
+from bot.utils.user_writer import user_writer
+from sqlalchemy import and_, case, delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from telethon import TelegramClient, events, functions
 from telethon.errors import ChannelPrivateError, FloodWaitError, UsernameInvalidError
+from telethon.helpers import add_surrogate, del_surrogate
 from telethon.hints import Entity, EntityLike
-from telethon.tl.functions.channels import GetFullChannelRequest
+from telethon.tl.functions.channels import GetChannelsRequest, GetFullChannelRequest
 from telethon.tl.functions.messages import GetHistoryRequest
 from telethon.tl.functions.updates import GetChannelDifferenceRequest
+from telethon.tl.functions.users import GetUsersRequest
 from telethon.tl.types import (
+    Channel,
     ChannelMessagesFilter,
     DialogFilter,
     InputChannel,
+    InputPeerChannel,
+    InputPeerUser,
+    InputUser,
     Message,
+    MessageEntityMention,
+    MessageEntityMentionName,
+    MessageEntityTextUrl,
+    MessageEntityUrl,
     MessageRange,
+    User,
 )
 from telethon.tl.types.updates import ChannelDifferenceEmpty, ChannelDifferenceTooLong
+from telethon.utils import resolve_id
 
 logger = logging.getLogger(__name__)
 MAX_MESSAGE_ID = 2**31 - 1  # Max for Telegram message id (32-bit signed int)
+GET_USERS_BATCH_SIZE = 100  # users.GetUsers принимает до ~200 id, берём с запасом
+GET_CHANNELS_BATCH_SIZE = 100
+MENTION_RE = re.compile(r"@[A-Za-z0-9_]{5,32}\b")
+USERNAME_RE = re.compile(r"[A-Za-z0-9_]{5,32}")
+# t.me/username, но не служебные пути и не ссылки на посты (t.me/channel/123)
+TME_LINK_RE = re.compile(
+    r"(?:https?://)?(?:www\.)?(?:t|telegram)\.me/(?!joinchat\b|addstickers\b|share\b)([A-Za-z0-9_]{5,32})\b(?!/)",
+    re.IGNORECASE,
+)
 
 
 @dataclass
@@ -46,6 +76,17 @@ class Status:
     data: dict[str, Any] = field(default_factory=dict)
 
 
+@dataclass
+class ChannelDifferenceResult:
+    messages: list[Message] = field(default_factory=list)
+    # username авторов/упомянутых из difference.users — для MessageEntityMentionName
+    users: dict[int, str] = field(default_factory=dict)
+    # Подсказка сервера: через сколько секунд имеет смысл опрашивать канал снова
+    timeout: int | None = None
+    # False — на сервере остались непрочитанные страницы разницы
+    final: bool = True
+
+
 class Function:
     @staticmethod
     async def _create_user_record(
@@ -58,6 +99,16 @@ class Function:
         message: str,
         data_for_decision: dict[str, Any] | None,
     ) -> None:
+        if user_writer.running:
+            await user_writer.add(
+                username=username,
+                message_id=message_id,
+                chat_id=chat_id,
+                message=message,
+                data_for_decision=data_for_decision,
+            )
+            return
+
         bot_id = await redis_storage.get("bot_id")
         user = UserAnalyzed(
             username=username,
@@ -72,15 +123,9 @@ class Function:
 
         session.add(user)
         await session.commit()
-
-    @staticmethod
-    async def _get_manager_id(redis_storage: RedisStorage) -> int | None:
-        manager_raw = await redis_storage.get("user_manager_id")
-        try:
-            return int(manager_raw)
-        except (TypeError, ValueError):
-            logger.warning("Некорректный user_manager_id в Redis: %s", manager_raw)
-            return None
+        seen_usernames.add(username)
+        if not data_for_decision:
+            send_queue.notify()
 
     @staticmethod
     async def get_closer_data_user(session: AsyncSession, bot_id: int) -> UserAnalyzed | None:
@@ -123,37 +168,51 @@ class Function:
     @staticmethod
     async def send_message_two(
         client: TelegramClient,
-        user: UserAnalyzed,
-        id_user: int,
+        user: SendRecipient,
+        peer: EntityLike,
         ans: str,
     ) -> None:
-        await client.send_message(entity=id_user, message=ans)
-        await client.forward_messages(
-            entity=id_user,
-            messages=int(user.message_id),
-            from_peer=int(user.chat_id),
-        )
+        await rpc.call("send", client.send_message, entity=peer, message=ans)
+        try:
+            await rpc.call(
+                "forward",
+                client.forward_messages,
+                entity=peer,
+                messages=int(user.message_id),
+                from_peer=int(user.chat_id),
+            )
+        except Exception as e:
+            # Текст уже доставлен: ошибка пересылки (в том числе долгий FloodWait) не должна
+            # превращаться в неудачную отправку, иначе получатель получил бы текст повторно
+            logger.warning(f"Сообщение {user.username} отправлено, но переслать исходное не удалось: {e}")
 
     @staticmethod
     async def send_message_four(
         client: Any,
-        user: UserAnalyzed,
-        id_user: int,
+        user: SendRecipient,
+        peer: EntityLike,
         ans: str,
     ) -> None:
         ans = f"{user.additional_message}\n\n{ans}"
-        await client.send_message(entity=id_user, message=ans)
+        await rpc.call("send", client.send_message, entity=peer, message=ans)
 
     @staticmethod
     async def send_message_random(
         client: Any,
-        user: UserAnalyzed,
+        user: SendRecipient,
         ans: str,
         *,
-        session: AsyncSession,
+        session: AsyncSession | None,
         redis_storage: RedisStorage,
+        entity: Entity | Status | None = None,
     ) -> bool | Status:
-        send_attempt_key = Function._build_send_attempt_key(user)
+        """
+        Отправляет сообщение получателю. Без сессии БД ничего не пишет в базу: исчерпанные
+        попытки возвращаются как Status с data["attempts_exhausted"], удаляет вызывающий код.
+        Счётчик попыток после успешной отправки сбрасывает вызывающий код — reset_send_attempts.
+        Заранее разрешённую сущность можно передать в entity, тогда в слоте остаётся только send RPC;
+        Status в entity — уже полученная ошибка разрешения, повторно не разрешаем.
+        """
         func = random.choices(
             population=[
                 Function.send_message_two,
@@ -162,13 +221,14 @@ class Function:
             weights=[0.10, 0.90],
         )[0]
 
-        entity = await Function.safe_get_entity(
-            client,
-            user.username,
-            redis_storage=redis_storage,
-            session=session,
-            target="user",
-        )
+        if entity is None:
+            entity = await Function.safe_get_entity(
+                client,
+                user.username,
+                redis_storage=redis_storage,
+                session=session,
+                target="user",
+            )
         if isinstance(entity, Status):
             return entity
         if isinstance(entity, list):
@@ -177,17 +237,22 @@ class Function:
             return Status(ok=False, message="EntityNotFound")
         f = False
         try:
-            await func(client, user, entity.id, ans)
+            # Передаём саму сущность: в ней есть access_hash, Telethon не полезет в кэш сессии по id
+            await func(client, user, entity, ans)
             f = True
-            await Function._reset_send_attempts(redis_storage=redis_storage, attempts_key=send_attempt_key)
+        except FloodWaitError as e:
+            # Отправки на паузе — это не ошибка получателя, попытку не засчитываем
+            logger.warning(f"Отправка {user.username} отложена из-за FloodWaitError: {e}")
+            return Status(ok=False, message="FloodWaitError", data={"time": e.seconds})
         except Exception as e:
             logger.error(f"Ошибка при отправке сообщения: {e}")
-            await Function._handle_failed_send_message(
+            exhausted = await Function._handle_failed_send_message(
                 redis_storage=redis_storage,
                 session=session,
                 user=user,
-                attempts_key=send_attempt_key,
             )
+            if exhausted and session is None:
+                return Status(ok=False, message="SendAttemptsExhausted", data={"attempts_exhausted": True})
         return f
 
     @staticmethod
@@ -203,140 +268,177 @@ class Function:
             str or None: Найденный username Telegram или None, если username не найден.
 
         """
-        pattern = r"@[A-Za-z0-9_]{5,32}\b"
-        match = re.search(pattern, text)
+        match = MENTION_RE.search(text)
         return match[0][1:] if match else None
 
     @staticmethod
-    async def is_acceptable_message(
-        message: str, triggers: set[str], excludes: set[str]
-    ) -> tuple[bool, list[str], list[str]]:
-        message_clean = message.lower().replace("\n", " ")
-        triggers_lower = {trigger.lower() for trigger in triggers}
-        excludes_lower = {exclude.lower() for exclude in excludes}
-
-        # Проверяем, есть ли хотя бы один триггер
-        has_trigger = any(keyword in message_clean for keyword in triggers_lower)
-
-        # Находим все слова из excludes, присутствующие в сообщении
-        found_ignores = {word for word in excludes_lower if word in message_clean}
-        found_trigger = {word for word in triggers_lower if word in message_clean}
-
-        # Сообщение допустимо, если есть триггер и НЕТ ни одного слова из исключений
-        is_acceptable = has_trigger and (len(found_ignores) == 0)
-
-        return is_acceptable, list(found_ignores), list(found_trigger)
+    def usernames_by_id(users: Iterable[Any]) -> dict[int, str]:
+        """Карта id → username из users ответа Telegram — для упоминаний по id без лишних запросов."""
+        return {user.id: user.username for user in users if isinstance(user, User) and user.username}
 
     @staticmethod
-    async def take_message_answer(
-        redis_storage: RedisStorage,
-        session: AsyncSession,
-    ) -> str:
-        if r := await redis_storage.get("messages_to_answer"):
-            return random.choice(r)
-        user_manager_id = await Function._get_manager_id(redis_storage)
-        if user_manager_id is None:
-            return "Привет"
-
-        r = (
-            await session.scalars(
-                select(MessageToAnswer.sentence).where(MessageToAnswer.user_manager_id == user_manager_id),
+    async def mentioned_usernames(
+        client: TelegramClient,
+        message: Message,
+        redis_storage: RedisStorage | None = None,
+    ) -> dict[int, str]:
+        """
+        Карта id → username для упоминаний по id (MessageEntityMentionName) в сообщении.
+
+        Для push-апдейтов, где нет users ответа GetChannelDifference: сначала кэш сущностей,
+        остальных — пачкой через resolve_users. Без таких упоминаний запросов нет вовсе.
+        """
+        user_ids = list(
+            dict.fromkeys(
+                entity.user_id
+                for entity in message.entities or ()
+                if isinstance(entity, MessageEntityMentionName)
             )
-        ).all()
-        if not r:
-            return "Привет"
-        await redis_storage.save("messages_to_answer", r, 60)
-        return random.choice(r)
+        )
+        usernames: dict[int, str] = {}
+        missing: list[int] = []
+        for user_id in user_ids:
+            cached = await entity_cache.get(redis_storage, user_id)
+            if cached is not None and cached.type == "user":
+                if cached.username:
+                    usernames[user_id] = cached.username
+            else:
+                missing.append(user_id)
+        if missing:
+            resolved = await Function.resolve_users(client, missing, redis_storage)
+            usernames.update(Function.usernames_by_id(resolved.values()))
+        return usernames
 
     @staticmethod
-    async def get_monitoring_chat(session: AsyncSession, bot_id: int) -> list[str]:
-        return (await session.scalars(select(MonitoringChat.chat_id).where(MonitoringChat.bot_id == bot_id))).all()
+    async def extract_mentions(message: Message, users: Mapping[int, str] | None = None) -> list[str]:
+        """
+        Возвращает все usernames (без @), упомянутые в сообщении, в порядке появления.
 
-    @staticmethod
-    async def get_banned_usernames(session: AsyncSession, redis_storage: RedisStorage) -> list[str]:
-        user_manager_id = await Function._get_manager_id(redis_storage)
-        if user_manager_id is None:
-            return []
+        Берёт уже размеченные Telegram сущности: @упоминания, упоминания по id
+        (если в users есть username для этого id) и ссылки t.me/username.
+        Регулярное выражение по тексту используется, только если сущностей нет.
+        """
+        text = message.message or ""
+        found: dict[str, str] = {}
+
+        def remember(username: str | None) -> None:
+            if username and USERNAME_RE.fullmatch(username):
+                found.setdefault(username.lower(), username)
+
+        if message.entities:
+            surrogate_text = add_surrogate(text)
+            for entity in message.entities:
+                if isinstance(entity, MessageEntityMentionName):
+                    remember((users or {}).get(entity.user_id))
+                    continue
+                if isinstance(entity, MessageEntityTextUrl):
+                    chunk = entity.url
+                elif isinstance(entity, (MessageEntityMention, MessageEntityUrl)):
+                    chunk = del_surrogate(surrogate_text[entity.offset : entity.offset + entity.length])
+                else:
+                    continue
 
-        return (
-            await session.scalars(select(BannedUser.username).where(BannedUser.user_manager_id == user_manager_id))
-        ).all()
+                if chunk.startswith("@"):
+                    remember(chunk[1:])
+                elif link := TME_LINK_RE.search(chunk):
+                    remember(link[1])
+        else:
+            for match in MENTION_RE.finditer(text):
+                remember(match[0][1:])
+            for match in TME_LINK_RE.finditer(text):
+                remember(match[1])
 
-    @staticmethod
-    async def get_ignored_words(
-        session: AsyncSession,
-        redis_storage: RedisStorage,
-        cashed: bool = False,
-    ) -> set[str]:
-        if cashed and (r := await redis_storage.get("ignored_words")):
-            return r
-        user_manager_id = await Function._get_manager_id(redis_storage)
-        if user_manager_id is None:
-            return set()
-
-        r = (
-            await session.scalars(select(IgnoredWord.word).where(IgnoredWord.user_manager_id == user_manager_id))
-        ).all()
-        r = set(r)
-        await redis_storage.save("ignored_words", r, 60)
-        return r
+        return list(found.values())
 
     @staticmethod
-    async def get_keywords(
-        session: AsyncSession,
-        redis_storage: RedisStorage,
-        cashed: bool = False,
-    ) -> set[str]:
-        if cashed and (r := await redis_storage.get("keywords")):
-            return r
-        user_manager_id = await Function._get_manager_id(redis_storage)
-        if user_manager_id is None:
-            return set()
+    async def is_acceptable_message(
+        message: str,
+        triggers: Collection[str],
+        excludes: Collection[str],
+        matcher: KeywordMatcher | None = None,
+    ) -> tuple[bool, list[str], list[str]]:
+        if matcher is None:
+            matcher = get_keyword_matcher(triggers, excludes)
+        result = matcher.match(message)
 
-        r = (await session.scalars(select(KeyWord.word).where(KeyWord.user_manager_id == user_manager_id))).all()
-        r = set(r)
-        await redis_storage.save("keywords", r, 60)
-        return r
+        # Сообщение допустимо, если есть триггер и НЕТ ни одного слова из исключений
+        is_acceptable = result.has_trigger and not result.found_ignores
+
+        return is_acceptable, result.found_ignores, result.found_triggers
 
     @staticmethod
-    async def get_messages_to_answer(session: AsyncSession, redis_storage: RedisStorage) -> list[str]:
-        user_manager_id = await Function._get_manager_id(redis_storage)
-        if user_manager_id is None:
-            return []
+    async def is_acceptable_messages(
+        messages: Sequence[str],
+        triggers: Collection[str],
+        excludes: Collection[str],
+        matcher: KeywordMatcher | None = None,
+        fuzzy_matcher: FuzzyKeywordMatcher | None = None,
+    ) -> list[tuple[bool, list[str], list[str]]]:
+        """
+        Пакетный вариант is_acceptable_message.
 
-        return (
-            await session.scalars(
-                select(MessageToAnswer.sentence).where(MessageToAnswer.user_manager_id == user_manager_id),
-            )
-        ).all()
+        Если передан fuzzy_matcher, сообщения без точного совпадения триггеров
+        дополнительно проверяются нечётким поиском одним вызовом на всю пачку.
+        """
+        if matcher is None:
+            matcher = get_keyword_matcher(triggers, excludes)
+        results = [matcher.match(message) for message in messages]
+
+        fuzzy_triggers: dict[int, list[str]] = {}
+        if fuzzy_matcher:
+            misses = [idx for idx, result in enumerate(results) if not result.has_trigger]
+            if misses:
+                found = await fuzzy_matcher.match_batch([messages[idx] for idx in misses])
+                fuzzy_triggers = {idx: words for idx, words in zip(misses, found, strict=True) if words}
+
+        decisions = []
+        for idx, result in enumerate(results):
+            found_triggers = result.found_triggers or fuzzy_triggers.get(idx, [])
+            is_acceptable = bool(found_triggers) and not result.found_ignores
+            decisions.append((is_acceptable, result.found_ignores, found_triggers))
+        return decisions
 
     @staticmethod
-    async def get_users_per_minute(
-        session: AsyncSession,
-        redis_storage: RedisStorage,
-        cashed: bool = False,
-    ) -> int:
-        if cashed and (r := await redis_storage.get("users_per_minute")):
-            return int(r)
-
-        user_manager_id = await Function._get_manager_id(redis_storage)
-        if user_manager_id is None:
-            return 1
+    async def get_monitoring_chat(session: AsyncSession, bot_id: int) -> list[str]:
+        return (await session.scalars(select(MonitoringChat.chat_id).where(MonitoringChat.bot_id == bot_id))).all()
 
-        users_per_minute = await session.scalar(
-            select(UserManager.users_per_minute).where(UserManager.id == user_manager_id)
-        )
-        users_per_minute = int(users_per_minute or 1)
-        await redis_storage.save("users_per_minute", users_per_minute, 60)
-        return users_per_minute
+    @staticmethod
+    async def get_manager_config(session: AsyncSession, redis_storage: RedisStorage) -> ManagerConfig | None:
+        """Снимок настроек менеджера из памяти процесса; из БД перечитывается только при смене версии."""
+        return await manager_configs.get(session, redis_storage)
 
     @staticmethod
     async def user_exist(
         username: str,
         session: AsyncSession,
     ) -> bool:
+        if user_writer.is_pending(username):
+            return True
+        if seen_usernames.ready:
+            possible, _ = seen_usernames.split([username])
+            if not possible:
+                return False
         return bool(await session.scalar(select(UserAnalyzed).where(UserAnalyzed.username == username)))
 
+    @staticmethod
+    async def get_existing_usernames(
+        usernames: Collection[str],
+        session: AsyncSession,
+    ) -> set[str]:
+        """Возвращает (в нижнем регистре) те usernames из набора, что уже есть в users_analyzed."""
+        # Ещё не записанные из буфера пользователи тоже считаются существующими
+        pending = {username.lower() for username in usernames if user_writer.is_pending(username)}
+        usernames = {username for username in usernames if username.lower() not in pending}
+        if seen_usernames.ready and usernames:
+            # Точно новые usernames фильтр отсекает без запроса по username
+            usernames, _ = seen_usernames.split(usernames)
+        if not usernames:
+            return pending
+        rows = await session.scalars(
+            select(UserAnalyzed.username).where(UserAnalyzed.username.in_(list(usernames))).distinct()
+        )
+        return pending | {username.lower() for username in rows if username}
+
     @staticmethod
     async def add_user(
         username: str,
@@ -374,122 +476,201 @@ class Function:
         )
 
     @staticmethod
-    async def get_difference_update_channel(
+    async def iter_difference_update_channel(
         client: TelegramClient,
-        chat_id: int,
+        state: ChannelState,
         redis_storage: RedisStorage,
-    ) -> list[Message]:
-        """Улучшенное получение обновлений для канала с максимальным охватом сообщений."""
-        try:
-            channel = await Function.safe_get_entity(
-                client,
-                chat_id,
-                redis_storage=redis_storage,
-                target="monitoring_chat",
-            )
-            if isinstance(channel, Status):
-                return []
-            if not channel:
-                return []
+        max_pages: int,
+    ) -> AsyncIterator[ChannelDifferenceResult]:
+        """
+        Выбирает разницу канала постранично, пока сервер не вернёт final, но не больше max_pages страниц.
 
-            input_channel = InputChannel(channel.id, channel.access_hash)
-            chat_pts = await redis_storage.get(chat_id)
+        Страницы отдаются по мере получения, а PTS сдвигается только после того,
+        как вызывающий код обработал страницу.
+        """
+        chat_id = state.channel_id
+        try:
+            pts = await channel_states.load_pts(redis_storage, state)
 
             # Инициализация PTS через GetFullChannelRequest при первом запуске
-            if not chat_pts:
-                full_channel = await client(GetFullChannelRequest(input_channel))
+            if pts is None:
+                full_channel = await rpc.call("history", client, GetFullChannelRequest(state.input_channel))
                 pts = full_channel.full_chat.pts
-                await redis_storage.save(chat_id, pts)
+                channel_states.set_pts(redis_storage, state, pts)
                 logger.info(f"Инициализирован PTS={pts} для канала {chat_id}")
-            else:
-                pts = int(chat_pts)
 
             # Запрос разницы БЕЗ фильтра (критически важно!)
             filter = ChannelMessagesFilter(ranges=[MessageRange(0, MAX_MESSAGE_ID)], exclude_new_messages=False)
-            difference = await client(
-                GetChannelDifferenceRequest(
-                    channel=input_channel,
-                    filter=filter,
-                    pts=pts,
-                    limit=100,  # Макс. лимит Telegram API
-                    force=True,  # Гарантируем получение изменений
+            for _ in range(max(1, max_pages)):
+                difference = await rpc.call(
+                    "history",
+                    client,
+                    GetChannelDifferenceRequest(
+                        channel=state.input_channel,
+                        filter=filter,
+                        pts=pts,
+                        limit=100,  # Макс. лимит Telegram API
+                        force=True,  # Гарантируем получение изменений
+                    )
                 )
-            )
 
-            # Обработка случаев
-            if isinstance(difference, ChannelDifferenceEmpty):
-                logger.debug(f"Канал {chat_id}: состояние актуально (PTS={pts})")
-                return []
-
-            if isinstance(difference, ChannelDifferenceTooLong):
-                logger.warning(f"Канал {chat_id}: PTS={pts} сильно устарел. Получаем историю...")
-                return await Function._handle_too_long_state(client, input_channel, redis_storage, chat_id)
-
-            # Сбор ВСЕХ сообщений (включая other_updates)
-            updates = difference.new_messages.copy()
-            if hasattr(difference, "other_updates") and difference.other_updates:
-                updates.extend(
-                    [
-                        update.message
-                        for update in difference.other_updates
-                        if hasattr(update, "message") and update.message
-                    ]
+                # Обработка случаев
+                if isinstance(difference, ChannelDifferenceEmpty):
+                    logger.debug(f"Канал {chat_id}: состояние актуально (PTS={pts})")
+                    yield ChannelDifferenceResult(timeout=difference.timeout)
+                    return
+
+                if isinstance(difference, ChannelDifferenceTooLong):
+                    logger.warning(f"Канал {chat_id}: PTS={pts} сильно устарел. Получаем историю...")
+                    async with contextlib.aclosing(
+                        Function._handle_too_long_state(client, state, redis_storage, difference)
+                    ) as pages:
+                        async for page in pages:
+                            yield page
+                    return
+
+                # Сбор ВСЕХ сообщений (включая other_updates)
+                updates = difference.new_messages.copy()
+                if hasattr(difference, "other_updates") and difference.other_updates:
+                    updates.extend(
+                        [
+                            update.message
+                            for update in difference.other_updates
+                            if hasattr(update, "message") and update.message
+                        ]
+                    )
+
+                final = bool(difference.final)
+                yield ChannelDifferenceResult(
+                    messages=updates,
+                    users=Function.usernames_by_id(difference.users),
+                    timeout=difference.timeout if final else None,
+                    final=final,
                 )
 
-            # Обновление PTS только если есть изменения
-            if difference.pts > pts:
-                await redis_storage.save(chat_id, difference.pts)
+                # Обновление PTS только если есть изменения
+                if difference.pts <= pts:
+                    logger.warning(
+                        f"Канал {chat_id}: PTS не увеличился ({pts} → {difference.pts}). "
+                        "Возможно, ошибка синхронизации."
+                    )
+                    return
+                channel_states.set_pts(redis_storage, state, difference.pts)
+                channel_states.note_messages(redis_storage, state, difference.new_messages)
                 logger.info(
                     f"Канал {chat_id}: получено {len(updates)} сообщений. PTS обновлен: {pts} → {difference.pts}"
                 )
-            else:
-                logger.warning(
-                    f"Канал {chat_id}: PTS не увеличился ({pts} → {difference.pts}). Возможно, ошибка синхронизации."
-                )
+                pts = difference.pts
+                if final:
+                    return
 
-            return updates
+            logger.info(f"Канал {chat_id}: исчерпан лимит {max_pages} страниц за опрос, продолжим на следующем")
 
+        except ChannelPrivateError:
+            # Сущность канала могла остаться в кэше — сбрасываем, чтобы safe_get_entity увидел ошибку
+            logger.error(f"Канал {chat_id} стал недоступен: ChannelPrivateError")
+            channel_states.invalidate(chat_id)
+            await entity_cache.forget(redis_storage, chat_id)
         except Exception as e:
+            # Возможно, устарел access_hash — на следующем опросе канал будет разрешён заново
+            channel_states.invalidate(chat_id)
             logger.exception(f"Критическая ошибка при обработке канала {chat_id}: {e}")
-            return []
 
     @staticmethod
     async def _handle_too_long_state(
         client: TelegramClient,
-        input_channel: InputChannel,
+        state: ChannelState,
         redis_storage: RedisStorage,
-        chat_id: int,
-    ) -> list[Message]:
-        """Обработка устаревшего PTS через историю сообщений"""
-        try:
-            # Получаем последние 100 сообщений (максимум за один запрос)
-            history = await client(
+        difference: ChannelDifferenceTooLong,
+    ) -> AsyncIterator[ChannelDifferenceResult]:
+        """
+        Обработка устаревшего PTS через историю сообщений.
+
+        PTS сразу переносится на актуальный, а пропуск от последнего обработанного
+        сообщения до текущего вычитывает из истории фоновая задача (iter_channel_backfill).
+        """
+        chat_id = state.channel_id
+        new_pts = getattr(difference.dialog, "pts", None)
+        if new_pts is None:
+            full_channel = await rpc.call("history", client, GetFullChannelRequest(state.input_channel))
+            new_pts = full_channel.full_chat.pts
+
+        # Незавершённое восстановление поглощается новым: читаем от его нижней границы
+        known_id = state.backfill.min_id if state.backfill is not None else state.last_message_id
+        if not known_id:
+            # Неизвестно, где остановились, — историю целиком не читаем, берём то, что прислал сервер
+            logger.warning(f"Канал {chat_id}: последний обработанный id неизвестен, восстановление истории пропущено")
+            channel_states.set_pts(redis_storage, state, new_pts)
+            yield ChannelDifferenceResult(
+                messages=list(difference.messages),
+                users=Function.usernames_by_id(difference.users),
+            )
+            channel_states.note_messages(redis_storage, state, difference.messages)
+            return
+
+        # Прогресс сохраняется раньше нового PTS, чтобы после рестарта пропуск не потерялся
+        channel_states.set_backfill(redis_storage, state, BackfillProgress(min_id=known_id))
+        channel_states.set_pts(redis_storage, state, new_pts)
+        logger.warning(f"Канал {chat_id}: восстанавливаем историю после id={known_id} (новый PTS={new_pts})")
+
+    @staticmethod
+    async def iter_channel_backfill(
+        client: TelegramClient,
+        state: ChannelState,
+        redis_storage: RedisStorage,
+    ) -> AsyncIterator[ChannelDifferenceResult]:
+        """
+        Читает историю канала от новых сообщений к старым до BackfillProgress.min_id.
+
+        За один проход — не больше channel_backfill_pages_per_poll страниц с паузой
+        между ними; прогресс сохраняется после каждой обработанной страницы.
+        Вызывается из отдельной фоновой задачи, а не из опроса: паузы не держат планировщик.
+        """
+        chat_id = state.channel_id
+        for page_number in range(max(1, se.worker.channel_backfill_pages_per_poll)):
+            progress = state.backfill
+            if progress is None:
+                return
+            if page_number:
+                await asyncio.sleep(se.worker.channel_backfill_page_delay)
+
+            history = await rpc.call(
+                "history",
+                client,
                 GetHistoryRequest(
-                    peer=input_channel,
+                    peer=state.input_channel,
                     limit=100,
                     offset_date=None,
-                    offset_id=0,
+                    offset_id=progress.offset_id,
                     max_id=0,
-                    min_id=0,
+                    min_id=progress.min_id,
                     add_offset=0,
                     hash=0,
                 )
             )
+            messages = [message for message in history.messages if message.id > progress.min_id]
+            if messages:
+                yield ChannelDifferenceResult(
+                    messages=messages,
+                    users=Function.usernames_by_id(history.users),
+                )
+                channel_states.note_messages(redis_storage, state, messages)
 
-            # Обновляем PTS до актуального
-            full_channel = await client(GetFullChannelRequest(input_channel))
-            new_pts = full_channel.full_chat.pts
-            await redis_storage.save(chat_id, new_pts)
-
-            logger.warning(
-                f"Канал {chat_id}: восстановлено {len(history.messages)} сообщений "
-                f"из истории после PTS устаревания (новый PTS={new_pts})"
+            if state.backfill is not progress:
+                # Пока читали страницу, новый ChannelDifferenceTooLong перезапустил восстановление
+                continue
+            oldest_id = min((message.id for message in messages), default=0)
+            if len(history.messages) < 100 or oldest_id <= progress.min_id + 1:
+                channel_states.set_backfill(redis_storage, state, None)
+                logger.warning(f"Канал {chat_id}: история после id={progress.min_id} восстановлена")
+                return
+            channel_states.set_backfill(redis_storage, state, BackfillProgress(progress.min_id, oldest_id))
+
+        if state.backfill is not None:
+            logger.info(
+                f"Канал {chat_id}: восстановление истории приостановлено на id={state.backfill.offset_id}, "
+                "продолжим на следующем проходе"
             )
-            return history.messages
-
-        except Exception as e:
-            logger.error(f"Ошибка при обработке ChannelDifferenceTooLong для {chat_id}: {e}")
-            return []
 
     @staticmethod
     async def job_exists(
@@ -558,10 +739,6 @@ class Function:
                 session.add(j)
                 await session.commit()
 
-    @staticmethod
-    def _build_attempt_key(peer_id: EntityLike, target: Literal["user", "monitoring_chat"] | None) -> str | None:
-        return f"safe_get_entity:{target}:{peer_id}" if target else None
-
     @staticmethod
     async def _reset_entity_attempts(
         *,
@@ -569,9 +746,8 @@ class Function:
         peer_id: EntityLike,
         target: Literal["user", "monitoring_chat"] | None,
     ) -> None:
-        key = Function._build_attempt_key(peer_id, target)
-        if redis_storage and key:
-            await redis_storage.delete(key)
+        if redis_storage and target:
+            await entity_attempts[target].reset(redis_storage, peer_id)
 
     @staticmethod
     async def _delete_unavailable_entity(
@@ -580,7 +756,6 @@ class Function:
         redis_storage: RedisStorage,
         target: Literal["user", "monitoring_chat"],
         peer_id: EntityLike,
-        attempts_key: str,
     ) -> None:
         if not session:
             logger.warning("Невозможно удалить запись без сессии БД")
@@ -607,14 +782,10 @@ class Function:
 
         record = await session.scalar(stmt)
         if not record:
-            with contextlib.suppress(Exception):
-                await redis_storage.delete(attempts_key)
             return
 
         await session.delete(record)
         await session.commit()
-        with contextlib.suppress(Exception):
-            await redis_storage.delete(attempts_key)
         logger.info("Удалена запись %s для peer_id=%s после 3 неудачных попыток", target, peer_value)
 
     @staticmethod
@@ -624,70 +795,82 @@ class Function:
         session: AsyncSession | None,
         peer_id: EntityLike,
         target: Literal["user", "monitoring_chat"] | None,
-    ) -> None:
+    ) -> bool:
+        """
+        Считает неудачную попытку. Возвращает True, когда попытки исчерпаны: с сессией
+        запись удаляется здесь же, без сессии удаление остаётся вызывающему коду.
+        """
         if not redis_storage or not target:
-            return
-
-        key = Function._build_attempt_key(peer_id, target)
-        if not key:
-            return
-
-        attempts_raw = await redis_storage.get(key)
-        try:
-            attempts = int(attempts_raw) + 1 if attempts_raw is not None else 1
-        except (TypeError, ValueError):
-            attempts = 1
-
-        await redis_storage.save(key, attempts)
+            return False
+
+        counter = entity_attempts[target]
+        attempts = await counter.incr(redis_storage, peer_id)
+        if attempts < 3:
+            return False
+        await counter.reset(redis_storage, peer_id)
+        if session is None:
+            return True
+        await Function._delete_unavailable_entity(
+            session=session,
+            redis_storage=redis_storage,
+            target=target,
+            peer_id=peer_id,
+        )
+        return True
 
-        if attempts >= 3:
-            await Function._delete_unavailable_entity(
-                session=session,
-                redis_storage=redis_storage,
-                target=target,
-                peer_id=peer_id,
-                attempts_key=key,
-            )
+    @staticmethod
+    async def _entity_fetch_failed(
+        message: str,
+        *,
+        redis_storage: RedisStorage | None,
+        session: AsyncSession | None,
+        peer_id: EntityLike,
+        target: Literal["user", "monitoring_chat"] | None,
+    ) -> Status:
+        exhausted = await Function._handle_failed_entity_fetch(
+            redis_storage=redis_storage,
+            session=session,
+            peer_id=peer_id,
+            target=target,
+        )
+        return Status(ok=False, message=message, data={"attempts_exhausted": True} if exhausted else {})
 
     @staticmethod
-    def _build_send_attempt_key(user: UserAnalyzed) -> str:
-        identifier = user.id or user.username or user.message_id or user.chat_id or "unknown"
-        return f"send_message:user:{identifier}"
+    def _send_attempt_field(user: SendRecipient) -> str:
+        return str(user.id or user.username or user.message_id or user.chat_id or "unknown")
 
     @staticmethod
-    async def _reset_send_attempts(redis_storage: RedisStorage | None, attempts_key: str | None) -> None:
-        if redis_storage and attempts_key:
-            await redis_storage.delete(attempts_key)
+    async def reset_send_attempts(redis_storage: RedisStorage | None, *users: SendRecipient) -> None:
+        """Сбрасывает счётчики попыток сразу для всей пачки — один вызов скрипта."""
+        if redis_storage and users:
+            await send_attempts.reset(redis_storage, *map(Function._send_attempt_field, users))
 
     @staticmethod
     async def _handle_failed_send_message(
         *,
         redis_storage: RedisStorage | None,
         session: AsyncSession | None,
-        user: UserAnalyzed,
-        attempts_key: str | None,
-    ) -> None:
-        if not redis_storage or not attempts_key:
-            return
-
-        attempts_raw = await redis_storage.get(attempts_key)
-        try:
-            attempts = int(attempts_raw) + 1 if attempts_raw is not None else 1
-        except (TypeError, ValueError):
-            attempts = 1
-
-        await redis_storage.save(attempts_key, attempts)
-
-        if attempts < 3 or not session:
-            return
+        user: SendRecipient,
+    ) -> bool:
+        """Считает неудачную отправку; True — попытки исчерпаны и получателя нужно удалить."""
+        if not redis_storage:
+            return False
+
+        field = Function._send_attempt_field(user)
+        attempts = await send_attempts.incr(redis_storage, field)
+        if attempts < 3:
+            return False
+        await send_attempts.reset(redis_storage, field)
+        if session is None:
+            return True
 
-        await session.delete(user)
+        await session.execute(delete(UserAnalyzed).where(UserAnalyzed.id == user.id))
         await session.commit()
-        await redis_storage.delete(attempts_key)
         logger.info(
             "Удалён пользователь %s после 3 неудачных попыток отправки",
             user.username or user.id,
         )
+        return True
 
     @staticmethod
     async def safe_get_entity(
@@ -699,29 +882,41 @@ class Function:
     ) -> Entity | list[Entity] | Status | None:
         if peer_id is None:
             return None
+
+        # Разрешённые ранее сущности берём из кэша без RPC
+        if cached := await entity_cache.get(redis_storage, peer_id):
+            return cached.to_entity()
+        if await entity_cache.is_missing(redis_storage, peer_id):
+            # Промах уже засчитан при настоящем разрешении: чтение кэша — не новая попытка,
+            # иначе три повторных чтения за missing_ttl удаляли бы запись без единого RPC
+            logger.info(f"Пользователь {peer_id} недавно не разрешился (отрицательный кэш)")
+            return Status(ok=False, message="UserNotFound", data={"cached_miss": True})
+
         try:
             # Сначала пробуем получить пользователя напрямую
-            entity = await client.get_entity(peer_id)
+            entity = await rpc.call("resolve", client.get_entity, peer_id)
             await Function._reset_entity_attempts(redis_storage=redis_storage, peer_id=peer_id, target=target)
+            await entity_cache.put(redis_storage, peer_id, entity)
             return entity
         except ChannelPrivateError:
             logger.error(f"Ошибка при получении пользователя {peer_id}: ChannelPrivateError")
-            await Function._handle_failed_entity_fetch(
+            return await Function._entity_fetch_failed(
+                "ChannelPrivateError",
                 redis_storage=redis_storage,
                 session=session,
                 peer_id=peer_id,
                 target=target,
             )
-            return Status(ok=False, message="ChannelPrivateError")
         except UsernameInvalidError:
             logger.error(f"Ошибка при получении пользователя {peer_id}: UsernameInvalidError")
-            await Function._handle_failed_entity_fetch(
+            await entity_cache.mark_missing(redis_storage, peer_id)
+            return await Function._entity_fetch_failed(
+                "UsernameInvalidError",
                 redis_storage=redis_storage,
                 session=session,
                 peer_id=peer_id,
                 target=target,
             )
-            return Status(ok=False, message="UsernameInvalidError")
         except ConnectionError as e:
             logger.error(f"Ошибка при получении пользователя {peer_id}: {e}")
             return Status(ok=False, message="ConnectionError")
@@ -732,37 +927,46 @@ class Function:
             logger.info(f"Пользователь {peer_id} не найден в кэше, обновляем диалоги...")
 
             try:
-                # Обновляем кэш диалогов
-                await client.get_dialogs()
-                await client.catch_up()
+                # Обновляем кэш диалогов; одновременные промахи ждут одно общее обновление
+                if not await dialogs_refresher.refresh(client):
+                    # Обновление пропущено из-за min_interval: промах ещё не подтверждён,
+                    # поэтому попытку не засчитываем и в отрицательный кэш не пишем
+                    logger.info(f"Пользователь {peer_id}: обновление диалогов отложено, повторим позже")
+                    return Status(ok=False, message="DialogsRefreshSkipped")
 
                 # Пробуем снова после обновления кэша
-                entity = await client.get_entity(peer_id)
+                entity = await rpc.call("resolve", client.get_entity, peer_id)
                 await Function._reset_entity_attempts(redis_storage=redis_storage, peer_id=peer_id, target=target)
+                await entity_cache.put(redis_storage, peer_id, entity)
                 return entity
             except ValueError:
                 logger.info(f"Пользователь {peer_id} всё ещё недоступен после обновления кэша")
-                await Function._handle_failed_entity_fetch(
+                await entity_cache.mark_missing(redis_storage, peer_id)
+                return await Function._entity_fetch_failed(
+                    "UserNotFound",
                     redis_storage=redis_storage,
                     session=session,
                     peer_id=peer_id,
                     target=target,
                 )
-                return Status(ok=False, message="UserNotFound")
+            except FloodWaitError as e:
+                # flood_sleep_threshold=0: длинные паузы обновления диалогов приходят сюда — это не вина peer
+                logger.info(f"Пользователь {peer_id} временно недоступен из-за FloodWaitError: {e}")
+                return Status(ok=False, message="FloodWaitError", data={"time": e.seconds})
             except Exception as e:
                 logger.info(f"Ошибка при получении пользователя {peer_id}: {e}")
-                await Function._handle_failed_entity_fetch(
+                return await Function._entity_fetch_failed(
+                    "UnknownError",
                     redis_storage=redis_storage,
                     session=session,
                     peer_id=peer_id,
                     target=target,
                 )
-                return Status(ok=False, message="UnknownError")
 
     @staticmethod
     async def get_folders_chat(client: TelegramClient) -> list[dict[str, Any]]:
-        await client.catch_up()
-        result = await client(functions.messages.GetDialogFiltersRequest())
+        await rpc.call("other", client.catch_up)
+        result = await rpc.call("other", client, functions.messages.GetDialogFiltersRequest())
         folders = result.filters
         return [
             {
@@ -778,13 +982,16 @@ class Function:
     async def get_processed_users(
         client: TelegramClient,
         folders: list[dict[str, Any]],
+        redis_storage: RedisStorage | None = None,
     ) -> list[dict[str, Any]]:
-        await client.catch_up()
+        await rpc.call("other", client.catch_up)
+        peer_ids = list(dict.fromkeys(int(peer) for folder in folders for peer in folder.get("pinned_peers", [])))
+        resolved = await Function.resolve_users(client, peer_ids, redis_storage)
         for folder in folders:
             users = []
             for peer in folder.get("pinned_peers", []):
-                user = await Function.safe_get_entity(client, peer)  # type: ignore
-                if not user or isinstance(user, Status):
+                user = resolved.get(int(peer))
+                if user is None:
                     continue
                 users.append(
                     {
@@ -799,23 +1006,191 @@ class Function:
         return folders
 
     @staticmethod
-    async def update_chat_title(client: TelegramClient, session: AsyncSession, bot_id: int) -> None:
-        chats = await session.scalars(
-            select(MonitoringChat).where(and_(MonitoringChat.bot_id == bot_id, MonitoringChat.title.is_(None))),
+    async def resolve_users(
+        client: TelegramClient,
+        user_ids: Sequence[int],
+        redis_storage: RedisStorage | None = None,
+    ) -> dict[int, User]:
+        """
+        Разрешает пользователей пачками users.GetUsers по уже известным access_hash
+        (кэш сущностей, затем сессия Telethon). Кого не удалось взять пачкой,
+        разрешаем по одному через safe_get_entity.
+        """
+        input_users: dict[int, InputUser] = {}
+        fallback: list[int] = []
+        for user_id in user_ids:
+            cached = await entity_cache.get(redis_storage, user_id)
+            if cached is not None and cached.type == "user":
+                input_users[user_id] = InputUser(cached.id, cached.access_hash)
+                continue
+            try:
+                input_peer = client.session.get_input_entity(user_id)
+            except ValueError:
+                fallback.append(user_id)
+                continue
+            if isinstance(input_peer, InputPeerUser):
+                input_users[user_id] = InputUser(input_peer.user_id, input_peer.access_hash)
+            else:
+                fallback.append(user_id)
+
+        resolved: dict[int, User] = {}
+        batch_ids = list(input_users)
+        for start in range(0, len(batch_ids), GET_USERS_BATCH_SIZE):
+            chunk = batch_ids[start : start + GET_USERS_BATCH_SIZE]
+            try:
+                users = await rpc.call("resolve", client, GetUsersRequest([input_users[user_id] for user_id in chunk]))
+            except Exception as e:
+                logger.warning(f"Не удалось получить пачку из {len(chunk)} пользователей: {e}")
+                fallback.extend(chunk)
+                continue
+            for user in users:
+                if isinstance(user, User):
+                    resolved[user.id] = user
+                    await entity_cache.put(redis_storage, user.id, user)
+            # UserEmpty и пропущенные сервером — пробуем разрешить по одному
+            fallback.extend(user_id for user_id in chunk if user_id not in resolved)
+
+        for user_id in fallback:
+            user = await Function.safe_get_entity(client, user_id, redis_storage=redis_storage)
+            if isinstance(user, User):
+                resolved[user_id] = user
+
+        logger.info(
+            f"Разрешено {len(resolved)} из {len(user_ids)} пользователей "
+            f"({len(batch_ids)} пачками, {len(fallback)} по одному)"
         )
-        for chat in chats:
-            chat_ = await Function.safe_get_entity(client, int(chat.chat_id))
+        return resolved
+
+    @staticmethod
+    async def update_chat_title(
+        client: TelegramClient,
+        session: AsyncSession,
+        bot_id: int,
+        redis_storage: RedisStorage | None = None,
+    ) -> None:
+        """
+        Заполняет пустые названия отслеживаемых чатов пачками channels.GetChannels
+        и одним UPDATE. Чат без названия считается неудачной попыткой разрешения:
+        после трёх подряд запись удаляется, как и при опросе канала.
+        """
+        rows = (
+            await session.execute(
+                select(MonitoringChat.id, MonitoringChat.chat_id).where(
+                    and_(MonitoringChat.bot_id == bot_id, MonitoringChat.title.is_(None))
+                ),
+            )
+        ).all()
+        if not rows:
+            return []
 
-            if not chat_:
+        input_channels: dict[int, InputChannel] = {}
+        fallback: list[str] = []
+        for _, chat_id in rows:
+            input_channel = await Function._get_cached_input_channel(client, chat_id, redis_storage)
+            if input_channel is None:
+                fallback.append(chat_id)
+            else:
+                input_channels.setdefault(input_channel.channel_id, input_channel)
+
+        # Названия по «голому» id канала (без -100)
+        titles: dict[int, str] = {}
+        # Каналы пачек, упавших целиком: ошибка сети или flood — не вина чата, попытку не считаем
+        unanswered: set[int] = set()
+        batch = list(input_channels.values())
+        for start in range(0, len(batch), GET_CHANNELS_BATCH_SIZE):
+            chunk = batch[start : start + GET_CHANNELS_BATCH_SIZE]
+            try:
+                result = await rpc.call("resolve", client, GetChannelsRequest(chunk))
+            except Exception as e:
+                logger.warning(f"Не удалось получить пачку из {len(chunk)} каналов: {e}")
+                unanswered.update(channel.channel_id for channel in chunk)
+                continue
+            for chat in result.chats:
+                if isinstance(chat, Channel):
+                    titles[chat.id] = chat.title
+                    await entity_cache.put(redis_storage, chat.id, chat)
+
+        # Каналы без известного access_hash разрешаем по одному; неудачи safe_get_entity считает сам
+        for chat_id in fallback:
+            chat = await Function.safe_get_entity(
+                client,
+                int(chat_id),
+                redis_storage=redis_storage,
+                session=session,
+                target="monitoring_chat",
+            )
+            if isinstance(chat, Channel):
+                titles[chat.id] = chat.title
+
+        new_titles: dict[int, str] = {}
+        failed: list[str] = []
+        for row_id, chat_id in rows:
+            bare_id = Function._bare_channel_id(chat_id)
+            title = titles.get(bare_id or 0)
+            if title is not None:
+                new_titles[row_id] = title
                 continue
-            with contextlib.suppress(Exception):
-                chat.title = chat_.title
+            failed.append(chat_id)
+            if chat_id in fallback or bare_id is None or bare_id in unanswered:
+                continue
+            # Канал был в ответившей пачке, но пришёл без названия (ChannelForbidden) или не пришёл вовсе
+            await Function._handle_failed_entity_fetch(
+                redis_storage=redis_storage,
+                session=session,
+                peer_id=int(chat_id),
+                target="monitoring_chat",
+            )
+
+        if new_titles and redis_storage:
+            # Удачное разрешение обнуляет счётчик, как и в safe_get_entity
+            resolved = (int(chat_id) for row_id, chat_id in rows if row_id in new_titles)
+            await entity_attempts["monitoring_chat"].reset(redis_storage, *resolved)
+        if new_titles:
+            await session.execute(
+                update(MonitoringChat)
+                .where(MonitoringChat.id.in_(new_titles))
+                .values(title=case(new_titles, value=MonitoringChat.id))
+                .execution_options(synchronize_session=False)
+            )
+        if failed:
+            logger.warning(f"Не удалось получить названия {len(failed)} чатов: {', '.join(failed)}")
+        logger.info(f"Обновлены названия {len(new_titles)} чатов ({len(batch)} пачками, {len(fallback)} по одному)")
+
+    @staticmethod
+    def _bare_channel_id(chat_id: str | int) -> int | None:
+        try:
+            return resolve_id(int(chat_id))[0]
+        except ValueError:
+            return None
+
+    @staticmethod
+    async def _get_cached_input_channel(
+        client: TelegramClient,
+        chat_id: str,
+        redis_storage: RedisStorage | None,
+    ) -> InputChannel | None:
+        """InputChannel из уже известных access_hash (состояние опроса, кэш сущностей, сессия) без RPC."""
+        channel_id = Function._bare_channel_id(chat_id)
+        if channel_id is None:
+            return None
+        if (state := channel_states.get(int(chat_id))) is not None:
+            return state.input_channel
+        cached = await entity_cache.get(redis_storage, chat_id)
+        if cached is not None and cached.type == "channel":
+            return InputChannel(cached.id, cached.access_hash)
+        try:
+            input_peer = client.session.get_input_entity(int(chat_id))
+        except ValueError:
+            return None
+        if isinstance(input_peer, InputPeerChannel):
+            return InputChannel(input_peer.channel_id, input_peer.access_hash)
+        return None
 
     @staticmethod
     async def update_me_name(client: TelegramClient, session: AsyncSession, bot_id: int) -> None:
         bot = await session.get(Bot, bot_id)
         with contextlib.suppress(Exception):
-            me = await client.get_me()
+            me = await rpc.call("other", client.get_me)
             bot.name = me.first_name
 
     @staticmethod
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import re
+from collections.abc import Iterable, Sequence
+
+try:
+    import numpy  # noqa: F401  process.cdist возвращает numpy-массив
+    from rapidfuzz import fuzz, process
+except ImportError:  # pragma: no cover - нечёткий режим опционален
+    process = None
+
+logger = logging.getLogger(__name__)
+TOKEN_RE = re.compile(r"\w+")
+
+
+def fuzzy_available() -> bool:
+    return process is not None
+
+
+class FuzzyKeywordMatcher:
+    """
+    Нечёткий поиск ключевых слов (опечатки, падежные окончания) сразу по пачке сообщений.
+
+    Ключевое слово из n слов сравнивается со всеми n-граммами слов сообщений пачки
+    одним вызовом rapidfuzz.process.cdist; одинаковые n-граммы считаются один раз.
+    """
+
+    def __init__(self, keywords: Iterable[str], score_cutoff: float, min_length: int) -> None:
+        self._score_cutoff = score_cutoff
+        groups: dict[int, set[str]] = {}
+        for keyword in keywords:
+            tokens = TOKEN_RE.findall(keyword.lower())
+            # Короткие слова нечётко совпадают почти с чем угодно — для них только точный поиск
+            if not tokens or len(keyword.strip()) < min_length:
+                continue
+            groups.setdefault(len(tokens), set()).add(" ".join(tokens))
+        self._groups: dict[int, list[str]] = {size: sorted(words) for size, words in groups.items()}
+
+    def __bool__(self) -> bool:
+        return bool(self._groups)
+
+    async def match_batch(self, messages: Sequence[str]) -> list[list[str]]:
+        """
+        Для каждого сообщения возвращает ключевые слова, найденные с оценкой не ниже порога.
+
+        cdist на пачке занимает заметное время, поэтому считается в отдельном потоке,
+        а не блокирует цикл событий (и вместе с ним все апдейты Telegram).
+        """
+        if process is None or not self._groups or not messages:
+            return [[] for _ in messages]
+        return await asyncio.to_thread(self._match_batch, list(messages))
+
+    def _match_batch(self, messages: list[str]) -> list[list[str]]:
+        found: list[set[str]] = [set() for _ in messages]
+        tokenized = [TOKEN_RE.findall(message.lower()) for message in messages]
+        for size, keywords in self._groups.items():
+            owners: dict[str, set[int]] = {}
+            for idx, tokens in enumerate(tokenized):
+                for start in range(len(tokens) - size + 1):
+                    owners.setdefault(" ".join(tokens[start : start + size]), set()).add(idx)
+            if not owners:
+                continue
+
+            ngrams = list(owners)
+            scores = process.cdist(
+                ngrams,
+                keywords,
+                scorer=fuzz.ratio,
+                score_cutoff=self._score_cutoff,
+                workers=-1,
+            )
+            rows, cols = scores.nonzero()
+            for row, col in zip(rows.tolist(), cols.tolist(), strict=True):
+                for idx in owners[ngrams[row]]:
+                    found[idx].add(keywords[col])
+
+        return [sorted(words) for words in found]
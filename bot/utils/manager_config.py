@@ -0,0 +1,160 @@
+import functools
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Final
+
+from bot.db.func import RedisStorage
+from bot.db.models import BannedUser, IgnoredWord, KeyWord, MessageToAnswer, UserManager
+from bot.settings import se
+from bot.utils.fuzzy import FuzzyKeywordMatcher, fuzzy_available
+from bot.utils.matcher import KeywordMatcher, get_keyword_matcher
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+DEFAULT_ANSWER: Final[str] = "Привет"
+
+
+def manager_config_version_key(user_manager_id: int) -> str:
+    return f"manager_config:version:{user_manager_id}"
+
+
+@dataclass(frozen=True)
+class ManagerConfig:
+    """Неизменяемый снимок настроек менеджера, общий для всех задач процесса."""
+
+    user_manager_id: int
+    version: int
+    keywords: frozenset[str]
+    ignored_words: frozenset[str]
+    banned_usernames: frozenset[str]
+    answers: tuple[str, ...]
+    users_per_minute: int
+    is_antiflood_mode: bool
+    loaded_at: float
+
+    @functools.cached_property
+    def matcher(self) -> KeywordMatcher:
+        return get_keyword_matcher(self.keywords, self.ignored_words)
+
+    @functools.cached_property
+    def fuzzy_matcher(self) -> FuzzyKeywordMatcher | None:
+        if not se.worker.fuzzy_matching:
+            return None
+        if not fuzzy_available():
+            logger.warning("FUZZY_MATCHING включён, но rapidfuzz/numpy не установлены — только точный поиск")
+            return None
+        matcher = FuzzyKeywordMatcher(
+            self.keywords,
+            score_cutoff=se.worker.fuzzy_score_cutoff,
+            min_length=se.worker.fuzzy_min_keyword_length,
+        )
+        return matcher or None
+
+    def random_answer(self) -> str:
+        return random.choice(self.answers) if self.answers else DEFAULT_ANSWER
+
+
+class ManagerConfigCache:
+    """
+    Хранит ManagerConfig в памяти процесса по user_manager_id.
+
+    Снимок перечитывается из БД, только когда в Redis увеличилась версия
+    или истёк страховочный max_age. Настройки меняет бот менеджера (вне этого репозитория):
+    после записи он делает INCR общего ключа manager_config_version_key(user_manager_id),
+    то есть wb_userbot:shared:manager_config:version:<id>. Пока он этого не делает,
+    изменения подхватываются по max_age.
+    """
+
+    def __init__(self, max_age: int) -> None:
+        self._max_age = max_age
+        self._configs: dict[int, ManagerConfig] = {}
+        self._user_manager_id: int | None = None
+
+    async def get(self, session: AsyncSession, redis_storage: RedisStorage) -> ManagerConfig | None:
+        user_manager_id = self._user_manager_id
+        if user_manager_id is None:
+            user_manager_id = await self._read_manager_id(redis_storage)
+            if user_manager_id is None:
+                return None
+
+        version = int(await redis_storage.get_shared(manager_config_version_key(user_manager_id)) or 0)
+        config = self._configs.get(user_manager_id)
+        if (
+            config is not None
+            and config.version == version
+            and time.monotonic() - config.loaded_at < self._max_age
+        ):
+            return config
+
+        # Привязка аккаунта к менеджеру могла поменяться — перечитываем её вместе со снимком
+        if config is not None:
+            current_manager_id = await self._read_manager_id(redis_storage)
+            if current_manager_id is None:
+                return None
+            if current_manager_id != user_manager_id:
+                user_manager_id = current_manager_id
+                version = int(await redis_storage.get_shared(manager_config_version_key(user_manager_id)) or 0)
+
+        return await self._load(session, user_manager_id, version)
+
+    def invalidate(self) -> None:
+        self._configs.clear()
+        self._user_manager_id = None
+
+    async def _read_manager_id(self, redis_storage: RedisStorage) -> int | None:
+        manager_raw = await redis_storage.get("user_manager_id")
+        try:
+            self._user_manager_id = int(manager_raw)
+        except (TypeError, ValueError):
+            logger.warning("Некорректный user_manager_id в Redis: %s", manager_raw)
+            self._user_manager_id = None
+        return self._user_manager_id
+
+    async def _load(self, session: AsyncSession, user_manager_id: int, version: int) -> ManagerConfig | None:
+        row = (
+            await session.execute(
+                select(UserManager.users_per_minute, UserManager.is_antiflood_mode).where(
+                    UserManager.id == user_manager_id
+                )
+            )
+        ).first()
+        if row is None:
+            logger.info("User manager id=%s не найден в базе данных", user_manager_id)
+            self._configs.pop(user_manager_id, None)
+            return None
+
+        users_per_minute, is_antiflood_mode = row
+        keywords = await session.scalars(select(KeyWord.word).where(KeyWord.user_manager_id == user_manager_id))
+        ignored_words = await session.scalars(
+            select(IgnoredWord.word).where(IgnoredWord.user_manager_id == user_manager_id)
+        )
+        banned_usernames = await session.scalars(
+            select(BannedUser.username).where(
+                BannedUser.user_manager_id == user_manager_id,
+                BannedUser.username.is_not(None),
+            )
+        )
+        answers = await session.scalars(
+            select(MessageToAnswer.sentence).where(MessageToAnswer.user_manager_id == user_manager_id)
+        )
+
+        config = ManagerConfig(
+            user_manager_id=user_manager_id,
+            version=version,
+            keywords=frozenset(keywords.all()),
+            ignored_words=frozenset(ignored_words.all()),
+            banned_usernames=frozenset(banned_usernames.all()),
+            answers=tuple(answers.all()),
+            users_per_minute=int(users_per_minute or 1),
+            is_antiflood_mode=bool(is_antiflood_mode),
+            loaded_at=time.monotonic(),
+        )
+        self._configs[user_manager_id] = config
+        logger.debug("Загружены настройки менеджера id=%s (версия %s)", user_manager_id, version)
+        return config
+
+
+manager_configs = ManagerConfigCache(max_age=se.worker.manager_config_max_age)
@@ -0,0 +1,101 @@
+import functools
+from collections import deque
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class KeywordMatch:
+    has_trigger: bool
+    found_ignores: list[str]
+    found_triggers: list[str]
+
+
+class KeywordMatcher:
+    """
+    Автомат Ахо-Корасик для поиска ключевых и игнорируемых слов за один проход по тексту.
+
+    Строится один раз на набор слов и переиспользуется, пока наборы не изменятся.
+    """
+
+    __slots__ = ("_goto", "_fail", "_out", "_words", "_is_trigger", "_is_ignore", "_always")
+
+    def __init__(self, triggers: Iterable[str], excludes: Iterable[str]) -> None:
+        trigger_words = {word.lower() for word in triggers}
+        exclude_words = {word.lower() for word in excludes}
+
+        self._words: list[str] = sorted(trigger_words | exclude_words)
+        self._is_trigger: list[bool] = [word in trigger_words for word in self._words]
+        self._is_ignore: list[bool] = [word in exclude_words for word in self._words]
+
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[tuple[int, ...]] = [()]
+        # Пустая строка входит в любой текст — так же работал `word in message`
+        self._always: frozenset[int] = frozenset(idx for idx, word in enumerate(self._words) if not word)
+
+        self._build()
+
+    def _build(self) -> None:
+        outputs: list[list[int]] = [[]]
+        for idx, word in enumerate(self._words):
+            if not word:
+                continue
+            state = 0
+            for ch in word:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    outputs.append([])
+                state = nxt
+            outputs[state].append(idx)
+
+        queue: deque[int] = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                outputs[nxt].extend(outputs[self._fail[nxt]])
+
+        self._out = [tuple(out) for out in outputs]
+
+    def match(self, message: str) -> KeywordMatch:
+        text = message.lower().replace("\n", " ")
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+
+        found: set[int] = set(self._always)
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+
+        found_triggers = [self._words[idx] for idx in found if self._is_trigger[idx]]
+        found_ignores = [self._words[idx] for idx in found if self._is_ignore[idx]]
+        return KeywordMatch(
+            has_trigger=bool(found_triggers),
+            found_ignores=found_ignores,
+            found_triggers=found_triggers,
+        )
+
+
+def get_keyword_matcher(triggers: Iterable[str], excludes: Iterable[str]) -> KeywordMatcher:
+    """Возвращает закэшированный автомат для данных наборов слов."""
+    return _build_matcher(frozenset(triggers), frozenset(excludes))
+
+
+@functools.lru_cache(maxsize=16)
+def _build_matcher(triggers: frozenset[str], excludes: frozenset[str]) -> KeywordMatcher:
+    return KeywordMatcher(triggers, excludes)
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from telethon.crypto import AuthKey
+from telethon.sessions import MemorySession, SQLiteSession
+from telethon.tl.types.updates import State
+
+logger = logging.getLogger(__name__)
+SESSION_EXTENSION = ".session"
+
+
+@dataclass(frozen=True)
+class SessionSnapshot:
+    dc_id: int
+    server_address: str | None
+    port: int | None
+    auth_key: AuthKey | None
+    takeout_id: int | None
+    entities: list[tuple[Any, ...]]
+    update_states: dict[int, State]
+
+
+class CheckpointedMemorySession(MemorySession):
+    """
+    Сессия Telethon в памяти, которая периодически сохраняется в обычный SQLite-файл сессии.
+
+    При старте состояние читается из файла, дальше все изменения (сущности, PTS)
+    живут только в памяти. checkpoint() пишет полный снимок во временный файл рядом
+    и атомарно подменяет им файл сессии через os.replace, поэтому при падении
+    на диске остаётся либо старый, либо новый целый файл.
+    """
+
+    def __init__(self, session_path: str) -> None:
+        super().__init__()
+        self.filename = session_path if session_path.endswith(SESSION_EXTENSION) else session_path + SESSION_EXTENSION
+        self._entity_rows: dict[int, tuple[Any, ...]] = {}
+        self._dirty = False
+        self._checkpoint_lock = asyncio.Lock()
+        if os.path.exists(self.filename) and os.path.getsize(self.filename):
+            self._load()
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    @property
+    def auth_key(self) -> AuthKey | None:
+        return self._auth_key
+
+    @auth_key.setter
+    def auth_key(self, value: AuthKey | None) -> None:
+        self._auth_key = value
+        self._dirty = True
+
+    @property
+    def takeout_id(self) -> int | None:
+        return self._takeout_id
+
+    @takeout_id.setter
+    def takeout_id(self, value: int | None) -> None:
+        self._takeout_id = value
+        self._dirty = True
+
+    def set_dc(self, dc_id: int, server_address: str, port: int) -> None:
+        super().set_dc(dc_id, server_address, port)
+        self._dirty = True
+
+    def set_update_state(self, entity_id: int, state: State) -> None:
+        super().set_update_state(entity_id, state)
+        self._dirty = True
+
+    def process_entities(self, tlo: Any) -> None:
+        # В MemorySession строки копятся в set, и старый access_hash остаётся рядом с новым —
+        # держим по одной строке на id
+        for row in self._entities_to_rows(tlo):
+            previous = self._entity_rows.get(row[0])
+            if previous == row:
+                continue
+            if previous is not None:
+                self._entities.discard(previous)
+            self._entity_rows[row[0]] = row
+            self._entities.add(row)
+            self._dirty = True
+
+    def close(self) -> None:
+        # Telethon закрывает сессию при disconnect — это последняя возможность сохранить состояние
+        try:
+            self.checkpoint()
+        except Exception as exc:
+            logger.exception("Не удалось сохранить сессию %s при закрытии: %s", self.filename, exc)
+
+    def checkpoint(self) -> bool:
+        """Синхронно сохраняет сессию в файл, если с прошлого сохранения что-то изменилось."""
+        if not self._dirty:
+            return False
+        snapshot = self._snapshot()
+        try:
+            self._write(snapshot)
+        except Exception:
+            self._dirty = True
+            raise
+        return True
+
+    async def checkpoint_async(self) -> bool:
+        """То же, что checkpoint, но запись файла идёт в отдельном потоке."""
+        async with self._checkpoint_lock:
+            if not self._dirty:
+                return False
+            snapshot = self._snapshot()
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, snapshot)
+            except Exception as exc:
+                self._dirty = True
+                logger.exception("Не удалось сохранить сессию %s: %s", self.filename, exc)
+                return False
+            logger.debug(
+                "Сессия сохранена: %s сущностей за %.3f с",
+                len(snapshot.entities),
+                time.perf_counter() - started,
+            )
+            return True
+
+    def _snapshot(self) -> SessionSnapshot:
+        # Снимок берётся в потоке event loop, а флаг сбрасывается до записи:
+        # изменения, пришедшие во время записи, попадут в следующий checkpoint
+        self._dirty = False
+        return SessionSnapshot(
+            dc_id=self._dc_id,
+            server_address=self._server_address,
+            port=self._port,
+            auth_key=self._auth_key,
+            takeout_id=self._takeout_id,
+            entities=list(self._entity_rows.values()),
+            update_states=dict(self._update_states),
+        )
+
+    def _load(self) -> None:
+        source = SQLiteSession(self.filename)
+        try:
+            self._dc_id = source.dc_id
+            self._server_address = source.server_address
+            self._port = source.port
+            self._auth_key = source.auth_key
+            self._takeout_id = source.takeout_id
+            cursor = source._cursor()
+            try:
+                for row in cursor.execute("select id, hash, username, phone, name from entities"):
+                    self._entity_rows[row[0]] = tuple(row)
+            finally:
+                cursor.close()
+            self._entities = set(self._entity_rows.values())
+            self._update_states = dict(source.get_update_states())
+        finally:
+            source.close()
+        logger.info("Сессия %s загружена в память: %s сущностей", self.filename, len(self._entity_rows))
+
+    def _write(self, snapshot: SessionSnapshot) -> None:
+        tmp_path = self.filename[: -len(SESSION_EXTENSION)] + ".checkpoint" + SESSION_EXTENSION
+        for path in (tmp_path, f"{tmp_path}-journal"):
+            if os.path.exists(path):
+                os.remove(path)
+
+        target = SQLiteSession(tmp_path)
+        try:
+            target.set_dc(snapshot.dc_id, snapshot.server_address, snapshot.port)
+            target.auth_key = snapshot.auth_key
+            target.takeout_id = snapshot.takeout_id
+            now = int(time.time())
+            cursor = target._cursor()
+            try:
+                cursor.executemany(
+                    "insert or replace into entities values (?,?,?,?,?,?)",
+                    [row + (now,) for row in snapshot.entities],
+                )
+            finally:
+                cursor.close()
+            for entity_id, state in snapshot.update_states.items():
+                target.set_update_state(entity_id, state)
+            target.save()
+        finally:
+            target.close()
+
+        with open(tmp_path, "rb") as fh:
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.filename)
+        directory_fd = os.open(os.path.dirname(os.path.abspath(self.filename)), os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
@@ -0,0 +1,87 @@
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Final
+
+from bot.settings import se
+
+# Задача опроса запускается раз в ~секунду, поэтому канал считается готовым чуть раньше срока,
+# иначе активный канал с интервалом 1 с опрашивался бы через тик
+DUE_TOLERANCE_SECONDS: Final[float] = 0.5
+
+
+@dataclass
+class ChannelPollState:
+    interval: float
+    next_poll_at: float
+    empty_polls: int = 0
+
+
+class ChannelPollScheduler:
+    """
+    Адаптивный интервал опроса каналов.
+
+    Канал, вернувший сообщения, опрашивается с минимальным интервалом; на пустых
+    ответах интервал растёт экспоненциально до max_interval. Подсказка сервера
+    timeout из ChannelDifference/ChannelDifferenceEmpty всегда соблюдается.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, backoff: float) -> None:
+        self._min_interval = max(0.0, min_interval)
+        self._max_interval = max(self._min_interval, max_interval)
+        self._backoff = max(1.0, backoff)
+        self._states: dict[int, ChannelPollState] = {}
+
+    def is_due(self, channel_id: int, now: float | None = None) -> bool:
+        state = self._states.get(channel_id)
+        if state is None:
+            return True
+        now = now if now is not None else time.monotonic()
+        return now + DUE_TOLERANCE_SECONDS >= state.next_poll_at
+
+    def due(self, channel_ids: Iterable[int]) -> list[int]:
+        now = time.monotonic()
+        return [channel_id for channel_id in channel_ids if self.is_due(channel_id, now)]
+
+    def record(self, channel_id: int, *, got_messages: bool, server_timeout: int | None = None) -> float:
+        """Учитывает результат опроса и возвращает интервал до следующего."""
+        state = self._states.get(channel_id)
+        if got_messages:
+            interval, empty_polls = self._min_interval, 0
+        elif state is None:
+            interval, empty_polls = self._min_interval, 1
+        else:
+            interval = min(self._max_interval, max(state.interval, self._min_interval) * self._backoff)
+            empty_polls = state.empty_polls + 1
+
+        if server_timeout:
+            interval = max(interval, float(server_timeout))
+
+        self._states[channel_id] = ChannelPollState(
+            interval=interval,
+            next_poll_at=time.monotonic() + interval,
+            empty_polls=empty_polls,
+        )
+        return interval
+
+    def record_error(self, channel_id: int) -> float:
+        return self.record(channel_id, got_messages=False)
+
+    def retain(self, channel_ids: Iterable[int]) -> None:
+        """Забывает каналы, которые больше не отслеживаются."""
+        keep = set(channel_ids)
+        for channel_id in list(self._states):
+            if channel_id not in keep:
+                del self._states[channel_id]
+
+    def next_poll_times(self) -> dict[int, float]:
+        """Сколько секунд осталось до следующего опроса каждого канала."""
+        now = time.monotonic()
+        return {channel_id: max(0.0, state.next_poll_at - now) for channel_id, state in self._states.items()}
+
+
+channel_polls = ChannelPollScheduler(
+    min_interval=se.worker.channel_poll_min_interval,
+    max_interval=se.worker.channel_poll_max_interval,
+    backoff=se.worker.channel_poll_backoff,
+)
@@ -0,0 +1,113 @@
+import logging
+from typing import Final
+
+from bot.db.func import RedisStorage
+from bot.settings import se
+from redis.commands.core import AsyncScript
+
+logger = logging.getLogger(__name__)
+
+# Счётчики до перехода на хэши: строковый ключ без TTL на каждого получателя и peer
+LEGACY_KEY_PATTERNS: Final[tuple[str, ...]] = ("send_message:user:*", "safe_get_entity:*")
+
+# Поле хэша хранит "count:updated_at". TTL считается для каждого поля отдельно:
+# EXPIRE всего хэша продлевался бы любой новой ошибкой, и старые поля не истекали бы никогда.
+INCR_SCRIPT: Final[str] = """
+local key = KEYS[1]
+local field = ARGV[1]
+local ttl = tonumber(ARGV[2])
+local now = tonumber(redis.call('TIME')[1])
+
+local count = 0
+local raw = redis.call('HGET', key, field)
+if raw then
+    local stored, updated = string.match(raw, '^(%d+):(%d+)$')
+    if stored and tonumber(updated) + ttl > now then
+        count = tonumber(stored)
+    end
+end
+count = count + 1
+redis.call('HSET', key, field, count .. ':' .. now)
+redis.call('EXPIRE', key, ttl)
+return count
+"""
+
+# Удаляет переданные поля и заодно вычищает поля, не обновлявшиеся дольше TTL.
+RESET_SCRIPT: Final[str] = """
+local key = KEYS[1]
+local ttl = tonumber(ARGV[1])
+local now = tonumber(redis.call('TIME')[1])
+for i = 2, #ARGV do
+    redis.call('HDEL', key, ARGV[i])
+end
+
+local pruned = 0
+local cursor = '0'
+repeat
+    local page = redis.call('HSCAN', key, cursor, 'COUNT', 100)
+    cursor = page[1]
+    local items = page[2]
+    for i = 1, #items, 2 do
+        local updated = tonumber(string.match(items[i + 1], ':(%d+)$') or '0')
+        if updated + ttl <= now then
+            redis.call('HDEL', key, items[i])
+            pruned = pruned + 1
+        end
+    end
+until cursor == '0'
+return pruned
+"""
+
+
+class RetryCounter:
+    """
+    Счётчики неудачных попыток в одном хэше на аккаунт: поле — peer или получатель.
+
+    Увеличение и сброс — по одному атомарному Lua-скрипту, то есть один round trip.
+    Каждое поле живёт не дольше ttl_seconds с последней неудачи; устаревшие поля
+    удаляются при сбросе, поэтому хэш не растёт на активном аккаунте.
+    """
+
+    def __init__(self, key: str, ttl_seconds: int) -> None:
+        self._key = key
+        self._ttl = max(1, ttl_seconds)
+        self._incr: AsyncScript | None = None
+        self._reset: AsyncScript | None = None
+
+    async def incr(self, redis_storage: RedisStorage, field: object) -> int:
+        """Засчитывает неудачу и возвращает число неудач подряд."""
+        if self._incr is None:
+            self._incr = redis_storage.register_script(INCR_SCRIPT)
+        return int(await self._incr(keys=[redis_storage.build_key(self._key)], args=[str(field), self._ttl]))
+
+    async def reset(self, redis_storage: RedisStorage, *fields: object) -> None:
+        """Сбрасывает счётчики полей (можно сразу для пачки) и чистит истёкшие."""
+        if self._reset is None:
+            self._reset = redis_storage.register_script(RESET_SCRIPT)
+        pruned = await self._reset(
+            keys=[redis_storage.build_key(self._key)],
+            args=[self._ttl, *map(str, fields)],
+        )
+        if pruned:
+            logger.debug("Удалено %s устаревших счётчиков попыток из %s", pruned, self._key)
+
+
+async def remove_legacy_counters(redis_storage: RedisStorage) -> int:
+    """
+    Удаляет строковые счётчики попыток старого формата: у них нет TTL, и сами они не истекут.
+
+    Вызывается при старте; после первой очистки это один проход SCAN, который ничего не находит.
+    """
+    removed = 0
+    for pattern in LEGACY_KEY_PATTERNS:
+        removed += await redis_storage.unlink_matching(pattern)
+    if removed:
+        logger.info("Удалено %s счётчиков попыток старого формата", removed)
+    return removed
+
+
+send_attempts = RetryCounter("attempts:send_message", se.worker.retry_attempts_ttl)
+entity_attempts = {
+    "user": RetryCounter("attempts:safe_get_entity:user", se.worker.retry_attempts_ttl),
+    "monitoring_chat": RetryCounter("attempts:safe_get_entity:monitoring_chat", se.worker.retry_attempts_ttl),
+}
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import math
+import time
+from collections.abc import Awaitable, Callable, Mapping
+from dataclasses import dataclass
+from typing import Literal, ParamSpec, TypeVar
+
+from bot.settings import RpcLimitSettings, se
+from telethon.errors import FloodWaitError
+
+logger = logging.getLogger(__name__)
+
+P = ParamSpec("P")
+T = TypeVar("T")
+RpcFamily = Literal["resolve", "history", "send", "forward", "other"]
+
+
+@dataclass(frozen=True)
+class RpcBudget:
+    rate: float
+    capacity: int
+    tokens: float
+    paused_for: float
+    waiting: int
+    calls: int
+    flood_waits: int
+
+
+class TokenBucket:
+    """Ведро токенов с резервированием: токен берётся сразу, а ожидающие встают в очередь по времени."""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = max(rate, 0.001)
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+
+    def tokens(self, now: float) -> float:
+        return min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+
+    def reserve(self, now: float) -> float:
+        """Забирает токен и возвращает, сколько секунд нужно подождать до его появления."""
+        self._tokens = self.tokens(now) - 1
+        self._updated_at = now
+        return max(0.0, -self._tokens / self.rate)
+
+    def refund(self) -> None:
+        """Возвращает зарезервированный, но не использованный токен."""
+        self._tokens += 1
+
+
+@dataclass
+class _FamilyState:
+    bucket: TokenBucket
+    paused_until: float = 0.0
+    waiting: int = 0
+    calls: int = 0
+    flood_waits: int = 0
+
+
+class RpcGovernor:
+    """
+    Единая точка вызовов Telegram API с учётом FloodWait.
+
+    У каждого семейства запросов (разрешение сущностей, история/разница, отправка,
+    пересылка) своё ведро токенов. FloodWaitError ставит на паузу только своё
+    семейство: вызовы встают в очередь и повторяются после паузы. Если пауза
+    длиннее max_queue_wait, ошибка пробрасывается вызывающему коду как раньше.
+    """
+
+    def __init__(self, limits: Mapping[str, RpcLimitSettings], max_queue_wait: float) -> None:
+        self._max_queue_wait = max_queue_wait
+        self._families: dict[str, _FamilyState] = {
+            family: _FamilyState(TokenBucket(limit.rate, limit.burst)) for family, limit in limits.items()
+        }
+
+    async def call(self, family: RpcFamily, func: Callable[P, Awaitable[T]], *args: P.args, **kwargs: P.kwargs) -> T:
+        """Вызывает func(*args, **kwargs) в рамках бюджета семейства, повторяя после коротких FloodWait."""
+        while True:
+            await self.acquire(family)
+            try:
+                return await func(*args, **kwargs)
+            except FloodWaitError as e:
+                self.pause(family, e.seconds)
+                if e.seconds > self._max_queue_wait:
+                    raise
+                logger.warning(f"FloodWait {e.seconds} с для запросов «{family}» — повторим после паузы")
+
+    async def acquire(self, family: RpcFamily) -> None:
+        state = self._state(family)
+        state.waiting += 1
+        reserved = acquired = False
+        try:
+            while True:
+                now = time.monotonic()
+                paused_for = state.paused_until - now
+                if paused_for > 0:
+                    if paused_for > self._max_queue_wait:
+                        raise FloodWaitError(request=None, capture=math.ceil(paused_for))
+                    await asyncio.sleep(paused_for)
+                    continue
+                if reserved:
+                    break
+
+                # Токен резервируется один раз: если, пока ждали его, семейство получило FloodWait,
+                # после паузы идём с уже зарезервированным токеном
+                reserved = True
+                if delay := state.bucket.reserve(now):
+                    await asyncio.sleep(delay)
+            acquired = True
+        finally:
+            state.waiting -= 1
+            if reserved and not acquired:
+                state.bucket.refund()
+        state.calls += 1
+
+    def pause(self, family: RpcFamily, seconds: float) -> None:
+        state = self._state(family)
+        state.paused_until = max(state.paused_until, time.monotonic() + seconds)
+        state.flood_waits += 1
+
+    def budgets(self) -> dict[str, RpcBudget]:
+        """Текущее состояние бюджетов по семействам запросов."""
+        now = time.monotonic()
+        return {
+            family: RpcBudget(
+                rate=state.bucket.rate,
+                capacity=state.bucket.capacity,
+                tokens=state.bucket.tokens(now),
+                paused_for=max(0.0, state.paused_until - now),
+                waiting=state.waiting,
+                calls=state.calls,
+                flood_waits=state.flood_waits,
+            )
+            for family, state in self._families.items()
+        }
+
+    def _state(self, family: str) -> _FamilyState:
+        return self._families.get(family) or self._families["other"]
+
+
+rpc = RpcGovernor(limits=se.worker.rpc_limits, max_queue_wait=se.worker.rpc_max_queue_wait)
@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import math
+import time
+from collections import deque
+from collections.abc import Iterable
+from typing import Final
+
+import msgpack
+from bot.db.func import RedisStorage
+from bot.db.models import UserAnalyzed
+from bot.settings import se
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+SEEN_FILTER_SNAPSHOT_KEY: Final[str] = "seen_usernames:snapshot"
+WARM_BATCH_SIZE: Final[int] = 10_000
+
+
+class BloomFilter:
+    """Компактный фильтр Блума: «точно нет» или «возможно есть»."""
+
+    __slots__ = ("size", "hashes", "_bits")
+
+    def __init__(self, size: int, hashes: int, bits: bytes | None = None) -> None:
+        self.size = size
+        self.hashes = hashes
+        self._bits = bytearray(bits) if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> "BloomFilter":
+        capacity = max(1, capacity)
+        size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        hashes = max(1, round(size / capacity * math.log(2)))
+        return cls(size, hashes)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._bits)
+
+
+class SeenUsernameFilter:
+    """
+    Фильтр уже встречавшихся usernames из users_analyzed.
+
+    Прогревается при старте (из снимка в Redis и догрузкой новых строк по id),
+    пополняется при каждой вставке своего аккаунта. Вставки других аккаунтов
+    подтягивает refresh() по расписанию: догрузка строк с id больше водяной отметки —
+    запрос по первичному ключу, и на горячем пути его нет.
+
+    Аккаунты пишут параллельно, и строка с меньшим auto-increment id может закоммититься
+    позже строки с большим. Поэтому догрузка читает от отметки, какой она была lookback
+    секунд назад: строка, закоммиченная не позже lookback после выдачи id, не теряется.
+    Повторное добавление в фильтр ничего не меняет.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, lookback: float = 0.0) -> None:
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._lookback = max(0.0, lookback)
+        self._bloom = BloomFilter.for_capacity(capacity, error_rate)
+        self._watermark = 0
+        # (время догрузки, отметка после неё) за последние lookback секунд, от старых к новым
+        self._marks: deque[tuple[float, int]] = deque([(-math.inf, 0)])
+        self.ready = False
+
+    @staticmethod
+    def _normalize(username: str) -> str:
+        return username.lower()
+
+    def add(self, username: str) -> None:
+        self._bloom.add(self._normalize(username))
+
+    def might_contain(self, username: str) -> bool:
+        return self._normalize(username) in self._bloom
+
+    def split(self, usernames: Iterable[str]) -> tuple[set[str], set[str]]:
+        """Делит usernames на «возможно есть в БД» и «точно новые» без обращения к базе."""
+        possible = {username for username in usernames if self.might_contain(username)}
+        return possible, {username for username in usernames if username not in possible}
+
+    async def refresh(self, session: AsyncSession, now: float | None = None) -> int:
+        """Догружает в фильтр строки users_analyzed, появившиеся после отметки lookback секунд назад."""
+        now = now if now is not None else time.monotonic()
+        # Самая свежая отметка не новее now - lookback; более старые уже не понадобятся
+        while len(self._marks) > 1 and self._marks[1][0] <= now - self._lookback:
+            self._marks.popleft()
+        since = self._marks[0][1]
+
+        loaded = 0
+        result = await session.stream(
+            select(UserAnalyzed.id, UserAnalyzed.username)
+            .where(UserAnalyzed.id > since)
+            .order_by(UserAnalyzed.id.asc())
+            .execution_options(yield_per=WARM_BATCH_SIZE)
+        )
+        async for row_id, username in result:
+            if username:
+                self.add(username)
+            self._watermark = max(self._watermark, row_id)
+            loaded += 1
+        self._marks.append((now, self._watermark))
+        return loaded
+
+    async def warm(self, session: AsyncSession, redis_storage: RedisStorage | None = None) -> None:
+        started = time.perf_counter()
+        if redis_storage is not None and se.worker.seen_filter_persist:
+            await self._load_snapshot(redis_storage)
+        loaded = await self.refresh(session)
+        # Дальше окно отсчитывается от прогрева, иначе каждая догрузка в первые lookback секунд
+        # перечитывала бы всю таблицу
+        self._marks = deque([self._marks[-1]])
+        self.ready = True
+        logger.info(
+            "Фильтр usernames прогрет: +%s строк, водяная отметка id=%s, %.2f с",
+            loaded,
+            self._watermark,
+            time.perf_counter() - started,
+        )
+
+    async def persist(self, redis_storage: RedisStorage) -> None:
+        if not self.ready or not se.worker.seen_filter_persist:
+            return
+        snapshot = msgpack.packb(
+            {
+                "capacity": self._capacity,
+                "error_rate": self._error_rate,
+                "size": self._bloom.size,
+                "hashes": self._bloom.hashes,
+                "watermark": self._watermark,
+                "bits": self._bloom.to_bytes(),
+            }
+        )
+        await redis_storage.set_shared_raw(SEEN_FILTER_SNAPSHOT_KEY, snapshot)
+        logger.debug("Снимок фильтра usernames сохранён (водяная отметка id=%s)", self._watermark)
+
+    async def _load_snapshot(self, redis_storage: RedisStorage) -> None:
+        try:
+            raw = await redis_storage.get_shared_raw(SEEN_FILTER_SNAPSHOT_KEY)
+            if not raw:
+                return
+            snapshot = msgpack.unpackb(raw)
+        except Exception as exc:
+            logger.warning("Не удалось прочитать снимок фильтра usernames: %s", exc)
+            return
+
+        if snapshot.get("capacity") != self._capacity or snapshot.get("error_rate") != self._error_rate:
+            logger.info("Параметры снимка фильтра usernames изменились — прогреваем с нуля")
+            return
+
+        self._bloom = BloomFilter(snapshot["size"], snapshot["hashes"], snapshot["bits"])
+        self._watermark = int(snapshot["watermark"])
+        self._marks = deque([(-math.inf, self._watermark)])
+
+
+seen_usernames = SeenUsernameFilter(
+    capacity=se.worker.seen_filter_capacity,
+    error_rate=se.worker.seen_filter_error_rate,
+    # Догрузка идёт по расписанию, поэтому окно — задержка коммита плюс интервал догрузки
+    lookback=se.worker.seen_filter_commit_lag + se.worker.seen_filter_refresh_interval,
+)
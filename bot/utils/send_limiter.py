@@ -0,0 +1,102 @@
+import logging
+import uuid
+from dataclasses import dataclass
+from typing import Final
+
+from bot.db.func import RedisStorage
+from redis.commands.core import AsyncScript
+
+logger = logging.getLogger(__name__)
+SEND_WINDOW_KEY: Final[str] = "send_message:window"
+
+# Скользящее окно на ZSET: элемент — одна зарезервированная отправка, score — время резервирования.
+# Время берётся у Redis (TIME), поэтому несколько процессов с одним лимитом не зависят от своих часов.
+# Возвращает {allowed, count, remaining, reset_ms}; reset_ms — через сколько освободится самый старый слот.
+SLIDING_WINDOW_SCRIPT: Final[str] = """
+local key = KEYS[1]
+local op = ARGV[1]
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local member = ARGV[4]
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+
+local allowed = 0
+if op == 'reserve' then
+    if redis.call('ZCARD', key) < limit then
+        redis.call('ZADD', key, now, member)
+        allowed = 1
+    end
+elseif op == 'release' then
+    allowed = redis.call('ZREM', key, member)
+end
+
+local count = redis.call('ZCARD', key)
+local reset = 0
+if count > 0 then
+    redis.call('PEXPIRE', key, window)
+    local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+    reset = math.max(0, tonumber(oldest[2]) + window - now)
+else
+    redis.call('DEL', key)
+end
+return {allowed, count, math.max(0, limit - count), reset}
+"""
+
+
+@dataclass(frozen=True)
+class SendQuota:
+    allowed: bool
+    count: int
+    remaining: int
+    reset_seconds: float
+    token: str | None = None
+
+
+class SlidingWindowLimiter:
+    """
+    Лимит отправок за скользящее окно, общий для всех процессов аккаунта.
+
+    Резервирование, возврат слота и чтение остатка — один атомарный Lua-скрипт,
+    то есть один round trip к Redis на операцию.
+    """
+
+    def __init__(self, key: str, window_seconds: int) -> None:
+        self._key = key
+        self._window_ms = window_seconds * 1000
+        self._script: AsyncScript | None = None
+
+    async def reserve(self, redis_storage: RedisStorage, limit: int) -> SendQuota:
+        """Резервирует слот; токен из результата нужен, чтобы вернуть слот при неудачной отправке."""
+        token = uuid.uuid4().hex
+        quota = await self._run(redis_storage, "reserve", limit, token)
+        if not quota.allowed:
+            return quota
+        return SendQuota(quota.allowed, quota.count, quota.remaining, quota.reset_seconds, token)
+
+    async def release(self, redis_storage: RedisStorage, quota: SendQuota, limit: int) -> SendQuota:
+        if quota.token is None:
+            return quota
+        return await self._run(redis_storage, "release", limit, quota.token)
+
+    async def status(self, redis_storage: RedisStorage, limit: int) -> SendQuota:
+        return await self._run(redis_storage, "status", limit)
+
+    async def _run(self, redis_storage: RedisStorage, op: str, limit: int, member: str = "") -> SendQuota:
+        if self._script is None:
+            self._script = redis_storage.register_script(SLIDING_WINDOW_SCRIPT)
+        allowed, count, remaining, reset_ms = await self._script(
+            keys=[redis_storage.build_key(self._key)],
+            args=[op, self._window_ms, limit, member],
+        )
+        return SendQuota(
+            allowed=bool(allowed),
+            count=int(count),
+            remaining=int(remaining),
+            reset_seconds=int(reset_ms) / 1000,
+        )
+
+
+send_limiter = SlidingWindowLimiter(SEND_WINDOW_KEY, window_seconds=60)
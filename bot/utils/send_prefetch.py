@@ -0,0 +1,162 @@
+import asyncio
+import contextlib
+import logging
+from typing import Any
+
+from bot.db.func import RedisStorage
+from bot.db.models import UserAnalyzed
+from bot.settings import se
+from bot.utils.func import Function, Status
+from bot.utils.send_queue import SendQueue, SendRecipient, send_queue
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from telethon.hints import Entity
+
+logger = logging.getLogger(__name__)
+# Временные ошибки: получатель не виноват, просто откладываем разрешение до следующего круга
+TRANSIENT_STATUSES = frozenset({"FloodWaitError", "ConnectionError", "DialogsRefreshSkipped"})
+
+
+class RecipientPrefetcher:
+    """
+    Заранее разрешает username ближайших ahead получателей из очереди отправки.
+
+    Разрешённые сущности держатся в памяти до отправки, поэтому в слоте отправки
+    остаётся только сам send RPC. Неразрешимые получатели убираются из окна ещё
+    до того, как займут слот лимита; исчерпавшие попытки удаляются из базы одним DELETE.
+    """
+
+    def __init__(self, queue: SendQueue, ahead: int, idle_refresh: float) -> None:
+        self._queue = queue
+        self._ahead = max(1, ahead)
+        self._idle_refresh = idle_refresh
+        # Status хранится для получателей, которых успели выдать на отправку, пока шло разрешение
+        self._resolved: dict[int, Entity | Status] = {}
+        self._resolving: dict[int, asyncio.Future[None]] = {}
+        self._client: Any = None
+        self._sessionmaker: async_sessionmaker[AsyncSession] | None = None
+        self._redis_storage: RedisStorage | None = None
+        self._task: asyncio.Task[None] | None = None
+        self.culled = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(
+        self,
+        client: Any,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        redis_storage: RedisStorage,
+    ) -> None:
+        self._client = client
+        self._sessionmaker = sessionmaker
+        self._redis_storage = redis_storage
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def pop(self, recipient: SendRecipient) -> Entity | Status | None:
+        """
+        Результат заранее выполненного разрешения; None — разрешать придётся в момент отправки.
+
+        Если получателя разрешают прямо сейчас, ждём этот результат, а не запускаем второй
+        ResolveUsername — иначе неудача засчиталась бы в лимит попыток дважды.
+        """
+        pending = self._resolving.get(recipient.id)
+        if pending is not None:
+            await asyncio.shield(pending)
+        return self._resolved.pop(recipient.id, None)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        self._resolved.clear()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._prefetch()
+            except Exception as exc:
+                logger.exception("Не удалось заранее разрешить получателей: %s", exc)
+            await self._queue.wait_changed(self._idle_refresh)
+
+    async def _prefetch(self) -> None:
+        # Получатели, ушедшие из очереди мимо отправки, кэш не раздувают
+        known_ids = self._queue.known_ids()
+        for recipient_id in self._resolved.keys() - known_ids:
+            del self._resolved[recipient_id]
+
+        culled: list[SendRecipient] = []
+        drop_ids: list[int] = []
+        try:
+            for recipient in self._queue.peek(self._ahead):
+                # Пока разрешали предыдущих, отправка могла забрать этого получателя сама
+                if recipient.id in self._resolved or not self._queue.is_queued(recipient.id):
+                    continue
+                if not await self._prefetch_one(recipient, culled, drop_ids):
+                    break
+        finally:
+            if culled:
+                self._queue.cull(*culled)
+                self.culled += len(culled)
+                logger.info("Из очереди отправки убрано %s неразрешимых получателей", len(culled))
+            if drop_ids:
+                await self._delete(drop_ids)
+
+    async def _prefetch_one(
+        self,
+        recipient: SendRecipient,
+        culled: list[SendRecipient],
+        drop_ids: list[int],
+    ) -> bool:
+        """Разрешает одного получателя; False — ошибка временная, круг стоит прервать."""
+        # pop() ждёт этот future, поэтому он завершается только после записи результата
+        pending = asyncio.get_running_loop().create_future()
+        self._resolving[recipient.id] = pending
+        try:
+            entity = await Function.safe_get_entity(
+                self._client,
+                recipient.username,
+                redis_storage=self._redis_storage,
+                session=None,
+                target="user",
+            )
+            if isinstance(entity, list):
+                entity = entity[0] if entity else None
+            if isinstance(entity, Status):
+                if entity.message in TRANSIENT_STATUSES:
+                    logger.debug("Разрешение получателей отложено: %s", entity.message)
+                    return False
+                if not self._queue.is_queued(recipient.id):
+                    # Уже выдан на отправку — отдадим ей готовую ошибку вместо повторного разрешения
+                    self._resolved[recipient.id] = entity
+                culled.append(recipient)
+                if entity.data.get("attempts_exhausted"):
+                    drop_ids.append(recipient.id)
+                return True
+            if entity is None or not hasattr(entity, "id"):
+                culled.append(recipient)
+                return True
+            self._resolved[recipient.id] = entity
+            return True
+        finally:
+            del self._resolving[recipient.id]
+            pending.set_result(None)
+
+    async def _delete(self, ids: list[int]) -> None:
+        if self._sessionmaker is None:
+            return
+        async with self._sessionmaker() as session:
+            await session.execute(delete(UserAnalyzed).where(UserAnalyzed.id.in_(ids)))
+            await session.commit()
+        logger.info(f"Удалено {len(ids)} получателей после 3 неудачных попыток разрешения: {ids}")
+
+
+send_prefetcher = RecipientPrefetcher(
+    send_queue,
+    ahead=se.worker.send_prefetch_ahead,
+    idle_refresh=se.worker.send_queue_idle_refresh,
+)
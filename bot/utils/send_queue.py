@@ -0,0 +1,219 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any
+
+from bot.db.models import UserAnalyzed
+from bot.settings import se
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class SendRecipient:
+    """Всё, что нужно для отправки, без привязки к ORM-сессии."""
+
+    id: int
+    username: str
+    message_id: str
+    chat_id: str
+    additional_message: str
+
+    @classmethod
+    def from_row(cls, row: Any) -> "SendRecipient":
+        return cls(
+            id=row.id,
+            username=row.username,
+            message_id=row.message_id,
+            chat_id=row.chat_id,
+            additional_message=row.additional_message,
+        )
+
+
+class SendQueue:
+    """
+    Окно ближайших получателей в памяти вместо запроса к users_analyzed на каждом тике.
+
+    Когда в окне остаётся low_water получателей или меньше, фоновая задача дочитывает
+    его до window. Новых принятых пользователей можно подтолкнуть через notify();
+    если очередь пуста, база всё равно перечитывается раз в idle_refresh секунд —
+    пользователей могут принять из другого процесса.
+    """
+
+    def __init__(self, window: int, low_water: int, idle_refresh: float) -> None:
+        self._window = max(1, window)
+        self._low_water = min(max(0, low_water), self._window - 1)
+        self._idle_refresh = idle_refresh
+        self._items: deque[SendRecipient] = deque()
+        # Выданы на отправку, но результат ещё не зафиксирован в базе
+        self._in_flight: set[int] = set()
+        self._wakeup = asyncio.Event()
+        # Окно пополнилось — сигнал для предварительного разрешения получателей
+        self._changed = asyncio.Event()
+        # В окне есть кого отправлять — будит планировщик отправки вместо опроса
+        self._ready = asyncio.Event()
+        self._sessionmaker: async_sessionmaker[AsyncSession] | None = None
+        self._bot_id: int | None = None
+        self._task: asyncio.Task[None] | None = None
+        self.refills = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def start(self, sessionmaker: async_sessionmaker[AsyncSession], bot_id: int) -> None:
+        self._sessionmaker = sessionmaker
+        self._bot_id = bot_id
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    def notify(self) -> None:
+        """Появился новый принятый пользователь — перечитать очередь, не дожидаясь idle_refresh."""
+        self._wakeup.set()
+
+    def peek(self, limit: int) -> list[SendRecipient]:
+        """Ближайшие limit получателей без выдачи на отправку."""
+        return list(itertools.islice(self._items, limit))
+
+    def is_queued(self, recipient_id: int) -> bool:
+        """Получатель ещё в окне и не выдан на отправку."""
+        return any(recipient.id == recipient_id for recipient in self._items)
+
+    def known_ids(self) -> set[int]:
+        """Получатели в окне и выданные на отправку."""
+        return self._in_flight | {recipient.id for recipient in self._items}
+
+    def cull(self, *recipients: SendRecipient) -> None:
+        """Убирает получателей из окна, не отправляя им; в базе они остаются как есть."""
+        ids = {recipient.id for recipient in recipients}
+        self._items = deque(recipient for recipient in self._items if recipient.id not in ids)
+        if len(self._items) <= self._low_water:
+            self._wakeup.set()
+        if not self._items:
+            self._ready.clear()
+
+    async def wait_ready(self, timeout: float) -> bool:
+        """Ждёт, пока в окне появится получатель; False — истёк timeout."""
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        return bool(self._items)
+
+    async def wait_changed(self, timeout: float) -> None:
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+        self._changed.clear()
+
+    def take(self, limit: int) -> list[SendRecipient]:
+        """Выдаёт до limit получателей; после отправки каждого нужно вызвать done()."""
+        taken: list[SendRecipient] = []
+        while self._items and len(taken) < limit:
+            recipient = self._items.popleft()
+            self._in_flight.add(recipient.id)
+            taken.append(recipient)
+        if len(self._items) <= self._low_water:
+            self._wakeup.set()
+        if not self._items:
+            self._ready.clear()
+        return taken
+
+    def done(self, *recipients: SendRecipient) -> None:
+        """
+        Снимает получателей с учёта после коммита результата. Неотправленные
+        остаются в базе с sended=0 и вернутся в окно при следующем дочитывании.
+        """
+        for recipient in recipients:
+            self._in_flight.discard(recipient.id)
+
+    async def is_pending(self, recipient: SendRecipient) -> bool:
+        """
+        Перепроверяет получателя по базе перед отправкой одним запросом по первичному ключу.
+
+        При малом users_per_minute получатель может ждать в окне много минут, и за это
+        время менеджер-бот мог его удалить или снять accepted.
+        """
+        if self._sessionmaker is None or self._bot_id is None:
+            return True
+        stmt = select(UserAnalyzed.id).where(UserAnalyzed.id == recipient.id, self._pending_clause())
+        async with self._sessionmaker() as session:
+            return await session.scalar(stmt) is not None
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._idle_refresh)
+            self._wakeup.clear()
+            if len(self._items) > self._low_water:
+                continue
+            try:
+                await self._refill()
+            except Exception as exc:
+                logger.exception("Не удалось дочитать очередь отправки: %s", exc)
+
+    async def _refill(self) -> None:
+        if self._sessionmaker is None or self._bot_id is None:
+            return
+        missing = self._window - len(self._items)
+        if missing <= 0:
+            return
+
+        known_ids = self.known_ids()
+        stmt = (
+            select(
+                UserAnalyzed.id,
+                UserAnalyzed.username,
+                UserAnalyzed.message_id,
+                UserAnalyzed.chat_id,
+                UserAnalyzed.additional_message,
+            )
+            .where(self._pending_clause())
+            .order_by(UserAnalyzed.id.asc())
+            .limit(missing)
+        )
+        if known_ids:
+            stmt = stmt.where(UserAnalyzed.id.not_in(known_ids))
+
+        async with self._sessionmaker() as session:
+            rows = (await session.execute(stmt)).all()
+
+        # Пока шёл запрос, окно могли разобрать или уже выдать часть этих строк
+        known_ids = self.known_ids()
+        added = 0
+        for row in rows:
+            if row.id not in known_ids:
+                self._items.append(SendRecipient.from_row(row))
+                added += 1
+        self.refills += 1
+        if added:
+            self._changed.set()
+            self._ready.set()
+            logger.debug("Очередь отправки дочитана: +%s, в окне %s", added, len(self._items))
+
+    def _pending_clause(self) -> Any:
+        return and_(
+            UserAnalyzed.accepted.is_(True),
+            UserAnalyzed.sended.is_(False),
+            UserAnalyzed.bot_id == self._bot_id,
+        )
+
+
+send_queue = SendQueue(
+    window=se.worker.send_queue_window,
+    low_water=se.worker.send_queue_low_water,
+    idle_refresh=se.worker.send_queue_idle_refresh,
+)
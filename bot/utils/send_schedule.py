@@ -0,0 +1,45 @@
+import random
+import time
+from typing import Final
+
+SECONDS_PER_MINUTE: Final[int] = 60
+MAX_JITTER: Final[float] = 0.5  # больше половины шага — и соседние отправки могли бы поменяться местами
+
+
+class SendPacer:
+    """
+    Точные моменты отправок по leaky bucket.
+
+    Шаг сетки — 60 / users_per_minute секунд, к каждому моменту добавляется джиттер
+    не больше ±jitter шага. Джиттер не накапливается: сетка идёт от номинальных моментов,
+    поэтому средняя скорость равна users_per_minute. После простоя сетка начинается
+    заново — пропущенные слоты не догоняются пачкой.
+    """
+
+    def __init__(self, jitter: float) -> None:
+        self._jitter = min(max(0.0, jitter), MAX_JITTER)
+        self._last_nominal: float | None = None
+        self._offset = 0.0
+
+    def delay(self, users_per_minute: int, now: float | None = None) -> float:
+        """Сколько секунд ждать до следующей отправки; 0 — можно отправлять сейчас."""
+        if self._last_nominal is None:
+            return 0.0
+        now = now if now is not None else time.monotonic()
+        interval = self._interval(users_per_minute)
+        return max(0.0, self._last_nominal + interval * (1 + self._offset) - now)
+
+    def record(self, users_per_minute: int, now: float | None = None) -> float:
+        """Учитывает отправку и возвращает задержку до следующей."""
+        now = now if now is not None else time.monotonic()
+        interval = self._interval(users_per_minute)
+        nominal = self._last_nominal + interval if self._last_nominal is not None else now
+        if nominal < now - interval:
+            nominal = now
+        self._last_nominal = nominal
+        self._offset = random.uniform(-self._jitter, self._jitter)
+        return self.delay(users_per_minute, now)
+
+    @staticmethod
+    def _interval(users_per_minute: int) -> float:
+        return SECONDS_PER_MINUTE / max(1, users_per_minute)
@@ -0,0 +1,229 @@
+import asyncio
+import contextlib
+import logging
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Final, cast
+
+import msgpack
+from bot.db.models import UserAnalyzed
+from bot.settings import se
+from bot.utils.seen_filter import seen_usernames
+from bot.utils.send_queue import send_queue
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+MAX_ROW_ATTEMPTS: Final[int] = 5
+
+
+@dataclass
+class WriterStats:
+    rows_flushed: int = 0
+    flushes: int = 0
+    failed_flushes: int = 0
+    last_flush_seconds: float = 0.0
+    total_flush_seconds: float = 0.0
+    dropped_rows: int = 0
+
+
+class UserAnalyzedWriter:
+    """
+    Буфер записи UserAnalyzed: копит строки и вставляет их одним multi-row INSERT,
+    когда набралось max_rows строк или прошло max_delay_ms с первой строки в буфере.
+    """
+
+    def __init__(self, max_rows: int, max_delay_ms: int) -> None:
+        self._max_rows = max(1, max_rows)
+        self._max_delay = max(0, max_delay_ms) / 1000
+        self._rows: list[dict[str, Any]] = []
+        self._pending: set[str] = set()
+        self._attempts: dict[str, int] = {}
+        self._has_rows = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._sessionmaker: async_sessionmaker[AsyncSession] | None = None
+        self._bot_id: int | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._stats = WriterStats()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def stats(self) -> WriterStats:
+        return replace(self._stats)
+
+    def start(self, sessionmaker: async_sessionmaker[AsyncSession], bot_id: int) -> None:
+        self._sessionmaker = sessionmaker
+        self._bot_id = bot_id
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    def is_pending(self, username: str) -> bool:
+        return username.lower() in self._pending
+
+    async def add(
+        self,
+        *,
+        username: str,
+        message_id: int,
+        chat_id: int,
+        message: str,
+        data_for_decision: dict[str, Any] | None,
+    ) -> bool:
+        """Ставит пользователя в буфер. Возвращает False, если он уже ждёт записи."""
+        if self.is_pending(username):
+            return False
+
+        self._rows.append(
+            {
+                "username": username,
+                "message_id": message_id,
+                "chat_id": chat_id,
+                "additional_message": message,
+                "bot_id": self._bot_id,
+                "sended": False,
+                "accepted": not data_for_decision,
+                "decision": cast(int, msgpack.packb(data_for_decision)) if data_for_decision else None,
+            }
+        )
+        self._pending.add(username.lower())
+        seen_usernames.add(username)
+        self._has_rows.set()
+
+        if len(self._rows) >= self._max_rows:
+            await self.flush()
+        return True
+
+    async def flush(self) -> int:
+        async with self._lock:
+            if not self._rows:
+                self._has_rows.clear()
+                return 0
+            if self._sessionmaker is None:
+                logger.warning("Буфер записи пользователей не запущен — строки остаются в памяти")
+                return 0
+
+            rows, self._rows = self._rows, []
+            written: list[dict[str, Any]] = []
+            rejected: list[dict[str, Any]] = []
+            started = time.perf_counter()
+            try:
+                await self._insert_rows(self._sessionmaker, rows, written, rejected)
+            except Exception as exc:
+                self._stats.failed_flushes += 1
+                logger.exception("Не удалось записать %s пользователей: %s", len(rows), exc)
+                self._retry_later(_unprocessed(rows, written, rejected))
+            except BaseException:
+                # Отмена посреди вставки: незаписанные строки возвращаем в буфер
+                self._rows[:0] = _unprocessed(rows, written, rejected)
+                raise
+            finally:
+                self._forget(written)
+                self._forget(rejected)
+
+            elapsed = time.perf_counter() - started
+            self._stats.dropped_rows += len(rejected)
+            if any(row["accepted"] for row in written):
+                send_queue.notify()
+            if not self._rows:
+                self._has_rows.clear()
+            if not written:
+                return 0
+
+            self._stats.rows_flushed += len(written)
+            self._stats.flushes += 1
+            self._stats.last_flush_seconds = elapsed
+            self._stats.total_flush_seconds += elapsed
+            logger.debug("Записано %s пользователей за %.3f с", len(written), elapsed)
+            return len(written)
+
+    async def _insert_rows(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        rows: list[dict[str, Any]],
+        written: list[dict[str, Any]],
+        rejected: list[dict[str, Any]],
+    ) -> None:
+        """
+        Вставляет строки одним INSERT. Если БД отвергла данные (например, слишком длинный текст),
+        пачка делится пополам, пока плохие строки не останутся по одной — их отбрасываем.
+        Прочие ошибки (БД недоступна) пробрасываются: делить пачку тогда бессмысленно.
+        """
+        try:
+            async with sessionmaker() as session:
+                await session.execute(insert(UserAnalyzed).values(rows))
+                await session.commit()
+        except (DataError, IntegrityError) as exc:
+            if len(rows) == 1:
+                rejected.extend(rows)
+                logger.error("БД отвергла пользователя %s, строка отброшена: %s", rows[0]["username"], exc)
+                return
+            middle = len(rows) // 2
+            await self._insert_rows(sessionmaker, rows[:middle], written, rejected)
+            await self._insert_rows(sessionmaker, rows[middle:], written, rejected)
+            return
+        written.extend(rows)
+
+    def _retry_later(self, rows: list[dict[str, Any]]) -> None:
+        # Возвращаем строки в начало буфера, но не дольше MAX_ROW_ATTEMPTS неудачных вставок
+        kept: list[dict[str, Any]] = []
+        for row in rows:
+            key = row["username"].lower()
+            attempts = self._attempts.get(key, 0) + 1
+            if attempts >= MAX_ROW_ATTEMPTS:
+                logger.error("Пользователь %s не записан после %s попыток и отброшен", row["username"], attempts)
+                self._forget([row])
+                self._stats.dropped_rows += 1
+                continue
+            self._attempts[key] = attempts
+            kept.append(row)
+        self._rows[:0] = kept
+
+    def _forget(self, rows: list[dict[str, Any]]) -> None:
+        for row in rows:
+            key = row["username"].lower()
+            self._pending.discard(key)
+            self._attempts.pop(key, None)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+        logger.info(
+            "Буфер записи пользователей остановлен: записано %s строк за %s вставок (%.3f с)",
+            self._stats.rows_flushed,
+            self._stats.flushes,
+            self._stats.total_flush_seconds,
+        )
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_rows.wait()
+            await asyncio.sleep(self._max_delay)
+            # shield: close() отменяет цикл, но начатая вставка должна довестись до конца,
+            # иначе строки, уже снятые с буфера, потеряются
+            flushed = await asyncio.shield(self.flush())
+            if not flushed and self._rows:
+                # БД недоступна — не долбим её в цикле без паузы
+                await asyncio.sleep(max(self._max_delay, 1.0))
+
+
+def _unprocessed(
+    rows: list[dict[str, Any]],
+    written: list[dict[str, Any]],
+    rejected: list[dict[str, Any]],
+) -> list[dict[str, Any]]:
+    processed = {id(row) for row in (*written, *rejected)}
+    return [row for row in rows if id(row) not in processed]
+
+
+user_writer = UserAnalyzedWriter(
+    max_rows=se.worker.user_writer_max_rows,
+    max_delay_ms=se.worker.user_writer_max_delay_ms,
+)
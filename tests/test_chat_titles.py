@@ -0,0 +1,75 @@
+import unittest
+from unittest import mock
+
+from bot.db.models import MonitoringChat
+from bot.utils import func
+from bot.utils.func import Function
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from telethon.tl.types import Channel, ChannelForbidden, ChatPhotoEmpty, InputChannel
+from telethon.tl.types.messages import Chats
+
+
+# Помеченные id каналов (-100…) и их «голые» id
+OPEN_CHAT, CLOSED_CHAT = "-1001000000001", "-1001000000002"
+OPEN_ID, CLOSED_ID = 1000000001, 1000000002
+
+
+def _channel(channel_id: int, title: str) -> Channel:
+    return Channel(id=channel_id, title=title, photo=ChatPhotoEmpty(), date=None, access_hash=1)
+
+
+class UpdateChatTitleTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.engine: AsyncEngine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(MonitoringChat.metadata.create_all, tables=[MonitoringChat.__table__])
+            await conn.execute(
+                insert(MonitoringChat),
+                [{"id": 1, "bot_id": 7, "chat_id": OPEN_CHAT}, {"id": 2, "bot_id": 7, "chat_id": CLOSED_CHAT}],
+            )
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.counter = mock.Mock(incr=mock.AsyncMock(return_value=1), reset=mock.AsyncMock())
+
+        async def input_channel(_client: object, chat_id: str, _redis_storage: object) -> InputChannel:
+            return InputChannel(channel_id=-int(chat_id) - 1_000_000_000_000, access_hash=1)
+
+        for patcher in (
+            mock.patch.object(Function, "_get_cached_input_channel", side_effect=input_channel),
+            mock.patch.object(func.entity_cache, "put", mock.AsyncMock()),
+            mock.patch.dict(func.entity_attempts, {"monitoring_chat": self.counter}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self) -> None:
+        await self.engine.dispose()
+
+    async def _update(self, rpc_call: mock.AsyncMock) -> dict[str, str | None]:
+        with mock.patch.object(func.rpc, "call", rpc_call):
+            async with self.sessionmaker() as session:
+                await Function.update_chat_title(mock.Mock(), session, 7, redis_storage=mock.Mock())
+                await session.commit()
+        async with self.sessionmaker() as session:
+            rows = (await session.execute(select(MonitoringChat.chat_id, MonitoringChat.title))).all()
+        return {row.chat_id: row.title for row in rows}
+
+    async def test_forbidden_channel_counts_an_attempt(self) -> None:
+        closed = ChannelForbidden(id=CLOSED_ID, access_hash=1, title="Закрытый")
+        chats = Chats(chats=[_channel(OPEN_ID, "Первый"), closed])
+
+        titles = await self._update(mock.AsyncMock(return_value=chats))
+
+        self.assertEqual(titles, {OPEN_CHAT: "Первый", CLOSED_CHAT: None})
+        self.counter.incr.assert_awaited_once_with(mock.ANY, int(CLOSED_CHAT))
+        self.counter.reset.assert_awaited_once_with(mock.ANY, int(OPEN_CHAT))
+
+    async def test_failed_batch_is_not_counted(self) -> None:
+        titles = await self._update(mock.AsyncMock(side_effect=ConnectionError("reset")))
+
+        self.assertEqual(titles, {OPEN_CHAT: None, CLOSED_CHAT: None})
+        self.counter.incr.assert_not_awaited()
+
+
+if __name__ == "__main__":
+    unittest.main()
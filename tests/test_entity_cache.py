@@ -0,0 +1,54 @@
+import unittest
+from unittest import mock
+
+from bot.utils import func
+from bot.utils.entity_cache import EntityCache
+from bot.utils.func import Function, Status
+from telethon.tl.types import User
+
+
+class EntityCacheMemoryTest(unittest.IsolatedAsyncioTestCase):
+    async def test_memory_is_a_bounded_lru(self) -> None:
+        cache = EntityCache(ttl=3600, missing_ttl=60, memory_size=2)
+        # По числовому id сущность ложится одним ключом
+        await cache.put(None, 1, User(id=1, access_hash=11))
+        await cache.put(None, 2, User(id=2, access_hash=22))
+
+        # Обращение освежает запись: вытеснится вторая, а не первая
+        self.assertIsNotNone(await cache.get(None, 1))
+        await cache.put(None, 3, User(id=3, access_hash=33))
+
+        self.assertIsNotNone(await cache.get(None, 1))
+        self.assertIsNone(await cache.get(None, 2))
+        self.assertIsNotNone(await cache.get(None, 3))
+        self.assertEqual(len(cache._memory), 2)
+
+    async def test_min_entities_are_not_cached(self) -> None:
+        cache = EntityCache(ttl=3600, missing_ttl=60, memory_size=10)
+        await cache.put(None, "min_user", User(id=1, access_hash=11, min=True))
+
+        self.assertIsNone(await cache.get(None, "min_user"))
+
+
+class NegativeCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def test_cached_miss_does_not_count_an_attempt(self) -> None:
+        client = mock.Mock()
+        counter = mock.Mock(incr=mock.AsyncMock(), reset=mock.AsyncMock())
+        with (
+            mock.patch.object(func.entity_cache, "get", mock.AsyncMock(return_value=None)),
+            mock.patch.object(func.entity_cache, "is_missing", mock.AsyncMock(return_value=True)),
+            mock.patch.dict(func.entity_attempts, {"user": counter}),
+        ):
+            for _ in range(5):
+                result = await Function.safe_get_entity(client, "@gone_user", redis_storage=mock.Mock(), target="user")
+                self.assertIsInstance(result, Status)
+                assert isinstance(result, Status)
+                self.assertEqual(result.message, "UserNotFound")
+                self.assertFalse(result.data.get("attempts_exhausted"))
+
+        counter.incr.assert_not_awaited()
+        client.get_entity.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
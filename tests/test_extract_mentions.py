@@ -0,0 +1,123 @@
+import unittest
+from unittest import mock
+
+from bot.utils import func
+from bot.utils.entity_cache import CachedEntity
+from bot.utils.func import Function
+from telethon.helpers import add_surrogate
+from telethon.tl.types import (
+    Message,
+    MessageEntityBold,
+    MessageEntityMention,
+    MessageEntityMentionName,
+    MessageEntityTextUrl,
+    MessageEntityUrl,
+    PeerChannel,
+    User,
+)
+
+
+def _message(text: str, entities: list[object] | None = None) -> Message:
+    return Message(id=1, peer_id=PeerChannel(1), date=None, message=text, entities=entities)
+
+
+def _span(text: str, part: str) -> tuple[int, int]:
+    # Смещения сущностей Telegram считаются в UTF-16
+    offset = len(add_surrogate(text[: text.index(part)]))
+    return offset, len(add_surrogate(part))
+
+
+class ExtractMentionsTest(unittest.IsolatedAsyncioTestCase):
+    async def test_uses_entities_in_order(self) -> None:
+        text = "🔥 пишите @first_user или t.me/second_user"
+        message = _message(
+            text,
+            [
+                MessageEntityMention(*_span(text, "@first_user")),
+                MessageEntityUrl(*_span(text, "t.me/second_user")),
+            ],
+        )
+
+        self.assertEqual(await Function.extract_mentions(message), ["first_user", "second_user"])
+
+    async def test_text_url_and_mention_by_id(self) -> None:
+        text = "Анна и контакт"
+        message = _message(
+            text,
+            [
+                MessageEntityMentionName(*_span(text, "Анна"), user_id=42),
+                MessageEntityTextUrl(*_span(text, "контакт"), url="https://t.me/contact_me"),
+            ],
+        )
+
+        self.assertEqual(await Function.extract_mentions(message, {42: "anna_k"}), ["anna_k", "contact_me"])
+        # Без карты users упоминание по id разрешить нечем
+        self.assertEqual(await Function.extract_mentions(message), ["contact_me"])
+
+    async def test_ignores_other_entities_and_text_outside_them(self) -> None:
+        text = "@bold_user и @real_user"
+        message = _message(
+            text,
+            [
+                MessageEntityBold(*_span(text, "@bold_user")),
+                MessageEntityMention(*_span(text, "@real_user")),
+            ],
+        )
+
+        self.assertEqual(await Function.extract_mentions(message), ["real_user"])
+
+    async def test_falls_back_to_regex_without_entities(self) -> None:
+        message = _message("@Some_User, @some_user и https://t.me/other_user")
+
+        self.assertEqual(await Function.extract_mentions(message), ["Some_User", "other_user"])
+
+    async def test_skips_invalid_usernames(self) -> None:
+        text = "@abc"
+        message = _message(text, [MessageEntityMention(*_span(text, "@abc"))])
+
+        self.assertEqual(await Function.extract_mentions(message), [])
+
+    async def test_empty_message(self) -> None:
+        self.assertEqual(await Function.extract_mentions(_message("")), [])
+
+
+class UsernamesByIdTest(unittest.TestCase):
+    def test_keeps_only_users_with_username(self) -> None:
+        users = [User(id=1, username="with_name"), User(id=2), object()]
+
+        self.assertEqual(Function.usernames_by_id(users), {1: "with_name"})
+
+
+class MentionedUsernamesTest(unittest.IsolatedAsyncioTestCase):
+    async def test_resolves_only_uncached_mention_ids(self) -> None:
+        text = "Анна, Борис и @plain"
+        message = _message(
+            text,
+            [
+                MessageEntityMentionName(*_span(text, "Анна"), user_id=1),
+                MessageEntityMentionName(*_span(text, "Борис"), user_id=2),
+                MessageEntityMention(*_span(text, "@plain")),
+            ],
+        )
+        cached = {1: CachedEntity(id=1, access_hash=11, type="user", username="anna_k")}
+        resolve_users = mock.AsyncMock(return_value={2: User(id=2, username="boris_b")})
+
+        with (
+            mock.patch.object(func.entity_cache, "get", mock.AsyncMock(side_effect=lambda _, key: cached.get(key))),
+            mock.patch.object(Function, "resolve_users", resolve_users),
+        ):
+            users = await Function.mentioned_usernames(mock.Mock(), message)
+
+        self.assertEqual(users, {1: "anna_k", 2: "boris_b"})
+        self.assertEqual(resolve_users.await_args.args[1], [2])
+
+    async def test_no_requests_without_mentions_by_id(self) -> None:
+        resolve_users = mock.AsyncMock()
+        with mock.patch.object(Function, "resolve_users", resolve_users):
+            self.assertEqual(await Function.mentioned_usernames(mock.Mock(), _message("@plain_user")), {})
+
+        resolve_users.assert_not_awaited()
+
+
+if __name__ == "__main__":
+    unittest.main()
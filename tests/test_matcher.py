@@ -0,0 +1,57 @@
+import unittest
+
+from bot.utils.matcher import KeywordMatcher, get_keyword_matcher
+
+
+class KeywordMatcherTest(unittest.TestCase):
+    def test_finds_triggers_and_ignores_in_one_pass(self) -> None:
+        matcher = KeywordMatcher(["квартира", "ремонт"], ["продам"])
+
+        result = matcher.match("Продам квартиру после ремонта")
+
+        self.assertTrue(result.has_trigger)
+        self.assertEqual(sorted(result.found_triggers), ["ремонт"])
+        self.assertEqual(result.found_ignores, ["продам"])
+
+    def test_matches_substrings_like_plain_in(self) -> None:
+        matcher = KeywordMatcher(["he", "she", "his", "hers"], [])
+
+        result = matcher.match("ushers")
+
+        # Пересекающиеся слова находятся через fail-переходы автомата
+        self.assertEqual(sorted(result.found_triggers), ["he", "hers", "she"])
+
+    def test_is_case_insensitive_and_ignores_newlines(self) -> None:
+        matcher = KeywordMatcher(["Нужен Дизайнер"], [])
+
+        self.assertTrue(matcher.match("НУЖЕН\nдизайнер").has_trigger)
+
+    def test_word_in_both_sets_is_trigger_and_ignore(self) -> None:
+        matcher = KeywordMatcher(["срочно"], ["срочно"])
+
+        result = matcher.match("срочно")
+
+        self.assertEqual(result.found_triggers, ["срочно"])
+        self.assertEqual(result.found_ignores, ["срочно"])
+
+    def test_empty_word_matches_any_text(self) -> None:
+        matcher = KeywordMatcher([""], [])
+
+        self.assertTrue(matcher.match("что угодно").has_trigger)
+
+    def test_no_match(self) -> None:
+        result = KeywordMatcher(["ремонт"], ["продам"]).match("привет")
+
+        self.assertFalse(result.has_trigger)
+        self.assertEqual(result.found_triggers, [])
+        self.assertEqual(result.found_ignores, [])
+
+    def test_cached_matcher_is_reused_for_same_sets(self) -> None:
+        first = get_keyword_matcher(["a", "b"], ["c"])
+
+        self.assertIs(first, get_keyword_matcher(["b", "a"], ["c"]))
+        self.assertIsNot(first, get_keyword_matcher(["a"], ["c"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
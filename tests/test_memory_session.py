@@ -0,0 +1,86 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from bot.utils.memory_session import CheckpointedMemorySession
+from telethon.crypto import AuthKey
+from telethon.sessions import SQLiteSession
+from telethon.tl.types import InputPeerUser, User
+from telethon.tl.types.updates import State
+
+AUTH_KEY = AuthKey(bytes(range(256)))
+STATE = State(pts=10, qts=0, date=datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC), seq=3, unread_count=0)
+
+
+class CheckpointedMemorySessionTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, "account")
+
+    def _filled_session(self) -> CheckpointedMemorySession:
+        session = CheckpointedMemorySession(self.path)
+        session.set_dc(2, "149.154.167.50", 443)
+        session.auth_key = AUTH_KEY
+        session.process_entities([User(id=1, access_hash=11, username="first")])
+        session.set_update_state(0, STATE)
+        return session
+
+    def test_checkpoint_roundtrip(self) -> None:
+        session = self._filled_session()
+
+        self.assertTrue(session.checkpoint())
+        # Без изменений повторное сохранение файл не трогает
+        self.assertFalse(session.checkpoint())
+
+        restored = CheckpointedMemorySession(self.path)
+        self.assertEqual(restored.filename, self.path + ".session")
+        self.assertEqual((restored.dc_id, restored.server_address, restored.port), (2, "149.154.167.50", 443))
+        self.assertEqual(restored.auth_key, AUTH_KEY)
+        self.assertEqual(restored.get_input_entity(1), InputPeerUser(1, 11))
+        self.assertEqual(restored.get_input_entity("first"), InputPeerUser(1, 11))
+        self.assertEqual(restored.get_update_state(0), STATE)
+        self.assertFalse(restored.dirty)
+
+    def test_new_access_hash_replaces_the_old_one(self) -> None:
+        session = self._filled_session()
+        session.checkpoint()
+
+        session.process_entities([User(id=1, access_hash=11, username="first")])
+        self.assertFalse(session.dirty)
+        session.process_entities([User(id=1, access_hash=22, username="first")])
+        self.assertTrue(session.dirty)
+        session.checkpoint()
+
+        restored = CheckpointedMemorySession(self.path)
+        self.assertEqual(restored.get_input_entity(1), InputPeerUser(1, 22))
+
+    def test_loads_a_plain_sqlite_session(self) -> None:
+        source = SQLiteSession(self.path)
+        source.set_dc(4, "149.154.167.91", 443)
+        source.auth_key = AUTH_KEY
+        source.process_entities([User(id=5, access_hash=55, username="legacy")])
+        source.save()
+        source.close()
+
+        session = CheckpointedMemorySession(self.path)
+
+        self.assertEqual(session.dc_id, 4)
+        self.assertEqual(session.auth_key, AUTH_KEY)
+        self.assertEqual(session.get_input_entity("legacy"), InputPeerUser(5, 55))
+
+    async def test_async_checkpoint_replaces_file_atomically(self) -> None:
+        session = self._filled_session()
+
+        self.assertTrue(await session.checkpoint_async())
+
+        self.assertFalse(session.dirty)
+        # Временный файл снимка подменил файл сессии и не остался рядом
+        self.assertEqual(sorted(os.listdir(self.directory)), ["account.session"])
+        self.assertEqual(CheckpointedMemorySession(self.path).get_input_entity(1), InputPeerUser(1, 11))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import time
+import unittest
+import uuid
+
+from bot.db.func import RedisStorage
+from bot.utils.retry_counter import RetryCounter, remove_legacy_counters
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+# Lua-скрипты проверяются только настоящим Redis: без него тесты пропускаются
+REDIS_URL = os.environ.get("TEST_REDIS_URL", "redis://localhost:6379/15")
+
+
+class RedisTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = Redis.from_url(REDIS_URL)
+        try:
+            await self.redis.ping()
+        except (RedisError, OSError) as e:
+            await self.redis.aclose()
+            self.skipTest(f"Redis недоступен ({REDIS_URL}): {e}")
+        # Отдельное пространство ключей на каждый тест
+        self.storage = RedisStorage(self.redis, client_hash=f"test-{uuid.uuid4().hex}")
+
+    async def asyncTearDown(self) -> None:
+        await self.storage.unlink_matching("*")
+        await self.redis.aclose()
+
+
+class RetryCounterTest(RedisTestCase):
+    async def test_counts_each_field_separately(self) -> None:
+        counter = RetryCounter("attempts:test", ttl_seconds=3600)
+
+        self.assertEqual(await counter.incr(self.storage, 1), 1)
+        self.assertEqual(await counter.incr(self.storage, 1), 2)
+        self.assertEqual(await counter.incr(self.storage, "@other"), 1)
+        self.assertEqual(await counter.incr(self.storage, 1), 3)
+
+        key = self.storage.build_key("attempts:test")
+        count, updated_at = (await self.redis.hget(key, "1")).decode().split(":")
+        self.assertEqual(count, "3")
+        self.assertAlmostEqual(int(updated_at), time.time(), delta=5)
+        self.assertGreater(await self.redis.ttl(key), 0)
+
+    async def test_stale_field_starts_over(self) -> None:
+        counter = RetryCounter("attempts:test", ttl_seconds=3600)
+        key = self.storage.build_key("attempts:test")
+        # Последняя неудача была давно — старый счёт не учитывается
+        await self.redis.hset(key, "1", f"2:{int(time.time()) - 7200}")
+
+        self.assertEqual(await counter.incr(self.storage, 1), 1)
+
+    async def test_reset_deletes_fields_and_prunes_stale_ones(self) -> None:
+        counter = RetryCounter("attempts:test", ttl_seconds=3600)
+        key = self.storage.build_key("attempts:test")
+        await counter.incr(self.storage, 1)
+        await counter.incr(self.storage, 2)
+        await counter.incr(self.storage, 3)
+        await self.redis.hset(key, mapping={"stale": f"1:{int(time.time()) - 7200}", "garbage": "1"})
+
+        await counter.reset(self.storage, 1, 2)
+
+        self.assertEqual(await self.redis.hkeys(key), [b"3"])
+        # Сброс после сброса — ничего не ломается
+        await counter.reset(self.storage, 3)
+        self.assertFalse(await self.redis.exists(key))
+
+
+class LegacyCountersTest(RedisTestCase):
+    async def test_removes_only_legacy_string_counters(self) -> None:
+        for key in ("send_message:user:1", "safe_get_entity:user:@someone", "safe_get_entity:monitoring_chat:-100"):
+            await self.storage.set(key, 2)
+        await self.storage.set("send_message:window", 1)
+        await RetryCounter("attempts:send_message", ttl_seconds=3600).incr(self.storage, 1)
+
+        self.assertEqual(await remove_legacy_counters(self.storage), 3)
+
+        self.assertIsNotNone(await self.storage.get("send_message:window"))
+        self.assertTrue(await self.redis.exists(self.storage.build_key("attempts:send_message")))
+        self.assertEqual(await remove_legacy_counters(self.storage), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
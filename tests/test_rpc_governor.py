@@ -0,0 +1,140 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from bot.settings import RpcLimitSettings
+from bot.utils import func
+from bot.utils.func import Function
+from bot.utils.rpc_governor import RpcGovernor, TokenBucket
+from bot.utils.send_queue import SendRecipient
+from telethon.errors import FloodWaitError
+from telethon.tl.types import User
+
+
+def _governor(rate: float = 1000, burst: int = 10, max_queue_wait: float = 60) -> RpcGovernor:
+    families = ("send", "forward", "other")
+    limits = {family: RpcLimitSettings(f"TEST_RPC_{family.upper()}_", rate, burst) for family in families}
+    return RpcGovernor(limits, max_queue_wait=max_queue_wait)
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_is_free_then_waits_are_queued(self) -> None:
+        bucket = TokenBucket(rate=2, capacity=2)
+        now = bucket._updated_at
+
+        self.assertEqual(bucket.reserve(now), 0.0)
+        self.assertEqual(bucket.reserve(now), 0.0)
+        # Каждый следующий ждёт своей очереди: 0.5 с, 1 с, ...
+        self.assertEqual(bucket.reserve(now), 0.5)
+        self.assertEqual(bucket.reserve(now), 1.0)
+
+    def test_refills_up_to_capacity(self) -> None:
+        bucket = TokenBucket(rate=1, capacity=3)
+        now = bucket._updated_at
+        for _ in range(3):
+            bucket.reserve(now)
+
+        self.assertEqual(bucket.tokens(now + 2), 2)
+        self.assertEqual(bucket.tokens(now + 100), 3)
+
+    def test_refund_returns_the_reserved_token(self) -> None:
+        bucket = TokenBucket(rate=1, capacity=1)
+        now = bucket._updated_at
+        bucket.reserve(now)
+
+        bucket.refund()
+
+        self.assertEqual(bucket.reserve(now), 0.0)
+
+
+class RpcGovernorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_retries_after_short_flood_wait(self) -> None:
+        governor = _governor()
+        calls = 0
+
+        async def flaky() -> str:
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise FloodWaitError(request=None, capture=0)
+            return "ok"
+
+        self.assertEqual(await governor.call("send", flaky), "ok")
+        self.assertEqual(calls, 2)
+        budget = governor.budgets()["send"]
+        self.assertEqual(budget.flood_waits, 1)
+        self.assertEqual(budget.calls, 2)
+
+    async def test_long_flood_wait_is_raised_to_caller(self) -> None:
+        governor = _governor(max_queue_wait=5)
+
+        async def flood() -> None:
+            raise FloodWaitError(request=None, capture=30)
+
+        with self.assertRaises(FloodWaitError):
+            await governor.call("send", flood)
+        # Пока семейство на паузе, следующие вызовы сразу получают FloodWaitError
+        with self.assertRaises(FloodWaitError):
+            await governor.acquire("send")
+        # Другие семейства пауза не трогает
+        await governor.acquire("other")
+
+    async def test_pause_delays_only_its_family(self) -> None:
+        governor = _governor()
+        governor.pause("send", 0.05)
+        loop = asyncio.get_running_loop()
+
+        started = loop.time()
+        await governor.acquire("other")
+        self.assertLess(loop.time() - started, 0.05)
+        await governor.acquire("send")
+        self.assertGreaterEqual(loop.time() - started, 0.04)
+
+    async def test_unknown_family_uses_other(self) -> None:
+        governor = _governor()
+
+        await governor.acquire("resolve")
+
+        self.assertEqual(governor.budgets()["other"].calls, 1)
+
+    async def test_cancelled_wait_refunds_its_token(self) -> None:
+        governor = _governor(rate=1, burst=1)
+        await governor.acquire("send")
+
+        waiter = asyncio.create_task(governor.acquire("send"))
+        await asyncio.sleep(0)
+        self.assertEqual(governor.budgets()["send"].waiting, 1)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+
+        budget = governor.budgets()["send"]
+        self.assertEqual(budget.waiting, 0)
+        self.assertEqual(budget.calls, 1)
+        # Отменённый вызов токен не съел: ведро вернулось к нулю, а не ушло в минус
+        self.assertGreater(budget.tokens, -0.5)
+
+
+class SendMessageTwoTest(unittest.IsolatedAsyncioTestCase):
+    async def test_long_flood_wait_on_forward_keeps_the_send(self) -> None:
+        client = mock.Mock()
+        client.send_message = mock.AsyncMock()
+        client.forward_messages = mock.AsyncMock(side_effect=FloodWaitError(request=None, capture=600))
+        user = SendRecipient(id=1, username="@someone", message_id="7", chat_id="-1001", additional_message="")
+
+        with (
+            mock.patch.object(func, "rpc", _governor(max_queue_wait=30)),
+            mock.patch.object(func.random, "choices", return_value=[Function.send_message_two]),
+            self.assertLogs(func.logger, "WARNING"),
+        ):
+            result = await Function.send_message_random(
+                client, user, "привет", session=None, redis_storage=None, entity=User(id=5)  # type: ignore[arg-type]
+            )
+
+        # Текст уже ушёл — повторная попытка отправила бы его второй раз
+        self.assertIs(result, True)
+        client.send_message.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import time
+import unittest
+
+from bot.db.models import UserAnalyzed
+from bot.utils.seen_filter import BloomFilter, SeenUsernameFilter
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_added_items_are_always_found(self) -> None:
+        bloom = BloomFilter.for_capacity(1000, 0.001)
+        items = [f"user_{i}" for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+
+        self.assertTrue(all(item in bloom for item in items))
+
+    def test_false_positive_rate_is_close_to_target(self) -> None:
+        bloom = BloomFilter.for_capacity(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"user_{i}")
+
+        false_positives = sum(f"other_{i}" in bloom for i in range(10_000))
+
+        self.assertLess(false_positives, 300)
+
+    def test_roundtrip_through_bytes(self) -> None:
+        bloom = BloomFilter.for_capacity(100, 0.01)
+        bloom.add("someone")
+
+        restored = BloomFilter(bloom.size, bloom.hashes, bloom.to_bytes())
+
+        self.assertIn("someone", restored)
+
+
+class SeenUsernameFilterTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.engine: AsyncEngine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(UserAnalyzed.metadata.create_all, tables=[UserAnalyzed.__table__])
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def asyncTearDown(self) -> None:
+        await self.engine.dispose()
+
+    async def _insert(self, *rows: tuple[int, str]) -> None:
+        async with self.sessionmaker() as session:
+            await session.execute(
+                insert(UserAnalyzed),
+                [{"id": row_id, "username": username, "additional_message": ""} for row_id, username in rows],
+            )
+            await session.commit()
+
+    async def _warm(self, seen: SeenUsernameFilter) -> None:
+        async with self.sessionmaker() as session:
+            await seen.warm(session)
+
+    async def _refresh(self, seen: SeenUsernameFilter, now: float) -> int:
+        async with self.sessionmaker() as session:
+            return await seen.refresh(session, now=now)
+
+    async def test_split_after_warm(self) -> None:
+        await self._insert((1, "@Known_User"), (2, "@another_one"))
+        seen = SeenUsernameFilter(capacity=1000, error_rate=0.001)
+        await self._warm(seen)
+
+        possible, new = seen.split(["@known_user", "@brand_new"])
+
+        # Сравнение без учёта регистра — как и проверка по базе
+        self.assertEqual(possible, {"@known_user"})
+        self.assertEqual(new, {"@brand_new"})
+
+    async def test_other_accounts_inserts_arrive_with_refresh(self) -> None:
+        seen = SeenUsernameFilter(capacity=1000, error_rate=0.001)
+        await self._warm(seen)
+        # Строку вставил другой аккаунт уже после прогрева: split базу не читает
+        await self._insert((1, "@from_other_account"))
+        self.assertEqual(seen.split(["@from_other_account"]), (set(), {"@from_other_account"}))
+
+        self.assertEqual(await self._refresh(seen, now=time.monotonic()), 1)
+
+        self.assertEqual(seen.split(["@from_other_account"]), ({"@from_other_account"}, set()))
+
+    async def test_refresh_rereads_rows_within_lookback(self) -> None:
+        seen = SeenUsernameFilter(capacity=1000, error_rate=0.001, lookback=60)
+        await self._warm(seen)
+        start = time.monotonic()
+        await self._insert((10, "@latest"))
+        await self._refresh(seen, now=start + 1)
+        # Строка с меньшим id закоммитилась позже строки с большим, но в пределах lookback
+        await self._insert((5, "@late_commit"))
+
+        await self._refresh(seen, now=start + 30)
+
+        self.assertEqual(seen.split(["@late_commit"]), ({"@late_commit"}, set()))
+
+    async def test_refresh_window_moves_forward(self) -> None:
+        seen = SeenUsernameFilter(capacity=1000, error_rate=0.001, lookback=60)
+        await self._warm(seen)
+        start = time.monotonic()
+        await self._insert((10, "@latest"))
+        await self._refresh(seen, now=start + 1)
+
+        # Через lookback после отметки старые строки больше не перечитываются
+        self.assertEqual(await self._refresh(seen, now=start + 30), 1)
+        self.assertEqual(await self._refresh(seen, now=start + 100), 0)
+
+    async def test_add_marks_username_as_seen_without_db(self) -> None:
+        seen = SeenUsernameFilter(capacity=1000, error_rate=0.001)
+        seen.add("@Inserted_Now")
+
+        self.assertTrue(seen.might_contain("@inserted_now"))
+        self.assertFalse(seen.might_contain("@never_seen"))
+
+
+if __name__ == "__main__":
+    unittest.main()
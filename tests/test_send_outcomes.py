@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+
+from bot import background_tasks
+from bot.background_tasks import SendOutcomes, _flush_send_outcomes
+from bot.db.models import UserAnalyzed
+from bot.utils.send_queue import SendQueue, SendRecipient
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+
+def _recipient(recipient_id: int) -> SendRecipient:
+    return SendRecipient(
+        id=recipient_id,
+        username=f"@user_{recipient_id}",
+        message_id="1",
+        chat_id="1",
+        additional_message="",
+    )
+
+
+class FlushSendOutcomesTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.engine: AsyncEngine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(UserAnalyzed.metadata.create_all, tables=[UserAnalyzed.__table__])
+            await conn.execute(
+                insert(UserAnalyzed),
+                [{"id": i, "username": f"@user_{i}", "additional_message": ""} for i in (1, 2)],
+            )
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.queue = SendQueue(window=10, low_water=0, idle_refresh=60)
+        self.queue._items.extend([_recipient(1), _recipient(2)])
+        patcher = mock.patch.object(background_tasks, "send_queue", self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self) -> None:
+        await self.engine.dispose()
+
+    async def test_failed_write_keeps_outcomes_in_flight_until_commit(self) -> None:
+        sent, dropped = self.queue.take(2)
+        outcomes = SendOutcomes(sent=[sent], dropped=[dropped])
+
+        def broken() -> None:
+            raise OperationalError("UPDATE", {}, Exception("connection lost"))
+
+        with self.assertLogs(background_tasks.logger, "ERROR"):
+            await _flush_send_outcomes(mock.Mock(side_effect=broken), None, outcomes)  # type: ignore[arg-type]
+
+        # Не записали — получатели остаются выданными, и очередь не перечитает их с sended=0
+        self.assertEqual(outcomes.sent, [sent])
+        self.assertEqual(outcomes.dropped, [dropped])
+        self.assertEqual(self.queue.known_ids(), {1, 2})
+
+        await _flush_send_outcomes(self.sessionmaker, None, outcomes)  # type: ignore[arg-type]
+
+        self.assertFalse(outcomes)
+        self.assertEqual(self.queue.known_ids(), set())
+        async with self.sessionmaker() as session:
+            rows = (await session.execute(select(UserAnalyzed.id, UserAnalyzed.sended))).all()
+        self.assertEqual([(row.id, row.sended) for row in rows], [(1, True)])
+
+
+if __name__ == "__main__":
+    unittest.main()
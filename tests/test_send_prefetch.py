@@ -0,0 +1,114 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from bot.db.models import UserAnalyzed
+from bot.utils.func import Function, Status
+from bot.utils.send_prefetch import RecipientPrefetcher
+from bot.utils.send_queue import SendQueue, SendRecipient
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from telethon.tl.types import User
+
+
+def _recipient(recipient_id: int) -> SendRecipient:
+    return SendRecipient(
+        id=recipient_id,
+        username=f"@user_{recipient_id}",
+        message_id="1",
+        chat_id="1",
+        additional_message="",
+    )
+
+
+class RecipientPrefetcherTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.engine: AsyncEngine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(UserAnalyzed.metadata.create_all, tables=[UserAnalyzed.__table__])
+            await conn.execute(
+                insert(UserAnalyzed),
+                [{"id": i, "username": f"@user_{i}", "additional_message": ""} for i in range(1, 5)],
+            )
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.queue = SendQueue(window=10, low_water=0, idle_refresh=60)
+        self.queue._items.extend(_recipient(i) for i in range(1, 5))
+        self.prefetcher = RecipientPrefetcher(self.queue, ahead=10, idle_refresh=60)
+        # Без start(): круги разрешения вызываются из теста напрямую
+        self.prefetcher._sessionmaker = self.sessionmaker
+        # Ответы safe_get_entity по username; по умолчанию — разрешённый пользователь
+        self.statuses: dict[str, Status] = {}
+        patcher = mock.patch.object(Function, "safe_get_entity", side_effect=self._resolve)
+        self.safe_get_entity = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self) -> None:
+        await self.engine.dispose()
+
+    async def _resolve(self, _client: object, username: str, **_kwargs: object) -> User | Status:
+        return self.statuses.get(username) or User(id=int(username.rsplit("_", 1)[1]), access_hash=1)
+
+    async def test_resolves_ahead_and_culls_unresolvable(self) -> None:
+        self.statuses["@user_2"] = Status(ok=False, message="UserNotFound")
+        self.statuses["@user_3"] = Status(ok=False, message="UserNotFound", data={"attempts_exhausted": True})
+
+        await self.prefetcher._prefetch()
+
+        self.assertEqual([recipient.id for recipient in self.queue.peek(10)], [1, 4])
+        self.assertEqual(self.prefetcher.culled, 2)
+        entity = await self.prefetcher.pop(_recipient(1))
+        self.assertIsInstance(entity, User)
+        # Результат отдаётся один раз
+        self.assertIsNone(await self.prefetcher.pop(_recipient(1)))
+        # Из базы удалён только исчерпавший попытки
+        async with self.sessionmaker() as session:
+            ids = list(await session.scalars(select(UserAnalyzed.id).order_by(UserAnalyzed.id)))
+        self.assertEqual(ids, [1, 2, 4])
+
+    async def test_transient_status_stops_the_pass_without_culling(self) -> None:
+        self.statuses["@user_2"] = Status(ok=False, message="FloodWaitError", data={"time": 30})
+
+        await self.prefetcher._prefetch()
+
+        self.assertEqual(self.safe_get_entity.await_count, 2)
+        self.assertEqual(len(self.queue), 4)
+        self.assertIsNone(await self.prefetcher.pop(_recipient(3)))
+
+    async def test_results_of_recipients_gone_from_queue_are_dropped(self) -> None:
+        await self.prefetcher._prefetch()
+        self.queue.cull(_recipient(1))
+
+        await self.prefetcher._prefetch()
+
+        self.assertIsNone(await self.prefetcher.pop(_recipient(1)))
+        self.assertIsInstance(await self.prefetcher.pop(_recipient(2)), User)
+
+    async def test_pop_waits_for_resolution_in_progress(self) -> None:
+        self.prefetcher._ahead = 1
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow(_client: object, username: str, **_kwargs: object) -> Status:
+            started.set()
+            await release.wait()
+            return Status(ok=False, message="UserNotFound")
+
+        self.safe_get_entity.side_effect = slow
+        prefetch = asyncio.create_task(self.prefetcher._prefetch())
+        await started.wait()
+        # Отправка забрала получателя, пока его ещё разрешают
+        [recipient] = self.queue.take(1)
+        pop = asyncio.create_task(self.prefetcher.pop(recipient))
+        await asyncio.sleep(0)
+        self.assertFalse(pop.done())
+
+        release.set()
+        await prefetch
+
+        # Отправка получает готовую ошибку, а не запускает второе разрешение
+        result = await pop
+        self.assertIsInstance(result, Status)
+        self.assertEqual(self.safe_get_entity.await_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+
+from bot.db.models import UserAnalyzed
+from bot.utils.send_queue import SendQueue
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+BOT_ID = 7
+
+
+class SendQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.engine: AsyncEngine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(UserAnalyzed.metadata.create_all, tables=[UserAnalyzed.__table__])
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.queue = SendQueue(window=3, low_water=1, idle_refresh=60)
+        # Без start(): дочитывание вызывается из теста напрямую, без фоновой задачи
+        self.queue._sessionmaker = self.sessionmaker
+        self.queue._bot_id = BOT_ID
+
+    async def asyncTearDown(self) -> None:
+        await self.queue.close()
+        await self.engine.dispose()
+
+    async def _insert(self, *ids: int, bot_id: int = BOT_ID, accepted: bool = True, sended: bool = False) -> None:
+        async with self.sessionmaker() as session:
+            await session.execute(
+                insert(UserAnalyzed),
+                [
+                    {
+                        "id": i,
+                        "bot_id": bot_id,
+                        "username": f"@user_{i}",
+                        "additional_message": "",
+                        "accepted": accepted,
+                        "sended": sended,
+                    }
+                    for i in ids
+                ],
+            )
+            await session.commit()
+
+    async def _set(self, recipient_id: int, **values: object) -> None:
+        async with self.sessionmaker() as session:
+            await session.execute(update(UserAnalyzed).where(UserAnalyzed.id == recipient_id).values(**values))
+            await session.commit()
+
+    async def test_refill_reads_pending_rows_in_order_up_to_window(self) -> None:
+        await self._insert(5, 1, 4, 2)
+        await self._insert(3, sended=True)
+        await self._insert(6, accepted=False)
+        await self._insert(7, bot_id=BOT_ID + 1)
+
+        await self.queue._refill()
+
+        self.assertEqual([recipient.id for recipient in self.queue.peek(10)], [1, 2, 4])
+        self.assertTrue(await self.queue.wait_ready(timeout=0))
+
+    async def test_taken_recipients_are_not_read_again_until_done(self) -> None:
+        await self._insert(1, 2, 3, 4)
+        await self.queue._refill()
+
+        taken = self.queue.take(2)
+        await self.queue._refill()
+
+        # Выданные не возвращаются в окно, пока отправка не зафиксирована
+        self.assertEqual([recipient.id for recipient in taken], [1, 2])
+        self.assertEqual([recipient.id for recipient in self.queue.peek(10)], [3, 4])
+        self.assertEqual(self.queue.known_ids(), {1, 2, 3, 4})
+
+        # Первому отправили, второй остался с sended=0 и вернётся при дочитывании
+        await self._set(1, sended=True)
+        self.queue.done(*taken)
+        self.queue.take(2)
+        await self.queue._refill()
+
+        self.assertEqual([recipient.id for recipient in self.queue.peek(10)], [2])
+
+    async def test_take_and_cull_wake_refill_at_low_water(self) -> None:
+        await self._insert(1, 2, 3)
+        await self.queue._refill()
+        self.queue._wakeup.clear()
+
+        self.queue.take(1)
+        self.assertFalse(self.queue._wakeup.is_set())
+
+        self.queue.cull(*self.queue.peek(1))
+        self.assertTrue(self.queue._wakeup.is_set())
+        self.assertFalse(self.queue.is_queued(2))
+        self.assertTrue(self.queue.is_queued(3))
+
+    async def test_is_pending_rechecks_the_row(self) -> None:
+        await self._insert(1)
+        await self.queue._refill()
+        [recipient] = self.queue.peek(1)
+
+        self.assertTrue(await self.queue.is_pending(recipient))
+        await self._set(1, accepted=False)
+        self.assertFalse(await self.queue.is_pending(recipient))
+
+    async def test_started_queue_refills_on_notify(self) -> None:
+        self.queue.start(self.sessionmaker, BOT_ID)
+        self.assertFalse(await self.queue.wait_ready(timeout=0.2))
+
+        await self._insert(1)
+        self.queue.notify()
+
+        self.assertTrue(await self.queue.wait_ready(timeout=1))
+        self.assertEqual([recipient.id for recipient in self.queue.take(5)], [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import random
+import unittest
+
+from bot.utils.send_schedule import MAX_JITTER, SendPacer
+
+
+class SendPacerTest(unittest.TestCase):
+    def test_first_send_is_immediate(self) -> None:
+        self.assertEqual(SendPacer(jitter=0).delay(60, now=100.0), 0.0)
+
+    def test_sends_follow_a_fixed_grid(self) -> None:
+        pacer = SendPacer(jitter=0)
+
+        self.assertEqual(pacer.record(30, now=0.0), 2.0)
+        self.assertEqual(pacer.delay(30, now=1.5), 0.5)
+        # Опоздание на 0.5 с не сдвигает сетку: следующий момент — 4.0, а не 4.5
+        self.assertEqual(pacer.record(30, now=2.5), 1.5)
+
+    def test_grid_restarts_after_idle_instead_of_bursting(self) -> None:
+        pacer = SendPacer(jitter=0)
+        pacer.record(60, now=0.0)
+
+        # Пропущенные за простой слоты не догоняются пачкой
+        self.assertEqual(pacer.record(60, now=100.0), 1.0)
+        self.assertEqual(pacer.delay(60, now=100.5), 0.5)
+
+    def test_rate_change_applies_to_the_next_step(self) -> None:
+        pacer = SendPacer(jitter=0)
+        pacer.record(60, now=0.0)
+
+        self.assertEqual(pacer.delay(6, now=0.0), 10.0)
+
+    def test_jitter_is_bounded_and_does_not_accumulate(self) -> None:
+        random.seed(1)
+        self._assert_stays_on_grid(SendPacer(jitter=0.3), jitter=0.3)
+
+    def test_jitter_is_capped(self) -> None:
+        random.seed(2)
+        self._assert_stays_on_grid(SendPacer(jitter=5), jitter=MAX_JITTER)
+
+    def _assert_stays_on_grid(self, pacer: SendPacer, jitter: float) -> None:
+        now = 0.0
+        for step in range(1, 200):
+            delay = pacer.record(60, now=now)
+            self.assertGreaterEqual(delay, 0.0)
+            now += delay
+            # Каждая отправка укладывается в ±jitter шага от номинального момента
+            self.assertAlmostEqual(now, step, delta=jitter + 1e-9)
+
+
+if __name__ == "__main__":
+    unittest.main()
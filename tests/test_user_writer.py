@@ -0,0 +1,123 @@
+import asyncio
+import unittest
+from types import TracebackType
+from unittest import mock
+
+from bot.db.models import UserAnalyzed
+from bot.utils import user_writer as user_writer_module
+from bot.utils.user_writer import MAX_ROW_ATTEMPTS, UserAnalyzedWriter
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+
+class _HangingSessionmaker:
+    """Сессия, которая не открывается: вставка висит, пока её не отменят."""
+
+    def __init__(self) -> None:
+        self.entered = asyncio.Event()
+
+    def __call__(self) -> "_HangingSessionmaker":
+        return self
+
+    async def __aenter__(self) -> None:
+        self.entered.set()
+        await asyncio.Event().wait()
+
+    async def __aexit__(self, *exc_info: type[BaseException] | BaseException | TracebackType | None) -> None:
+        return None
+
+
+class UserAnalyzedWriterTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.engine: AsyncEngine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(UserAnalyzed.metadata.create_all, tables=[UserAnalyzed.__table__])
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        # max_rows с запасом: вставку вызывает тест, а не add()
+        self.writer = UserAnalyzedWriter(max_rows=100, max_delay_ms=0)
+        self.writer._sessionmaker = self.sessionmaker
+        patcher = mock.patch.object(user_writer_module.send_queue, "notify")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self) -> None:
+        await self.engine.dispose()
+
+    async def _add(self, username: str, message: str | None = "текст") -> None:
+        await self.writer.add(
+            username=username,
+            message_id=1,
+            chat_id=1,
+            message=message,  # type: ignore[arg-type]
+            data_for_decision=None,
+        )
+
+    async def _usernames(self) -> list[str]:
+        async with self.sessionmaker() as session:
+            return list(await session.scalars(select(UserAnalyzed.username).order_by(UserAnalyzed.id)))
+
+    async def test_rejected_row_is_isolated_and_the_rest_written(self) -> None:
+        for i in range(5):
+            await self._add(f"@user_{i}")
+        # NOT NULL на additional_message: БД отвергнет только эту строку
+        await self._add("@broken", message=None)
+        await self._add("@user_5")
+
+        with self.assertLogs(user_writer_module.logger, "ERROR"):
+            self.assertEqual(await self.writer.flush(), 6)
+
+        self.assertEqual(await self._usernames(), [f"@user_{i}" for i in range(6)])
+        self.assertEqual(self.writer.stats.dropped_rows, 1)
+        self.assertFalse(self.writer.is_pending("@broken"))
+        self.assertEqual(self.writer._rows, [])
+
+    async def test_pending_username_is_not_buffered_twice(self) -> None:
+        await self._add("@Someone")
+
+        self.assertFalse(
+            await self.writer.add(username="@someone", message_id=2, chat_id=2, message="", data_for_decision=None)
+        )
+        self.assertEqual(len(self.writer._rows), 1)
+
+    async def test_row_is_dropped_after_max_attempts(self) -> None:
+        def unavailable() -> None:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+        self.writer._sessionmaker = mock.Mock(side_effect=unavailable)
+        await self._add("@user")
+
+        with self.assertLogs(user_writer_module.logger, "ERROR"):
+            for _ in range(MAX_ROW_ATTEMPTS - 1):
+                self.assertEqual(await self.writer.flush(), 0)
+                # Строка возвращается в буфер и по-прежнему считается ожидающей
+                self.assertTrue(self.writer.is_pending("@user"))
+            await self.writer.flush()
+
+        self.assertEqual(self.writer._rows, [])
+        self.assertFalse(self.writer.is_pending("@user"))
+        self.assertEqual(self.writer.stats.failed_flushes, MAX_ROW_ATTEMPTS)
+        self.assertEqual(self.writer.stats.dropped_rows, 1)
+
+    async def test_cancelled_flush_puts_rows_back(self) -> None:
+        hanging = _HangingSessionmaker()
+        self.writer._sessionmaker = hanging  # type: ignore[assignment]
+        await self._add("@first")
+        await self._add("@second")
+
+        task = asyncio.create_task(self.writer.flush())
+        await hanging.entered.wait()
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        self.assertEqual([row["username"] for row in self.writer._rows], ["@first", "@second"])
+        self.assertTrue(self.writer.is_pending("@first"))
+
+        self.writer._sessionmaker = self.sessionmaker
+        self.assertEqual(await self.writer.flush(), 2)
+        self.assertEqual(await self._usernames(), ["@first", "@second"])
+
+
+if __name__ == "__main__":
+    unittest.main()